@@ -0,0 +1,17 @@
+"""
+Accès aux outils d'administration du dashboard (profilage à la demande, diagnostics)
+
+Seules les requêtes provenant des adresses de ASTHME_ADMIN_IPS (liste séparée par des virgules) y ont accès.
+L'adresse retenue est celle de la connexion (request.remote_addr) : derrière un proxy, elle doit être
+rétablie par le proxy (ex. werkzeug ProxyFix) et non lue dans un en-tête fourni par le client.
+"""
+import os
+
+from flask import request
+
+ADMIN_IPS = {ip.strip() for ip in os.environ.get("ASTHME_ADMIN_IPS", "127.0.0.1,::1").split(",") if ip.strip()}
+
+
+def is_admin_request():
+    """True si la requête Flask en cours provient d'une adresse d'administration"""
+    return request.remote_addr in ADMIN_IPS
@@ -2,6 +2,11 @@ from dash import Dash
 import dash_bootstrap_components as dbc
 from app.layout import create_layout
 from app.callbacks import register_callbacks, register_callbacks_pol, register_barplot_callbacks
+from app.metrics import init_metrics
+from app.profiling import init_profiling
+from app.recording import init_recording
+from app.memory import init_memory
+from app.tracing import init_tracing
 
 app = Dash(__name__, 
           external_stylesheets=[
@@ -14,6 +19,16 @@ app.layout = create_layout()
 register_callbacks(app)
 register_callbacks_pol(app)
 register_barplot_callbacks(app)
+# Latence des callbacks et route /metrics (après l'enregistrement de tous les callbacks)
+init_metrics(app)
+# Profilage à la demande des callbacks (DASH_PROFILE=1 ou en-tête X-Dash-Profile depuis ASTHME_ADMIN_IPS)
+init_profiling(app)
+# Enregistrement des requêtes de callbacks pour les tests de charge (DASH_RECORD=<fichier.jsonl>)
+init_recording(app)
+# Inventaire mémoire (données, caches, RSS) sur /admin/memory et résumé au démarrage du worker
+init_memory(app)
+# Traces des requêtes de callbacks, étape par étape (DASH_TRACE=stdout ou <fichier.jsonl>)
+init_tracing(app)
 
 server = app.server
 
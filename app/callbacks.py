@@ -7,14 +7,15 @@ import plotly.graph_objects as go
 from app.layout import create_overview, df_long, intervalles_couleurs, mapper_intervalle, geojson_url
 from app.pages.about import create_about
 from app.pages.pollen import create_pollen
-from app.data_loader import load_pollen_data_from_s3
+from app.tracing import span
 from app.components.card_ import df, load_and_prepare_data, color_map
 from app.components.carte_pollen import (
-    load_pollen_data_from_s3, prepare_pollen_data, load_geojson,
+    load_prepared_pollen_data, load_geojson,
     get_city_coordinates, classify_level, format_date_fr
 )
 from app.pages.polluant import (
-    df_daily, df_weekly, df_indices, df_iqa, semaine_to_dates,
+    df_daily, df_weekly, df_indices, df_iqa, df_sites, semaine_to_dates,
+    sites_du_departement, code_du_departement,
     unique_polluants, unites_polluants, color_map, get_polluants_layout
 )
 
@@ -67,45 +68,48 @@ def register_callbacks(app):
         [Input("semaine-dropdown", "value")]
     )
     def update_map(semaine_selectionnee):
-        df_filtered = df_long[df_long["Semaine"] == semaine_selectionnee].copy()
-        df_filtered["Intervalle"] = df_filtered["Passages"].apply(mapper_intervalle)
+        with span("data", dataset="geodes", semaine=semaine_selectionnee) as attrs:
+            df_filtered = df_long[df_long["Semaine"] == semaine_selectionnee].copy()
+            df_filtered["Intervalle"] = df_filtered["Passages"].apply(mapper_intervalle)
+            attrs["rows"] = len(df_filtered)
         couleurs = [couleur for _, _, couleur in intervalles_couleurs]
         intervalle_labels = [
             f"{debut} à {fin}" if fin != float('inf') else "261 et plus"
             for debut, fin, _ in intervalles_couleurs
         ]
-        fig = px.choropleth_mapbox(
-            df_filtered,
-            geojson=geojson_url,
-            locations="Département",
-            featureidkey="properties.nom",
-            color="Intervalle",
-            color_discrete_sequence=couleurs,
-            category_orders={"Intervalle": intervalle_labels},
-            mapbox_style="carto-positron",
-            hover_name="Département",
-            hover_data={"Passages": True, "Département": False},
-            center={"lat": 46.603354, "lon": 2.333333},
-            zoom=5.5,
-            opacity=0.7
-        )
-        fig.update_traces(
-            hovertemplate="<b>%{hovertext}</b><br>Passages pour 10 000 passages : %{customdata[0]}<extra></extra>"
-        )
-        fig.update_layout(
-            mapbox_layers=[
-                {
-                    "below": "traces",
-                    "sourcetype": "geojson",
-                    "source": geojson_url,
-                    "type": "line",
-                    "color": "black",
-                    "opacity": 0.5
-                }
-            ],
-            margin={"r": 0, "t": 30, "l": 0, "b": 0},
-            legend_title_text="Passages pour 10 000 passages"
-        )
+        with span("figure", kind="choropleth_mapbox"):
+            fig = px.choropleth_mapbox(
+                df_filtered,
+                geojson=geojson_url,
+                locations="Département",
+                featureidkey="properties.nom",
+                color="Intervalle",
+                color_discrete_sequence=couleurs,
+                category_orders={"Intervalle": intervalle_labels},
+                mapbox_style="carto-positron",
+                hover_name="Département",
+                hover_data={"Passages": True, "Département": False},
+                center={"lat": 46.603354, "lon": 2.333333},
+                zoom=5.5,
+                opacity=0.7
+            )
+            fig.update_traces(
+                hovertemplate="<b>%{hovertext}</b><br>Passages pour 10 000 passages : %{customdata[0]}<extra></extra>"
+            )
+            fig.update_layout(
+                mapbox_layers=[
+                    {
+                        "below": "traces",
+                        "sourcetype": "geojson",
+                        "source": geojson_url,
+                        "type": "line",
+                        "color": "black",
+                        "opacity": 0.5
+                    }
+                ],
+                margin={"r": 0, "t": 30, "l": 0, "b": 0},
+                legend_title_text="Passages pour 10 000 passages"
+            )
         return fig
 
     # Callback pour mettre à jour l'indice moyen (card)
@@ -194,13 +198,13 @@ def register_callbacks(app):
         trigger_id = ctx.triggered[0]['prop_id'].split('.')[0]
         if trigger_id == 'dropdown-departement-nom':
             if dropdown_nom_value:
-                code = df_daily[df_daily['departement'] == dropdown_nom_value]['code_departement'].iloc[0]
+                code = df_sites[df_sites['departement'] == dropdown_nom_value]['code_departement'].iloc[0]
                 return dropdown_nom_value, code
             else:
                 return None, None
         elif trigger_id == 'dropdown-departement-code':
             if dropdown_code_value:
-                nom = df_daily[df_daily['code_departement'] == dropdown_code_value]['departement'].iloc[0]
+                nom = df_sites[df_sites['code_departement'] == dropdown_code_value]['departement'].iloc[0]
                 return nom, dropdown_code_value
             else:
                 return None, None
@@ -219,7 +223,7 @@ def register_callbacks(app):
     )
     def sync_commune_and_site(departement, commune, site):
         if departement:
-            communes = df_weekly[df_weekly['departement'] == departement]['commune'].unique()
+            communes = df_sites[df_sites['departement'] == departement]['commune'].dropna().unique()
             commune_options = [{'label': c, 'value': c} for c in sorted(communes)]
             if len(communes) >= 2:
                 commune_options.append({'label': 'TOTAL', 'value': 'TOTAL'})
@@ -232,7 +236,7 @@ def register_callbacks(app):
             commune_value = None
 
         if commune and commune != 'TOTAL':
-            sites = df_weekly[df_weekly['commune'] == commune]['nom_site'].unique()
+            sites = df_sites[df_sites['commune'] == commune]['nom_site'].dropna().unique()
             site_options = [{'label': s, 'value': s} for s in sorted(sites)]
             if len(sites) >= 2:
                 site_options.append({'label': 'TOTAL', 'value': 'TOTAL'})
@@ -306,7 +310,7 @@ def register_callbacks(app):
     def update_pollutants(departement, semaine_debut, semaine_fin):
         if not departement:
             return px.line(title="Veuillez sélectionner un département.")
-        df_filtered = df_weekly[df_weekly['departement'] == departement]
+        df_filtered = df_weekly[df_weekly['code_site'].isin(sites_du_departement(departement))]
         df_filtered = df_filtered[(df_filtered['semaine'] >= semaine_debut) &
                                   (df_filtered['semaine'] <= semaine_fin)]
         if df_filtered.empty:
@@ -351,11 +355,11 @@ def register_callbacks(app):
         selected_date = pd.to_datetime(selected_date)
         titre = f"Pic de pollution journalier du {selected_date.strftime('%d/%m/%Y')}"
         df_filtered_day = df_daily[
-            (df_daily['departement'] == departement) &
+            (df_daily['code_site'].isin(sites_du_departement(departement))) &
             (df_daily['date_de_debut'] == selected_date)
         ]
         df_filtered_iqa = df_iqa[
-            (df_iqa['departement'] == departement) &
+            (df_iqa['code_departement'] == code_du_departement(departement)) &
             (df_iqa['date_de_debut'] == selected_date)
         ]
         if df_filtered_day.empty and df_filtered_iqa.empty:
@@ -390,30 +394,38 @@ def register_callbacks_pol(app):
     def update_map_pol(selected_date, selected_pollen):
         if not selected_date or not selected_pollen:
             return {}, "Veuillez sélectionner une date et un type de pollen."
-        df = load_pollen_data_from_s3()
-        df = prepare_pollen_data(df)
-        geojson_data = load_geojson()
-        dff = df[(df["date_str"] == selected_date) & (df["Pollen"] == selected_pollen)]
+        with span("load", dataset="pollen") as attrs:
+            # DataFrame partagé : relu et préparé (span prepare) seulement après une mise à jour des données
+            df = load_prepared_pollen_data()
+            attrs["rows"] = len(df)
+        with span("filter", dataset="pollen", date=selected_date, pollen=selected_pollen) as attrs:
+            dff = df[(df["date_str"] == selected_date) & (df["Pollen"] == selected_pollen)]
+            attrs["rows"] = len(dff)
+        with span("data", dataset="geojson"):
+            geojson_data = load_geojson()
         if dff.empty:
-            fig = px.scatter_mapbox(lat=[46.5], lon=[2.5], zoom=5, height=600)
-            fig.update_layout(
-                mapbox=dict(style="open-street-map"),
-                margin={"r": 0, "t": 50, "l": 0, "b": 0}
-            )
+            with span("figure", kind="scatter_mapbox"):
+                fig = px.scatter_mapbox(lat=[46.5], lon=[2.5], zoom=5, height=600)
+                fig.update_layout(
+                    mapbox=dict(style="open-street-map"),
+                    margin={"r": 0, "t": 50, "l": 0, "b": 0}
+                )
             dt = pd.to_datetime(selected_date, format="%Y/%m/%d")
             return fig, f"Aucune donnée pour {format_date_fr(dt)} et pollen {selected_pollen}."
-        dff_grouped = dff.groupby(["Ville", "Pollen"], as_index=False).agg({"level": "mean"})
-        dff_grouped["Niveaux de risque"] = dff_grouped["level"].apply(classify_level)
-        coords_dict = {}
-        for city, group in dff_grouped.groupby("Ville"):
-            if city not in coords_dict:
-                coords_dict[city] = get_city_coordinates(city, geojson_data)
-            base_lat, base_lon = coords_dict[city] if coords_dict[city][0] else (46.5, 2.5)
-            n = len(group)
-            for idx, (i, row) in enumerate(group.iterrows()):
-                offset = 0.005 * (idx - (n - 1) / 2)
-                dff_grouped.at[i, "lat"] = base_lat + offset
-                dff_grouped.at[i, "lon"] = base_lon + offset
+        with span("data", dataset="coordinates") as attrs:
+            dff_grouped = dff.groupby(["Ville", "Pollen"], as_index=False).agg({"level": "mean"})
+            dff_grouped["Niveaux de risque"] = dff_grouped["level"].apply(classify_level)
+            coords_dict = {}
+            for city, group in dff_grouped.groupby("Ville"):
+                if city not in coords_dict:
+                    coords_dict[city] = get_city_coordinates(city, geojson_data)
+                base_lat, base_lon = coords_dict[city] if coords_dict[city][0] else (46.5, 2.5)
+                n = len(group)
+                for idx, (i, row) in enumerate(group.iterrows()):
+                    offset = 0.005 * (idx - (n - 1) / 2)
+                    dff_grouped.at[i, "lat"] = base_lat + offset
+                    dff_grouped.at[i, "lon"] = base_lon + offset
+            attrs["cities"] = len(coords_dict)
         color_map_local = {
             "nul": "#008000",
             "Risque faible": "#FFFF00",
@@ -421,43 +433,44 @@ def register_callbacks_pol(app):
             "Risque élevé": "#FF0000",
             "non classé": "#CCCCCC"
         }
-        fig = px.scatter_mapbox(
-            dff_grouped,
-            lat="lat",
-            lon="lon",
-            color="Niveaux de risque",
-            color_discrete_map=color_map_local,
-            size_max=15,
-            zoom=5,
-            hover_name="Ville",
-            hover_data={'lat': False, 'lon': False, "Niveaux de risque": False},
-            category_orders={"Niveaux de risque": ["nul", "Risque faible", "Risque modéré", "Risque élevé", "non classé"]}
-        )
-        fig.update_traces(marker=dict(size=20))
-        expected_categories = ["nul", "Risque faible", "Risque modéré", "Risque élevé"]
-        present_categories = dff_grouped["Niveaux de risque"].unique().tolist()
-        for cat in expected_categories:
-            if cat not in present_categories:
-                fig.add_trace(
-                    go.Scattermapbox(
-                        lat=[None],
-                        lon=[None],
-                        mode="markers",
-                        marker=dict(size=20, color=color_map_local[cat]),
-                        name=cat,
-                        showlegend=True,
-                        hoverinfo="none"
+        with span("figure", kind="scatter_mapbox"):
+            fig = px.scatter_mapbox(
+                dff_grouped,
+                lat="lat",
+                lon="lon",
+                color="Niveaux de risque",
+                color_discrete_map=color_map_local,
+                size_max=15,
+                zoom=5,
+                hover_name="Ville",
+                hover_data={'lat': False, 'lon': False, "Niveaux de risque": False},
+                category_orders={"Niveaux de risque": ["nul", "Risque faible", "Risque modéré", "Risque élevé", "non classé"]}
+            )
+            fig.update_traces(marker=dict(size=20))
+            expected_categories = ["nul", "Risque faible", "Risque modéré", "Risque élevé"]
+            present_categories = dff_grouped["Niveaux de risque"].unique().tolist()
+            for cat in expected_categories:
+                if cat not in present_categories:
+                    fig.add_trace(
+                        go.Scattermapbox(
+                            lat=[None],
+                            lon=[None],
+                            mode="markers",
+                            marker=dict(size=20, color=color_map_local[cat]),
+                            name=cat,
+                            showlegend=True,
+                            hoverinfo="none"
+                        )
                     )
-                )
-        first_city = dff_grouped["Ville"].iloc[0]
-        center_lat, center_lon = coords_dict.get(first_city, (46.5, 2.5))
-        fig.update_layout(
-            mapbox=dict(
-                style="open-street-map",
-                center={"lat": center_lat, "lon": center_lon}
-            ),
-            margin={"r": 0, "t": 50, "l": 0, "b": 0}
-        )
+            first_city = dff_grouped["Ville"].iloc[0]
+            center_lat, center_lon = coords_dict.get(first_city, (46.5, 2.5))
+            fig.update_layout(
+                mapbox=dict(
+                    style="open-street-map",
+                    center={"lat": center_lat, "lon": center_lon}
+                ),
+                margin={"r": 0, "t": 50, "l": 0, "b": 0}
+            )
         dt = pd.to_datetime(selected_date, format="%Y/%m/%d")
         info_text = f"Date sélectionnée : {format_date_fr(dt)} | Pollen : {selected_pollen}"
         return fig, info_text
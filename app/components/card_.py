@@ -1,17 +1,13 @@
 import dash_bootstrap_components as dbc
 from dash import dcc, html
 import pandas as pd
-from app.data_loader import load_data_from_s3_excel
-import dash
-from dash.dependencies import Input, Output
-import plotly.express as px
-from io import StringIO
-import boto3
+from app.data_loader import load_geodes_data_from_s3
+from app.components.carte_pollen import load_prepared_pollen_data
 
 # Charger les données et préparer les calculs
 def load_data():
     # Chargement 
-    df = load_data_from_s3_excel()
+    df = load_geodes_data_from_s3()
     
     # Conversion en numérique à partir de la 4ème colonne
     df.iloc[:, 3:] = df.iloc[:, 3:].apply(pd.to_numeric, errors='coerce')
@@ -91,9 +87,6 @@ def create_classement_card(dropdown_options, default_week):
 
 ##### barplot_pollen --------------------------------------------
 
-BUCKET_NAME = "bucket-asthme-scraping"
-POLLEN_FILE_KEY = "pollen.csv"
-
 color_map = {
     "nul": "#008000",
     "Risque faible": "#FFFF00",
@@ -102,29 +95,9 @@ color_map = {
     "non classé": "#CCCCCC"
 }
 
-def load_pollen_data_from_s3():
-    s3 = boto3.client('s3')
-    obj = s3.get_object(Bucket=BUCKET_NAME, Key=POLLEN_FILE_KEY)
-    return pd.read_csv(StringIO(obj['Body'].read().decode('utf-8')))
-
-def classify_level(level):
-    try:
-        lvl = float(level)
-        if lvl <= 0.1: return "nul"
-        elif lvl <= 1.2: return "Risque faible"
-        elif lvl < 3: return "Risque modéré"
-        else: return "Risque élevé"
-    except:
-        return "non classé"
-
 def load_and_prepare_data():
-    df = load_pollen_data_from_s3()
-    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
-    df["date_str"] = df["date"].dt.strftime("%Y/%m/%d")
-    df["Ville"] = df["Ville"].str.title()
-    df = df.sort_values(by="date", ascending=False)
-    df["Niveau"] = df["level"].apply(classify_level)
-    return df
+    # Préparation faite une fois et partagée avec la carte des pollens (voir carte_pollen.prepare_pollen_data)
+    return load_prepared_pollen_data()
 
 def create_barplot_card():
     df = load_and_prepare_data()
@@ -1,28 +1,39 @@
+import json
+import os
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import requests
-import boto3
-from io import StringIO
 from dash import dcc, html
 import dash_bootstrap_components as dbc
+from app.data_loader import load_pollen_data_from_s3
 
-BUCKET_NAME = "bucket-asthme-scraping"
-POLLEN_FILE_KEY = "pollen.csv"
-
-def load_pollen_data_from_s3():
-    s3 = boto3.client('s3')
-    obj = s3.get_object(Bucket=BUCKET_NAME, Key=POLLEN_FILE_KEY)
-    return pd.read_csv(StringIO(obj['Body'].read().decode('utf-8')))
+# Contours des communes : URL ou fichier local (ASTHME_COMMUNES_GEOJSON, ex. pour travailler hors ligne)
+COMMUNES_GEOJSON = os.environ.get(
+    "ASTHME_COMMUNES_GEOJSON", "https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/communes.geojson"
+)
 
 def prepare_pollen_data(df):
+    """
+    Préparation commune à la carte, au graphique en barres et à leurs callbacks : dates, libellés et niveaux de risque
+    - Appliquée une fois par mise à jour des données (voir load_pollen_data_from_s3), le résultat est partagé en lecture seule
+    """
     df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
     df["date_str"] = df["date"].dt.strftime("%Y/%m/%d")
     df["Ville"] = df["Ville"].str.title()
+    df = df.sort_values(by="date", ascending=False)
+    df["Niveau"] = df["level"].apply(classify_level)
     return df
 
+def load_prepared_pollen_data():
+    """Données pollen préparées (DataFrame partagé : à filtrer, sans le modifier)"""
+    return load_pollen_data_from_s3(prepare=prepare_pollen_data)
+
 def load_geojson():
-    geojson_url = "https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/communes.geojson"
+    geojson_url = COMMUNES_GEOJSON
+    if not geojson_url.startswith(("http://", "https://")):
+        with open(geojson_url, encoding="utf-8") as file:
+            return json.load(file)
     response = requests.get(geojson_url)
     return response.json() if response.status_code == 200 else None
 
@@ -71,8 +82,7 @@ def classify_level(level):
         return "non classé"
 
 def create_map_card():
-    df = load_pollen_data_from_s3()
-    df = prepare_pollen_data(df)
+    df = load_prepared_pollen_data()
     unique_dates = sorted(df["date_str"].dropna().unique())
     unique_pollens = sorted(df["Pollen"].dropna().unique())
 
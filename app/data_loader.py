@@ -1,35 +1,194 @@
-import boto3
+import json
+import os
+import threading
+from datetime import datetime, timedelta
 import pandas as pd
 from io import StringIO
 from io import BytesIO
+from app.memory import register_cache
+from app.metrics import track_load
+from app.tracing import span
+# Stockage configuré par ASTHME_STORAGE ("s3" ou "fs:<dossier>"), client partagé avec les scripts de collecte
+from scripts.storage import storage_client
 
 BUCKET_NAME = "bucket-asthme-scraping"
 FILE_KEY = "geodes_complet.xlsx"
 POLLEN_FILE_KEY = "pollen.csv"
+GEODES_PREFIX = "geodes"  # stockage long format des passages aux urgences (instantanés parquet par année)
+GEODES_TIME_COLUMNS = ["Semaine", "Annee", "Mois"]
+GEODAIR_PREFIX = "geodair"  # fichiers Geodair publiés par versions, version courante désignée par geodair/current.json
+
+# Fenêtre (en jours) des historiques journaliers chargés par le dashboard
+DASHBOARD_WINDOW_DAYS = int(os.environ.get("DASHBOARD_WINDOW_DAYS", 400))
+
+# Jeux de données lus plusieurs fois (pages, callbacks) : (version, DataFrame) par clé, la version étant la date
+# de mise à jour du manifeste (voir cached_frame)
+FRAME_CACHE = register_cache("data_loader.frames", {})
+frame_cache_lock = threading.Lock()
+
+
+def cached_frame(key, version, load, shared=False):
+    """
+    DataFrame chargé par load(), réutilisé tant que la version du jeu de données ne change pas
+    - Une copie est renvoyée : les pages et les callbacks modifient leurs données en place
+    - Avec shared, le DataFrame en cache est renvoyé tel quel : il est partagé en lecture seule (ni copie ni modification)
+    - Sans version connue (pas de date de mise à jour), les données sont relues à chaque appel
+    """
+    if version is None:
+        return load()
+    with frame_cache_lock:
+        cached = FRAME_CACHE.get(key)
+    if cached is None or cached[0] != version:
+        cached = (version, load())
+        with frame_cache_lock:
+            FRAME_CACHE[key] = cached
+    return cached[1] if shared else cached[1].copy()
 
 def load_data_from_s3():
-    s3 = boto3.client('s3')
+    s3 = storage_client()
     local_file = "/tmp/geodes_complet.xlsx"
     s3.download_file(BUCKET_NAME, FILE_KEY, local_file)
     df = pd.read_excel(local_file, engine="openpyxl")
     return df
 
 def load_data_csv_from_s3():
-    s3 = boto3.client('s3')
+    s3 = storage_client()
     local_file = "/tmp/pollen.csv"
     s3.download_file(BUCKET_NAME, POLLEN_FILE_KEY, local_file)
     df = pd.read_csv(local_file)
     return df
 
 
-def load_pollen_data_from_s3():
-    """Charge les données pollen depuis S3"""
-    s3 = boto3.client('s3')
-    obj = s3.get_object(Bucket=BUCKET_NAME, Key=POLLEN_FILE_KEY)
-    return pd.read_csv(StringIO(obj['Body'].read().decode('utf-8')))
+def load_pollen_data_from_s3(prepare=None):
+    """
+    Charge les données pollen depuis S3 (partitions mensuelles de la fenêtre du dashboard)
+    - Avec prepare, les données sont préparées une fois par mise à jour du manifeste, et le DataFrame préparé est
+      partagé en lecture seule entre les pages et les callbacks (voir cached_frame)
+    """
+    debut_fenetre = datetime.now() - timedelta(days=DASHBOARD_WINDOW_DAYS)
+    return load_partitioned_from_s3("pollen", start=debut_fenetre, cache=True, prepare=prepare, shared=prepare is not None)
 
 
 def load_data_from_s3_excel():
-    s3 = boto3.client('s3')
-    obj = s3.get_object(Bucket=BUCKET_NAME, Key=FILE_KEY)
-    return pd.read_excel(BytesIO(obj['Body'].read()), engine="openpyxl")
+    s3 = storage_client()
+    with track_load(FILE_KEY) as load:
+        obj = s3.get_object(Bucket=BUCKET_NAME, Key=FILE_KEY)
+        df = pd.read_excel(BytesIO(obj['Body'].read()), engine="openpyxl")
+        load.update(rows=len(df), updated_at=obj.get('LastModified'))
+    return df
+
+
+def load_geodes_data_from_s3(prefix=GEODES_PREFIX):
+    """
+    Charge les taux de passages aux urgences pour asthme au format large (Semaine, Annee, Mois puis un département par colonne)
+    - Lecture des instantanés annuels parquet du stockage long format (voir scripts/geodes_store.py)
+    - À défaut de manifeste, l'ancien fichier geodes_complet.xlsx est chargé
+    """
+    s3 = storage_client()
+    try:
+        obj = s3.get_object(Bucket=BUCKET_NAME, Key=f"{prefix}/manifest.json")
+    except s3.exceptions.NoSuchKey:
+        return load_data_from_s3_excel()
+
+    manifest = json.loads(obj['Body'].read())
+    # Historique relu seulement après une mise à jour : il est chargé par plusieurs pages au démarrage
+    return cached_frame(prefix, manifest.get("updated_at"), lambda: read_geodes(s3, prefix, manifest))
+
+
+def read_geodes(s3, prefix, manifest):
+    """Lit les instantanés annuels listés par le manifeste et les remet au format large"""
+    with track_load(prefix) as load:
+        frames = []
+        for key in sorted(manifest["partitions"]):
+            obj = s3.get_object(Bucket=BUCKET_NAME, Key=f"{prefix}/{manifest['partitions'][key]['file']}")
+            frames.append(pd.read_parquet(BytesIO(obj['Body'].read())))
+        load["updated_at"] = manifest.get("updated_at")
+        if not frames:
+            return pd.DataFrame(columns=GEODES_TIME_COLUMNS)
+        df_long = pd.concat(frames, ignore_index=True)
+        df_long["Département"] = df_long["Département"].astype(str)
+
+        # Retour au format large, dans l'ordre des semaines et des départements de l'historique
+        semaines = df_long.drop_duplicates(subset=GEODES_TIME_COLUMNS)[GEODES_TIME_COLUMNS]
+        df = df_long.set_index(GEODES_TIME_COLUMNS + ["Département"])["Passages"].unstack("Département")
+        departements = manifest.get("departements") or list(df.columns)
+        df = df.reindex(pd.MultiIndex.from_frame(semaines), columns=departements).fillna(0)
+        load["rows"] = len(df)
+    return df.reset_index().rename_axis(columns=None)
+
+def load_current_from_s3(prefix=GEODAIR_PREFIX):
+    """
+    Charge le pointeur de version courante d'un jeu de données publié par versions (voir scripts/publish.py)
+    - "version" identifie exactement les fichiers servis (exécution de la collecte qui les a publiés)
+    - "files" donne la clé versionnée de chaque fichier ; avant la première publication, les clés d'origine sont utilisées
+    """
+    s3 = storage_client()
+    try:
+        obj = s3.get_object(Bucket=BUCKET_NAME, Key=f"{prefix}/current.json")
+    except s3.exceptions.NoSuchKey:
+        return {"version": None, "files": {}}
+    return json.loads(obj['Body'].read())
+
+
+def resolve_key(current, key):
+    """Clé S3 de la version courante d'un fichier (la clé d'origine s'il n'a pas été publié par versions)"""
+    return current.get("files", {}).get(key, key) if current else key
+
+
+def load_partitioned_from_s3(prefix, start=None, end=None, current=None, cache=False, prepare=None, shared=False, **read_csv_kwargs):
+    """
+    Charge depuis S3 les partitions mensuelles d'un historique recouvrant une période
+    - Le manifeste <prefix>/manifest.json liste les partitions disponibles
+    - Avec current (voir load_current_from_s3), manifeste et partitions sont lus dans cette version
+    - Avec cache, les partitions ne sont relues qu'après une mise à jour du manifeste (voir cached_frame)
+    - prepare (fonction DataFrame -> DataFrame) est appliquée après lecture, une fois par mise à jour avec cache
+    - Avec shared (et cache), le DataFrame en cache est renvoyé sans copie et ne doit pas être modifié
+    - Sans partition dans la période, le DataFrame renvoyé est vide mais garde les colonnes de l'historique
+    - À défaut de manifeste, l'ancien fichier unique <prefix>.csv (dans la version current) est chargé en entier
+    """
+    s3 = storage_client()
+    manifest_key = resolve_key(current, f"{prefix}/manifest.json")
+    try:
+        obj = s3.get_object(Bucket=BUCKET_NAME, Key=manifest_key)
+    except s3.exceptions.NoSuchKey:
+        with track_load(prefix) as load:
+            obj = s3.get_object(Bucket=BUCKET_NAME, Key=resolve_key(current, f"{prefix}.csv"))
+            df = pd.read_csv(StringIO(obj['Body'].read().decode('utf-8')), **read_csv_kwargs)
+            load.update(rows=len(df), updated_at=obj.get('LastModified'))
+        return df
+
+    manifest = json.loads(obj['Body'].read())
+    partitions = manifest["partitions"]
+    first = start.strftime("%Y-%m") if start is not None else None
+    last = end.strftime("%Y-%m") if end is not None else None
+    keys = [
+        key for key in sorted(partitions)
+        if (first is None or key >= first) and (last is None or key <= last)
+    ]
+
+    def read():
+        with track_load(prefix) as load:
+            frames = []
+            for key in keys:
+                obj = s3.get_object(Bucket=BUCKET_NAME, Key=resolve_key(current, f"{prefix}/{partitions[key]['file']}"))
+                frames.append(pd.read_csv(StringIO(obj['Body'].read().decode('utf-8')), **read_csv_kwargs))
+            if not frames and partitions:
+                # Aucune partition dans la période : DataFrame vide au schéma de la dernière partition (en-tête seul)
+                latest = partitions[max(partitions)]
+                obj = s3.get_object(Bucket=BUCKET_NAME, Key=resolve_key(current, f"{prefix}/{latest['file']}"))
+                df_empty = pd.read_csv(obj['Body'], nrows=0, **read_csv_kwargs)
+                # Colonnes sans ligne lues en int64 par pandas : objet, comme des colonnes texte vides
+                frames.append(df_empty.astype({col: object for col in df_empty.select_dtypes("number").columns}))
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            load.update(rows=len(df), updated_at=manifest.get("updated_at"))
+        if prepare is None:
+            return df
+        with span("prepare", dataset=prefix, rows=len(df)):
+            return prepare(df)
+
+    if not cache:
+        return read()
+    # Une entrée par historique, préparation et options de lecture : la fenêtre de partitions fait partie de la version
+    version = (manifest["updated_at"], manifest_key, tuple(keys)) if manifest.get("updated_at") else None
+    key = (prefix, prepare and f"{prepare.__module__}.{prepare.__qualname__}", json.dumps(read_csv_kwargs, sort_keys=True, default=str))
+    return cached_frame(key, version, read, shared)
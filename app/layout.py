@@ -3,13 +3,13 @@ from dash import html, dcc
 import dash_bootstrap_components as dbc
 import pandas as pd
 import plotly.express as px
-from app.data_loader import load_data_from_s3_excel
+from app.data_loader import load_geodes_data_from_s3
 from app.components.card_ import create_mean_index_card, create_classement_card
 from app.components.carte_asthme import build_carte_urgences
 
 
 # Chargement et préparation des données
-df = load_data_from_s3_excel()
+df = load_geodes_data_from_s3()
 df_long = df.melt(id_vars=["Semaine", "Annee", "Mois"], var_name="Département", value_name="Passages")
 df_long["Num_semaine_mois"] = df_long.groupby(["Annee", "Mois"]).cumcount() + 1
 semaines_disponibles = sorted(df_long["Semaine"].unique())
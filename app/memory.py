@@ -0,0 +1,198 @@
+"""
+Inventaire mémoire du dashboard : jeux de données chargés, caches et mémoire du processus
+
+- Jeux de données : DataFrame et Series tenus au niveau des modules app.* ou capturés par les callbacks
+  (ex. données pollen de update_barplot), avec leur taille profonde par colonne (memory_usage(deep=True))
+- Caches : fonctions mises en cache par functools (nombre d'entrées) et caches déclarés par register_cache
+- Processus : RSS courant et pic (/proc/self/status)
+- Allocations : top N des lignes de code ayant alloué le plus, si tracemalloc est actif (PYTHONTRACEMALLOC=<profondeur>)
+
+Le rapport est exposé en JSON sur MEMORY_ROUTE, pour les adresses d'administration seulement (voir app/admin.py),
+et résumé en une ligne au démarrage de chaque worker (tailles superficielles : le parcours des chaînes des colonnes
+objet est réservé à MEMORY_ROUTE). Paramètres : ?columns=0 (sans le détail par colonne),
+?top=<N> (allocations tracemalloc).
+"""
+import gc
+import inspect
+import json
+import os
+import sys
+import tracemalloc
+
+import pandas as pd
+from flask import Response, abort, request
+
+from app.admin import is_admin_request
+
+MEMORY_ROUTE = "/admin/memory"
+# Nombre de lignes d'allocations tracemalloc par défaut
+TOP_ALLOCATIONS = 20
+
+# Caches déclarés : nom -> dictionnaire des valeurs en cache
+CACHES = {}
+
+MIB = 1024 * 1024
+
+
+def register_cache(name, cache):
+    """Déclare un cache (dictionnaire) dont la taille est rapportée dans l'inventaire"""
+    CACHES[name] = cache
+    return cache
+
+
+def process_memory():
+    """
+    Mémoire du processus en octets : rss (résidente) et peak_rss (pic depuis le démarrage)
+    """
+    memory = {}
+    try:
+        with open("/proc/self/status", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    memory["rss" if name == "VmRSS" else "peak_rss"] = int(value.split()[0]) * 1024
+    except OSError:
+        import resource
+
+        memory["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return memory
+
+
+def deep_size(obj, seen=None):
+    """
+    Taille profonde approximative d'un objet Python (conteneurs parcourus, objets partagés comptés une fois)
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(obj, pd.DataFrame) else int(usage)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not inspect.isclass(obj) and not inspect.ismodule(obj):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def frame_usage(df, columns=True, deep=True):
+    """
+    Taille d'un DataFrame ou d'une Series, avec le détail par colonne (index compris)
+    Sans deep, les colonnes objet ne comptent que leurs pointeurs (instantané, sans parcourir les chaînes)
+    """
+    usage = df.memory_usage(deep=deep)
+    if isinstance(df, pd.Series):
+        return {"rows": len(df), "bytes": int(usage)}
+    report = {"rows": len(df), "columns": len(df.columns), "bytes": int(usage.sum())}
+    if columns:
+        report["by_column"] = {str(name): int(size) for name, size in usage.sort_values(ascending=False).items()}
+    return report
+
+
+def is_frame(value):
+    # Test sur le type : isinstance déréférencerait les proxys Flask (request...) hors requête
+    return issubclass(type(value), (pd.DataFrame, pd.Series))
+
+
+def loaded_frames(app=None):
+    """
+    DataFrame et Series tenus par les modules app.* et par les fermetures des callbacks, une entrée par objet
+    (nommée d'après le module qui l'a chargée, ex. app.pages.polluant.df_daily, plutôt que ceux qui l'importent)
+    """
+    frames = {}
+    # Ordre d'import : un module qui charge des données est importé avant ceux qui les importent de lui
+    for module_name, module in list(sys.modules.items()):
+        if module_name != "app" and not module_name.startswith("app."):
+            continue
+        for name, value in list(vars(module).items()):
+            if is_frame(value) and id(value) not in frames:
+                frames[id(value)] = (f"{module_name}.{name}", value)
+    if app is not None:
+        for spec in app.callback_map.values():
+            function = inspect.unwrap(spec["callback"])
+            names = function.__code__.co_freevars
+            for name, cell in zip(names, function.__closure__ or ()):
+                value = cell.cell_contents
+                if is_frame(value) and id(value) not in frames:
+                    frames[id(value)] = (f"{function.__module__}.{function.__name__}.{name}", value)
+    return dict(frames.values())
+
+
+def cache_usage(deep=True):
+    """Caches déclarés (entrées, taille profonde avec deep) et fonctions des modules app.* mises en cache par functools"""
+    caches = {name: {"entries": len(cache), **({"bytes": deep_size(cache)} if deep else {})} for name, cache in CACHES.items()}
+    for module_name, module in sorted(sys.modules.items()):
+        if module_name != "app" and not module_name.startswith("app."):
+            continue
+        for name, value in list(vars(module).items()):
+            if hasattr(type(value), "cache_info") and getattr(value, "__module__", None) == module_name:
+                info = value.cache_info()
+                caches.setdefault(f"{module_name}.{name}", {"entries": info.currsize, "hits": info.hits, "misses": info.misses})
+    return caches
+
+
+def top_allocations(limit=TOP_ALLOCATIONS):
+    """Lignes de code ayant alloué le plus de mémoire encore tenue (None si tracemalloc n'est pas actif)"""
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    return [
+        {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size, "blocks": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def memory_report(app=None, columns=True, top=0, deep=True):
+    """
+    Inventaire mémoire complet (voir le docstring du module), tailles en octets
+    Sans deep (résumé de démarrage), ni collecte du ramasse-miettes ni parcours des objets : tailles superficielles
+    """
+    if deep:
+        gc.collect()
+    datasets = {name: frame_usage(df, columns, deep) for name, df in loaded_frames(app).items()}
+    report = {
+        "pid": os.getpid(),
+        "deep": deep,
+        "process": process_memory(),
+        "datasets_bytes": sum(dataset["bytes"] for dataset in datasets.values()),
+        "datasets": dict(sorted(datasets.items(), key=lambda item: -item[1]["bytes"])),
+        "caches": cache_usage(deep),
+    }
+    if top:
+        report["allocations"] = top_allocations(top)
+    return report
+
+
+def summary_line(report, limit=5):
+    """Résumé d'une ligne : RSS, total des jeux de données et les plus volumineux"""
+    largest = ", ".join(
+        f"{name[len('app.'):]} {dataset['bytes'] / MIB:.1f}" for name, dataset in list(report["datasets"].items())[:limit]
+    )
+    rss = report["process"].get("rss", report["process"].get("peak_rss", 0))
+    return (f"Mémoire du worker {report['pid']} : RSS {rss / MIB:.1f} Mio, "
+            f"jeux de données {report['datasets_bytes'] / MIB:.1f} Mio{'' if report['deep'] else ' hors chaînes'} ({largest})")
+
+
+def init_memory(app):
+    """
+    Ajoute la route d'inventaire mémoire (adresses d'administration) et journalise le résumé de démarrage
+    (à appeler une fois toutes les données chargées et les callbacks enregistrés)
+    """
+    def memory_view():
+        if not is_admin_request():
+            abort(403)
+        top = request.args.get("top", type=int, default=TOP_ALLOCATIONS if tracemalloc.is_tracing() else 0)
+        report = memory_report(app, columns=request.args.get("columns", "1") != "0", top=top)
+        # Ordre conservé : jeux de données et colonnes du plus volumineux au plus petit
+        return Response(json.dumps(report, indent=2, ensure_ascii=False), mimetype="application/json")
+
+    if "memory" not in app.server.view_functions:
+        app.server.add_url_rule(MEMORY_ROUTE, "memory", memory_view)
+    print(summary_line(memory_report(app, columns=False, deep=False)))
@@ -0,0 +1,210 @@
+"""
+Métriques du dashboard au format texte Prometheus, exposées sur la route /metrics du serveur Flask
+
+- Callbacks : latence, taille de la réponse JSON, erreurs et mises à jour annulées (PreventUpdate), par sortie
+- Jeux de données : durée et nombre de lignes du dernier chargement, âge de l'instantané chargé
+
+Chaque processus gunicorn tient ses propres compteurs : /metrics décrit le worker qui répond (label worker).
+La route est réservée aux adresses d'administration (voir app/admin.py), comme les autres diagnostics.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, abort
+from dash.exceptions import PreventUpdate
+
+from app.admin import is_admin_request
+
+# Bornes des histogrammes : latence (secondes) et taille des réponses (octets)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{format_labels(key)} {value}" for key, value in items]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{format_labels(key)} {value}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        with self.lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self.values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+callback_latency = Histogram("dash_callback_duration_seconds", "Durée d'exécution des callbacks", ["output"])
+callback_payload = Histogram("dash_callback_response_bytes", "Taille de la réponse JSON des callbacks", ["output"], SIZE_BUCKETS)
+callback_errors = Counter("dash_callback_errors_total", "Callbacks terminés par une exception", ["output", "exception"])
+callback_prevented = Counter("dash_callback_prevented_total", "Callbacks sans mise à jour (PreventUpdate)", ["output"])
+dataset_load_seconds = Gauge("asthme_dataset_load_seconds", "Durée du dernier chargement d'un jeu de données", ["dataset"])
+dataset_rows = Gauge("asthme_dataset_rows", "Nombre de lignes du dernier chargement d'un jeu de données", ["dataset"])
+dataset_loaded_at = Gauge("asthme_dataset_loaded_timestamp_seconds", "Date du dernier chargement d'un jeu de données", ["dataset"])
+dataset_load_errors = Counter("asthme_dataset_load_errors_total", "Chargements de jeux de données en échec", ["dataset"])
+# Date de l'instantané chargé (mise à jour du manifeste ou de l'objet S3), l'âge étant calculé à chaque lecture de /metrics
+dataset_snapshot_at = {}
+dataset_snapshot_lock = threading.Lock()
+
+
+def to_timestamp(value):
+    # Horodatage d'un instantané : datetime (LastModified S3) ou chaîne ISO (updated_at des manifestes)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+@contextmanager
+def track_load(dataset):
+    """
+    Mesure le chargement d'un jeu de données ; le bloc peut renseigner info["rows"] et info["updated_at"]
+    """
+    info = {}
+    start = time.perf_counter()
+    try:
+        yield info
+    except Exception:
+        dataset_load_errors.inc(dataset=dataset)
+        raise
+    dataset_load_seconds.set(round(time.perf_counter() - start, 6), dataset=dataset)
+    dataset_loaded_at.set(round(time.time(), 3), dataset=dataset)
+    if info.get("rows") is not None:
+        dataset_rows.set(int(info["rows"]), dataset=dataset)
+    snapshot = to_timestamp(info.get("updated_at"))
+    if snapshot is not None:
+        with dataset_snapshot_lock:
+            dataset_snapshot_at[dataset] = snapshot
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    now = time.time()
+    with dataset_snapshot_lock:
+        snapshots = list(dataset_snapshot_at.items())
+    lines += [
+        "# HELP asthme_dataset_age_seconds Âge de l'instantané chargé pour chaque jeu de données",
+        "# TYPE asthme_dataset_age_seconds gauge",
+    ] + [f"asthme_dataset_age_seconds{format_labels((('dataset', dataset),))} {round(now - snapshot, 3)}" for dataset, snapshot in snapshots]
+    worker = format_labels((("worker", os.getpid()),))
+    lines += ["# HELP asthme_worker_info Processus ayant produit ces métriques", "# TYPE asthme_worker_info gauge", f"asthme_worker_info{worker} 1"]
+    return "\n".join(lines) + "\n"
+
+
+def instrument_callback(output, callback):
+    @wraps(callback)
+    def timed_callback(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = callback(*args, **kwargs)
+        except PreventUpdate:
+            callback_prevented.inc(output=output)
+            raise
+        except Exception as e:
+            callback_errors.inc(output=output, exception=type(e).__name__)
+            raise
+        finally:
+            callback_latency.observe(time.perf_counter() - start, output=output)
+        # Taille en octets : les libellés et les contours contiennent des caractères non ASCII
+        size = len(response.encode("utf-8")) if isinstance(response, str) else len(response) if isinstance(response, bytes) else 0
+        callback_payload.observe(size, output=output)
+        return response
+    timed_callback.instrumented = True
+    return timed_callback
+
+
+def init_metrics(app):
+    """
+    Instrumente tous les callbacks enregistrés sur l'application et ajoute la route /metrics
+    (à appeler une fois tous les callbacks enregistrés)
+    """
+    for output, spec in app.callback_map.items():
+        if not getattr(spec["callback"], "instrumented", False):
+            spec["callback"] = instrument_callback(output.strip("."), spec["callback"])
+
+    def metrics_view():
+        if not is_admin_request():
+            abort(403)
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    if "metrics" not in app.server.view_functions:
+        app.server.add_url_rule("/metrics", "metrics", metrics_view)
@@ -1,32 +1,46 @@
+import os
 import dash
 from dash import dcc, html
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 from io import StringIO, BytesIO
-import boto3
 import dash_bootstrap_components as dbc
+from app.data_loader import (
+    load_partitioned_from_s3, load_geodes_data_from_s3, load_current_from_s3, resolve_key, storage_client,
+    DASHBOARD_WINDOW_DAYS
+)
+from app.metrics import track_load
 
-def load_data_from_s3_polluant(BUCKET_NAME="bucket-asthme-scraping", FILE_KEY=None, file_type="csv", parse_dates=None):
+def load_data_from_s3_polluant(BUCKET_NAME="bucket-asthme-scraping", FILE_KEY=None, file_type="csv", parse_dates=None, dtype=None):
     """Fonction pour charger les données depuis le serveur S3"""
-    s3 = boto3.client('s3')
+    s3 = storage_client()
     
-    if file_type == "csv":
-        obj = s3.get_object(Bucket=BUCKET_NAME, Key=FILE_KEY)
-        df = pd.read_csv(StringIO(obj['Body'].read().decode('utf-8')), sep=";", parse_dates=parse_dates, low_memory=False)
-    elif file_type == "excel":
-        obj = s3.get_object(Bucket=BUCKET_NAME, Key=FILE_KEY)
-        df = pd.read_excel(BytesIO(obj['Body'].read()), engine="openpyxl")
-    else:
-        raise ValueError("Type de fichier non supporté. Utilisez 'csv' ou 'excel'.")
+    with track_load(os.path.basename(FILE_KEY)) as load:
+        if file_type == "csv":
+            obj = s3.get_object(Bucket=BUCKET_NAME, Key=FILE_KEY)
+            df = pd.read_csv(StringIO(obj['Body'].read().decode('utf-8')), sep=";", parse_dates=parse_dates, dtype=dtype, low_memory=False)
+        elif file_type == "excel":
+            obj = s3.get_object(Bucket=BUCKET_NAME, Key=FILE_KEY)
+            df = pd.read_excel(BytesIO(obj['Body'].read()), engine="openpyxl")
+        else:
+            raise ValueError("Type de fichier non supporté. Utilisez 'csv' ou 'excel'.")
+        load.update(rows=len(df), updated_at=obj.get('LastModified'))
     
     return df
 
 # --- Chargement des données ---
-df_daily = load_data_from_s3_polluant(FILE_KEY="geodair_max_daily.csv", file_type="csv", parse_dates=["date_de_debut", "date_de_fin"])
-df_weekly = load_data_from_s3_polluant(FILE_KEY="geodair_max_weekly.csv", file_type="csv")
-df_indices = load_data_from_s3_polluant(FILE_KEY="geodes_complet.xlsx", file_type="excel")
-df_iqa = load_data_from_s3_polluant(FILE_KEY="geodair_iqa_daily.csv", file_type="csv", parse_dates=["date_de_debut"])
+# Version courante des fichiers Geodair : tous les fichiers sont lus dans la même version publiée
+geodair_current = load_current_from_s3()
+# Historiques journaliers : seules les partitions mensuelles de la fenêtre du dashboard sont téléchargées
+debut_fenetre = datetime.now() - timedelta(days=DASHBOARD_WINDOW_DAYS)
+df_daily = load_partitioned_from_s3("geodair_max_daily", start=debut_fenetre, current=geodair_current, sep=";", parse_dates=["date_de_debut", "date_de_fin"], low_memory=False)
+# Historique hebdomadaire partitionné par année : chargé en entier (sélecteur de période)
+df_weekly = load_partitioned_from_s3("geodair_max_weekly", current=geodair_current, sep=";", low_memory=False)
+df_indices = load_geodes_data_from_s3()
+df_iqa = load_partitioned_from_s3("geodair_iqa_daily", start=debut_fenetre, current=geodair_current, sep=";", parse_dates=["date_de_debut"], dtype={"code_departement": str})
+# Dimension station : les tables de faits ne portent que code_site, les libellés sont joints à la demande
+df_station = load_data_from_s3_polluant(FILE_KEY=resolve_key(geodair_current, "geodair_station_dim.csv"), file_type="csv", dtype={"code_commune": str, "code_departement": str})
 
 # Renommage de la colonne pour uniformiser
 df_indices.rename(columns={'Semaine': 'semaine'}, inplace=True)
@@ -35,6 +49,19 @@ df_indices.rename(columns={'Semaine': 'semaine'}, inplace=True)
 df_weekly['semaine'] = df_weekly['semaine'].astype(str).str.replace(r'[^0-9]', '', regex=True).astype(int)
 df_indices['semaine'] = df_indices['semaine'].astype(str).str.replace(r'[^0-9]', '', regex=True).astype(int)
 
+# Stations ayant des mesures hebdomadaires (alimente les sélecteurs de département, ville et site)
+df_sites = df_station[df_station['code_site'].isin(df_weekly['code_site'].unique())]
+
+# --- Jointures à la demande avec la dimension station ---
+def sites_du_departement(departement):
+    """Codes des sites de mesure d'un département"""
+    return df_sites.loc[df_sites['departement'] == departement, 'code_site']
+
+def code_du_departement(departement):
+    """Code d'un département à partir de son nom (None si inconnu)"""
+    codes = df_sites.loc[df_sites['departement'] == departement, 'code_departement']
+    return codes.iloc[0] if not codes.empty else None
+
 # --- Fonction pour convertir une semaine en dates de début et de fin ---
 def semaine_to_dates(semaine):
     annee = int(str(semaine)[:4])
@@ -134,13 +161,13 @@ def get_polluants_layout():
                 html.Label("Sélectionnez un département"),
                 dcc.Dropdown(
                     id='dropdown-departement-nom',
-                    options=[{'label': dep, 'value': dep} for dep in sorted(df_weekly['departement'].unique())],
+                    options=[{'label': dep, 'value': dep} for dep in sorted(df_sites['departement'].dropna().unique())],
                     placeholder="Choisir un département par son nom",
                     style={'width': '100%'}
                 ),
                 dcc.Dropdown(
                     id='dropdown-departement-code',
-                    options=[{'label': code, 'value': code} for code in sorted(df_weekly['code_departement'].unique())],
+                    options=[{'label': code, 'value': code} for code in sorted(df_sites['code_departement'].dropna().unique())],
                     placeholder="Choisir un département par son code",
                     style={'width': '100%'}
                 )
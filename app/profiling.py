@@ -0,0 +1,139 @@
+"""
+Profilage à la demande des callbacks Dash
+
+Le point d'entrée des callbacks (/_dash-update-component) est profilé :
+- pour toutes les requêtes si DASH_PROFILE=1
+- pour une requête portant l'en-tête DASH_PROFILE_HEADER (X-Dash-Profile par défaut), si elle provient
+  d'une adresse d'administration (voir app/admin.py)
+
+Sans profilage demandé, le coût se limite à la lecture d'un en-tête.
+
+Un fichier est écrit par requête profilée dans DASH_PROFILE_DIR, nommé d'après la sortie du callback et ses entrées :
+- mode "sample" (par défaut) : piles échantillonnées au format replié (.folded), lisible par flamegraph.pl ou speedscope
+- mode "cprofile" : statistiques cProfile (.prof), lisibles par pstats, snakeviz ou flameprof
+Le mode se choisit avec DASH_PROFILE_MODE, ou par la valeur de l'en-tête (ex. X-Dash-Profile: cprofile).
+"""
+import cProfile
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+
+from flask import request
+
+from app.admin import is_admin_request
+
+DISPATCH_ROUTE = "/_dash-update-component"
+PROFILE_ALL = os.environ.get("DASH_PROFILE") == "1"
+PROFILE_HEADER = os.environ.get("DASH_PROFILE_HEADER", "X-Dash-Profile")
+PROFILE_MODE = os.environ.get("DASH_PROFILE_MODE", "sample")
+PROFILE_DIR = os.environ.get("DASH_PROFILE_DIR", "/tmp/dash-profiles")
+# Intervalle d'échantillonnage des piles (secondes)
+SAMPLE_INTERVAL = float(os.environ.get("DASH_PROFILE_INTERVAL", 0.001))
+
+
+class StackSampler:
+    """
+    Échantillonne à intervalle régulier la pile d'un thread, depuis un thread dédié
+    - stacks : nombre d'échantillons par pile repliée ("fonction (fichier:ligne);..." de la racine à la feuille)
+    """
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+def slug(text, max_length=60):
+    return re.sub(r"[^A-Za-z0-9_.=-]+", "_", str(text)).strip("_")[:max_length]
+
+
+def profile_filename(payload, extension):
+    """
+    Nom du fichier de profil : horodatage, sortie du callback, entrées et empreinte des entrées complètes
+    """
+    inputs = payload.get("inputs", []) + payload.get("state", [])
+    values = [f"{item.get('id')}.{item.get('property')}={item.get('value')}" for item in inputs if isinstance(item, dict)]
+    digest = hashlib.sha1(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()[:8]
+    timestamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    return f"{timestamp}_{slug(payload.get('output', 'callback'), 80)}_{slug('_'.join(values))}_{digest}.{extension}"
+
+
+def requested_mode():
+    """Mode de profilage demandé pour la requête en cours (None si elle n'est pas profilée)"""
+    header = request.headers.get(PROFILE_HEADER)
+    if header is not None and is_admin_request():
+        return header if header in ("sample", "cprofile") else PROFILE_MODE
+    return PROFILE_MODE if PROFILE_ALL else None
+
+
+def profile_view(view, profile_dir=PROFILE_DIR):
+    @wraps(view)
+    def profiled_view(*args, **kwargs):
+        mode = requested_mode()
+        if mode is None:
+            return view(*args, **kwargs)
+
+        os.makedirs(profile_dir, exist_ok=True)
+        payload = request.get_json(silent=True) or {}
+        start = time.perf_counter()
+        # Le profil est écrit même si le callback s'interrompt (PreventUpdate, exception)
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            path = os.path.join(profile_dir, profile_filename(payload, "prof"))
+            try:
+                response = profiler.runcall(view, *args, **kwargs)
+            finally:
+                profiler.dump_stats(path)
+        else:
+            sampler = StackSampler(threading.get_ident())
+            path = os.path.join(profile_dir, profile_filename(payload, "folded"))
+            try:
+                with sampler:
+                    response = view(*args, **kwargs)
+            finally:
+                sampler.write(path)
+        print(f"Profil {payload.get('output')} ({time.perf_counter() - start:.3f} s) : {path}")
+        response.headers["X-Dash-Profile-File"] = os.path.basename(path)
+        return response
+    return profiled_view
+
+
+def init_profiling(app, profile_dir=PROFILE_DIR):
+    """
+    Branche le profilage à la demande sur le point d'entrée des callbacks de l'application
+    """
+    view = app.server.view_functions.get(DISPATCH_ROUTE)
+    if view is not None and not hasattr(view, "__wrapped__"):
+        app.server.view_functions[DISPATCH_ROUTE] = profile_view(view, profile_dir)
@@ -0,0 +1,67 @@
+"""
+Enregistrement des requêtes de callbacks, pour rejouer des parcours réels (benchmarks/loadtest.py)
+
+Si DASH_RECORD désigne un fichier, chaque requête reçue sur le point d'entrée des callbacks (/_dash-update-component)
+y est ajoutée, une ligne json par requête :
+- session : empreinte de l'adresse et du navigateur du client (les requêtes d'un même onglet partagent la même session)
+- t : horodatage de réception (secondes), qui permet de rejouer les temps de réflexion entre deux actions
+- payload : corps de la requête tel qu'envoyé par le navigateur (sortie, entrées, propriétés modifiées)
+- status, duration_ms : code et durée de la réponse
+
+Sans DASH_RECORD, rien n'est branché.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import request
+
+from app.profiling import DISPATCH_ROUTE
+
+RECORD_FILE = os.environ.get("DASH_RECORD")
+
+_lock = threading.Lock()
+
+
+def session_id():
+    """Identifiant de session du client de la requête en cours"""
+    client = f"{request.remote_addr}|{request.headers.get('User-Agent', '')}"
+    return hashlib.sha1(client.encode()).hexdigest()[:12]
+
+
+def record_view(view, record_file):
+    @wraps(view)
+    def recorded_view(*args, **kwargs):
+        payload = request.get_json(silent=True)
+        received = time.time()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = view(*args, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            line = json.dumps({
+                "session": session_id(),
+                "t": round(received, 3),
+                "payload": payload,
+                "status": status,
+                "duration_ms": round(1000 * (time.perf_counter() - start), 1),
+            }, ensure_ascii=False, default=str)
+            with _lock, open(record_file, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+    recorded_view.recorded = True
+    return recorded_view
+
+
+def init_recording(app, record_file=RECORD_FILE):
+    """
+    Branche l'enregistrement des requêtes de callbacks si un fichier est configuré (DASH_RECORD)
+    """
+    view = app.server.view_functions.get(DISPATCH_ROUTE)
+    if record_file and view is not None and not getattr(view, "recorded", False):
+        os.makedirs(os.path.dirname(os.path.abspath(record_file)), exist_ok=True)
+        app.server.view_functions[DISPATCH_ROUTE] = record_view(view, record_file)
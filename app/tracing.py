@@ -0,0 +1,146 @@
+"""
+Traces des requêtes de callbacks : durée de chaque étape, de la requête à la réponse encodée
+
+Si DASH_TRACE est défini ("stdout" ou chemin d'un fichier), chaque requête reçue sur le point d'entrée des callbacks
+(/_dash-update-component) ouvre une trace, identifiée par trace_id (en-tête TRACE_HEADER de la requête s'il est
+fourni, sinon généré, et renvoyé dans la réponse). Les étapes sont des spans imbriqués :
+- dispatch : traitement complet de la requête par Dash
+- callback : appel du callback (fonction et encodage de sa réponse)
+- load, prepare, filter : lecture des données (cache compris), préparation (après une mise à jour des données seulement)
+  et filtrage, ouverts dans le code des callbacks et du chargement des données (span())
+- data, figure : autres accès aux données et construction des figures, ouverts dans le code des callbacks
+- encode : sérialisation JSON de la réponse (plotly)
+
+En fin de requête, chaque span est écrit en une ligne json : trace_id, span_id, parent_id, name, start (horodatage),
+duration_ms et attributs (sortie du callback, jeu de données, nombre de lignes...).
+Sans DASH_TRACE, rien n'est branché et span() ne mesure rien.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import request
+
+from app.profiling import DISPATCH_ROUTE
+
+TRACE_TARGET = os.environ.get("DASH_TRACE")
+TRACE_HEADER = os.environ.get("DASH_TRACE_HEADER", "X-Trace-Id")
+
+_current = ContextVar("trace", default=None)
+_lock = threading.Lock()
+
+
+class Trace:
+    """Spans terminés d'une requête et pile des spans ouverts"""
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.stack = []
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Mesure un bloc comme étape de la trace en cours ; le bloc peut compléter les attributs (ex. attrs["rows"])
+    Hors requête tracée, les attributs sont ignorés et rien n'est mesuré.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield attributes
+        return
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = trace.stack[-1] if trace.stack else None
+    trace.stack.append(span_id)
+    start, wall = time.perf_counter(), time.time()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        trace.stack.pop()
+        trace.spans.append({
+            "trace_id": trace.trace_id,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "name": name,
+            "start": round(wall, 6),
+            "duration_ms": round(1000 * (time.perf_counter() - start), 3),
+            "attributes": attributes,
+        })
+
+
+def traced(name, function, **attributes):
+    """Enveloppe une fonction dans un span"""
+    @wraps(function)
+    def traced_function(*args, **kwargs):
+        with span(name, **attributes):
+            return function(*args, **kwargs)
+    traced_function.traced = True
+    return traced_function
+
+
+def request_trace_id():
+    # Identifiant fourni par le client (ex. proxy) s'il est valide, sinon généré
+    trace_id = request.headers.get(TRACE_HEADER, "")
+    return trace_id if re.fullmatch(r"[0-9a-fA-F-]{8,64}", trace_id) else uuid.uuid4().hex
+
+
+def export(spans, target):
+    lines = "".join(json.dumps(item, ensure_ascii=False, default=str) + "\n" for item in spans)
+    with _lock:
+        if target == "stdout":
+            sys.stdout.write(lines)
+            sys.stdout.flush()
+        else:
+            with open(target, "a", encoding="utf-8") as file:
+                file.write(lines)
+
+
+def trace_view(view, target):
+    @wraps(view)
+    def traced_view(*args, **kwargs):
+        trace = Trace(request_trace_id())
+        token = _current.set(trace)
+        payload = request.get_json(silent=True) or {}
+        try:
+            with span("dispatch", output=payload.get("output"), changed=payload.get("changedPropIds")) as attrs:
+                response = view(*args, **kwargs)
+                attrs["status"] = response.status_code
+            response.headers[TRACE_HEADER] = trace.trace_id
+            return response
+        finally:
+            _current.reset(token)
+            export(trace.spans, target)
+    traced_view.traced = True
+    return traced_view
+
+
+def init_tracing(app, target=TRACE_TARGET):
+    """
+    Branche les traces sur le point d'entrée des callbacks, les callbacks et l'encodage des réponses si DASH_TRACE
+    est défini (à appeler une fois tous les callbacks enregistrés)
+    """
+    view = app.server.view_functions.get(DISPATCH_ROUTE)
+    if not target or view is None or getattr(view, "traced", False):
+        return
+    if target != "stdout":
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    app.server.view_functions[DISPATCH_ROUTE] = trace_view(view, target)
+
+    for output, spec in app.callback_map.items():
+        if not getattr(spec["callback"], "traced", False):
+            spec["callback"] = traced("callback", spec["callback"], output=output.strip("."))
+
+    # Dash encode la réponse des callbacks par dash._callback.to_json, résolu à chaque appel
+    import dash._callback
+
+    if not getattr(dash._callback.to_json, "traced", False):
+        dash._callback.to_json = traced("encode", dash._callback.to_json)
@@ -0,0 +1,200 @@
+"""
+Benchmark des callbacks du dashboard sur des données synthétiques
+
+Le dashboard est chargé hors ligne depuis un stockage local généré par benchmarks/synthetic.py
+(ASTHME_STORAGE=fs:<dossier>), puis chaque callback est appelé directement (fonction d'origine, hors requête HTTP) :
+- latence : médiane, moyenne, min et max sur --repeat appels, après un appel de chauffe
+- allocations : pic et total alloués pendant un appel (tracemalloc, mesuré sur un appel séparé)
+- taille de la réponse : figure ou composants sérialisés en JSON, comme envoyés au navigateur
+
+Les résultats sont écrits en JSON (un fichier par exécution) ; --compare affiche l'écart avec une exécution de référence.
+
+Usage
+    python benchmarks/bench_callbacks.py --scale current
+    python benchmarks/bench_callbacks.py --scale max --full-history --repeat 3
+    python benchmarks/bench_callbacks.py --data /tmp/asthme-max --compare benchmarks/results/callbacks-current-....json
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SCALES, generate  # noqa: E402
+
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+CALLBACKS = ["update_map", "update_classement", "update_pollutants", "update_concentrations", "update_map_pol", "update_barplot"]
+# Écart relatif au-delà duquel une latence ou un pic mémoire est signalé par --compare
+REGRESSION_THRESHOLD = 0.2
+
+
+def configure(data_dir, summary, full_history):
+    # Le stockage et la fenêtre de chargement sont lus à l'import des modules du dashboard
+    os.environ["ASTHME_STORAGE"] = f"fs:{data_dir}"
+    os.environ["ASTHME_COMMUNES_GEOJSON"] = summary["geojson"]
+    if full_history:
+        os.environ["DASHBOARD_WINDOW_DAYS"] = str(366 * summary["years"] + 31)
+    sys.path.insert(0, ROOT)
+
+
+def load_app():
+    """
+    Importe le dashboard (chargement de toutes les données) et renvoie les fonctions d'origine des callbacks
+    """
+    start = time.perf_counter()
+    from app.app import app
+    startup = time.perf_counter() - start
+    functions = {}
+    for spec in app.callback_map.values():
+        # Les callbacks enregistrés sont enveloppés (contexte Dash, métriques) : on remonte à la fonction d'origine
+        function = inspect.unwrap(spec["callback"])
+        functions[function.__name__] = function
+    return functions, startup
+
+
+def callback_arguments():
+    """
+    Arguments réalistes de chaque callback : dernière semaine, département le mieux équipé, dernière date disponible...
+    """
+    from app.layout import default_week
+    from app.pages.polluant import df_sites, options_semaines, semaine_plus_recente, df_daily
+    from app.components.card_ import load_and_prepare_data
+
+    departement = df_sites["departement"].value_counts().index[0]
+    debut = options_semaines[max(0, len(options_semaines) - 52)]["value"]
+    df_pollen = load_and_prepare_data()
+    latest = df_pollen["date"].max()
+    return {
+        "update_map": (default_week,),
+        "update_classement": (default_week, "pires3"),
+        "update_pollutants": (departement, debut, semaine_plus_recente),
+        "update_concentrations": (departement, df_daily["date_de_debut"].max().strftime("%Y-%m-%d")),
+        "update_map_pol": (latest.strftime("%Y/%m/%d"), sorted(df_pollen["Pollen"].unique())[0]),
+        "update_barplot": (df_pollen["Ville"].iloc[0], latest.strftime("%Y-%m-%d")),
+    }
+
+
+def payload_size(result):
+    import plotly
+
+    return len(json.dumps(result, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def bench(function, args, repeat):
+    function(*args)  # chauffe (imports, caches)
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(*args)
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "calls": repeat,
+        "median_ms": round(1000 * latencies[len(latencies) // 2], 2),
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 2),
+        "min_ms": round(1000 * latencies[0], 2),
+        "max_ms": round(1000 * latencies[-1], 2),
+        "peak_kib": round(peak / 1024, 1),
+        "retained_kib": round(allocated / 1024, 1),
+        "payload_bytes": payload_size(result),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, reference_path):
+    with open(reference_path, encoding="utf-8") as file:
+        reference = json.load(file)
+    print(f"\nÉcart avec {reference_path} ({reference['meta'].get('revision')}) :")
+    regressions = []
+    for name, current in results["callbacks"].items():
+        previous = reference["callbacks"].get(name)
+        if not previous:
+            continue
+        deltas = []
+        for metric in ("median_ms", "peak_kib"):
+            ratio = current[metric] / previous[metric] - 1 if previous[metric] else 0
+            deltas.append(f"{metric} {previous[metric]:>10} -> {current[metric]:<10} ({ratio:+.0%})")
+            if ratio > REGRESSION_THRESHOLD:
+                regressions.append(f"{name}.{metric}")
+        print(f"  {name:<22} " + "  ".join(deltas))
+    if regressions:
+        print(f"Régressions (> {REGRESSION_THRESHOLD:.0%}) : {', '.join(regressions)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="current", help="échelle des données générées")
+    parser.add_argument("--data", help="stockage local existant (par défaut, généré dans /tmp/asthme-bench-<échelle>)")
+    parser.add_argument("--full-history", action="store_true", help="charge tout l'historique journalier (et non la fenêtre du dashboard)")
+    parser.add_argument("--repeat", type=int, default=5, help="appels mesurés par callback")
+    parser.add_argument("--callbacks", nargs="+", default=CALLBACKS, help="callbacks à mesurer")
+    parser.add_argument("--output", help="fichier json des résultats (par défaut dans benchmarks/results/)")
+    parser.add_argument("--compare", help="fichier json d'une exécution de référence")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data or f"/tmp/asthme-bench-{args.scale}")
+    summary_path = os.path.join(data_dir, "synthetic.json")
+    if os.path.exists(summary_path):
+        with open(summary_path, encoding="utf-8") as file:
+            summary = json.load(file)
+    else:
+        print(f"Génération des données ({args.scale}) dans {data_dir}...")
+        summary = generate(data_dir, **SCALES[args.scale])
+
+    configure(data_dir, summary, args.full_history)
+    functions, startup = load_app()
+    arguments = callback_arguments()
+
+    results = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "data": {key: summary[key] for key in ("years", "stations", "cities", "rows", "start", "end")},
+            "full_history": args.full_history,
+            "repeat": args.repeat,
+            "startup_s": round(startup, 2),
+        },
+        "callbacks": {},
+    }
+    print(f"Chargement du dashboard : {startup:.2f} s")
+    for name in args.callbacks:
+        result = bench(functions[name], arguments[name], args.repeat)
+        results["callbacks"][name] = result
+        print(f"{name:<22} {result['median_ms']:9.1f} ms (min {result['min_ms']:.1f}, max {result['max_ms']:.1f})"
+              f"  pic {result['peak_kib']:10.1f} Kio  réponse {result['payload_bytes']:>9} octets")
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS, f"callbacks-{args.scale}{'-full' if args.full_history else ''}-{datetime.now():%Y%m%dT%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+    print(f"Résultats : {output}")
+
+    if args.compare and compare(results, args.compare):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
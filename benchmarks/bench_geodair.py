@@ -0,0 +1,293 @@
+"""
+Benchmark des traitements Geodair sur des historiques générés de 1, 3 et 10 ans
+
+Pour chaque profondeur d'historique, un jeu de données hors ligne est généré (et conservé dans --data) :
+- geodair_max_daily.csv : ancien historique journalier en fichier unique (doublons et lignes non triées compris)
+- geodair_max_daily/, geodair_iqa_daily/ : historiques partitionnés par mois, geodair_max_weekly/ (par année)
+- geodair_station.csv, geodair_station_dim.csv : export des stations et dimension station
+- new_day.csv : export d'une journée supplémentaire (et de la veille, renvoyée), pour le traitement quotidien
+
+Chaque traitement est exécuté dans un processus dédié, sur une copie du jeu de données, afin que le pic de mémoire
+résidente lui soit propre. Sont mesurés, pour chaque fonction et pour les étapes internes (voir scripts/instrumentation.py) :
+durée, pic de mémoire résidente et volume lu et écrit (/proc/self/io, Linux uniquement).
+
+Traitements
+    deduplicate_csv, reorder_csv, merge_polluant_station, update_iqa, aggregate_weekly : chaque fonction seule
+    chain : les cinq fonctions enchaînées sur l'ancien historique en fichier unique
+    daily : traitement quotidien actuel (process_max_daily : partitions du mois et semaines concernées)
+    backfill : reconstruction des BACKFILL_MONTHS derniers mois à partir d'exports bruts déjà déposés (sans accès réseau),
+               partitions traitées par le pool de processus pendant la mesure de la mémoire (voir WORKER_TIMEOUT)
+
+Usage
+    python benchmarks/bench_geodair.py                                   # 1, 3 et 10 ans, 150 stations
+    python benchmarks/bench_geodair.py --years 1 3 --stations 650 --benchmarks chain daily
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import geodair  # noqa: E402
+import instrumentation  # noqa: E402
+from synthetic import daily_measures, station_dim, workdir  # noqa: E402
+
+DEFAULT_DATA = "/tmp/asthme-bench-geodair"
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DAILY_CSV = "geodair_max_daily.csv"
+NEW_DAY_CSV = "new_day.csv"
+DATASET_FILE = "dataset.json"
+PROC_IO = "/proc/self/io"
+# Part des mesures renvoyées une seconde fois (non validées) dans l'ancien historique
+DUPLICATE_RATE = 0.02
+# Nombre de mois reconstruits par le traitement backfill
+BACKFILL_MONTHS = 3
+# Durée maximale d'un traitement (secondes) : un processus bloqué fait échouer le benchmark
+WORKER_TIMEOUT = 3600
+
+
+def export_frame(df_fact, df_dim):
+    # Export Geodair : mesures et colonnes propres aux stations, dates au format de l'API
+    df = df_fact.merge(df_dim[["code_site"] + geodair.station_columns], on="code_site", how="left")
+    for col in geodair.date_columns:
+        df[col] = df[col].dt.strftime(geodair.date_format)
+    return df
+
+
+def prepare_dataset(folder, years, stations, seed=0):
+    """
+    Génère le jeu de données d'un historique de `years` années (sans effet s'il existe déjà)
+
+    Sortie
+        dataset (dict) paramètres et nombre de lignes du jeu de données
+    """
+    path = os.path.join(folder, DATASET_FILE)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    print(f"Génération de l'historique {years} an(s), {stations} stations dans {folder}...")
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(datetime.today() - timedelta(days=2)).normalize()
+    days = pd.date_range(end - pd.DateOffset(years=years) + timedelta(days=1), end, freq="D")
+    df_dim = station_dim(stations, rng)
+    rows = 0
+    with workdir(folder):
+        df_dim.to_csv(geodair.csv_station_dim, sep=";", index=False, encoding="utf-8", lineterminator="\n")
+        df_dim.rename(columns={"code_site": "code"}).drop(columns=["code_departement", "departement"]).to_csv(
+            geodair.csv_station, sep=";", index=False, encoding="utf-8", lineterminator="\n"
+        )
+        for i, (_, year_days) in enumerate(pd.Series(days).groupby(days.year)):
+            df_fact = daily_measures(df_dim, pd.DatetimeIndex(year_days), rng)
+            geodair.update_daily_partitions(df_fact, df_dim)
+            geodair.aggregate_weekly(df_daily=df_fact)
+            # Ancien historique : mesures de l'année, puis des doublons non validés ajoutés en fin de fichier
+            df_duplicates = df_fact.sample(frac=DUPLICATE_RATE, random_state=seed).assign(validite=0)
+            df_export = export_frame(pd.concat([df_fact, df_duplicates], ignore_index=True), df_dim)
+            df_export.to_csv(DAILY_CSV, sep=";", mode="a", header=i == 0, index=False, encoding="utf-8", lineterminator="\n")
+            rows += len(df_export)
+
+        # Journée suivante et veille renvoyée par l'API, au format des exports téléchargés
+        df_new = daily_measures(df_dim, pd.date_range(end, end + timedelta(days=1), freq="D"), rng)
+        export_frame(df_new, df_dim).to_csv(NEW_DAY_CSV, sep=";", index=False, encoding="utf-8", lineterminator="\n")
+
+    dataset = {
+        "years": years, "stations": stations, "seed": seed,
+        "start": days[0].strftime("%Y-%m-%d"), "end": days[-1].strftime("%Y-%m-%d"),
+        "rows": rows, "daily_csv_mb": round(os.path.getsize(os.path.join(folder, DAILY_CSV)) / 2 ** 20, 1),
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(dataset, file, indent=2)
+    return dataset
+
+
+def run_daily():
+    frames = [pd.read_csv(NEW_DAY_CSV, sep=";", low_memory=False, encoding="utf-8")]
+    return geodair.process_max_daily(frames)
+
+
+# Période déposée par stage_backfill, reconstruite par run_backfill (même processus)
+backfill_period = {}
+
+
+def stage_backfill(months=BACKFILL_MONTHS):
+    """
+    Dépose les exports bruts des derniers mois de l'historique dans le dossier du backfill, tous consignés comme
+    téléchargés, et l'export des stations du jour comme déjà en cache : le backfill n'accède pas au réseau
+    """
+    manifest = geodair.load_manifest(geodair.daily_root)
+    df_dim = geodair.read_station_dim()
+    os.makedirs(geodair.backfill_root, exist_ok=True)
+    checkpoint = {"days": {}}
+    for key in geodair.select_partitions(manifest)[-months:]:
+        df = geodair.read_polluant_csv(geodair.partition_path(geodair.daily_root, key))
+        for day, df_day in df.groupby(df["date_de_debut"].dt.strftime("%Y-%m-%d")):
+            export_frame(df_day, df_dim).to_csv(
+                os.path.join(geodair.backfill_root, f"{day}.csv"), sep=";", index=False, encoding="utf-8", lineterminator="\n"
+            )
+            checkpoint["days"][day] = len(df_day)
+    geodair.save_checkpoint(geodair.backfill_root, checkpoint)
+    with open(geodair.station_cache_file, "w", encoding="utf-8") as file:
+        json.dump({"date": datetime.today().strftime("%Y-%m-%d"), "sha256": None}, file)
+    backfill_period.update(start=min(checkpoint["days"]), end=max(checkpoint["days"]))
+
+
+def run_backfill():
+    return geodair.backfill(backfill_period["start"], backfill_period["end"], max_processes=2)
+
+
+STEPS = {
+    "deduplicate_csv": lambda: geodair.deduplicate_csv(DAILY_CSV),
+    "reorder_csv": lambda: geodair.reorder_csv(DAILY_CSV),
+    "merge_polluant_station": lambda: geodair.merge_polluant_station(DAILY_CSV),
+    "update_iqa": lambda: geodair.update_iqa(DAILY_CSV),
+    "aggregate_weekly": lambda: geodair.aggregate_weekly(),
+    "process_max_daily": run_daily,
+    "stage_backfill": stage_backfill,
+    "backfill": run_backfill,
+}
+BENCHMARKS = {
+    "deduplicate_csv": ["deduplicate_csv"],
+    "reorder_csv": ["reorder_csv"],
+    "merge_polluant_station": ["merge_polluant_station"],
+    "update_iqa": ["update_iqa"],
+    "aggregate_weekly": ["aggregate_weekly"],
+    "chain": ["deduplicate_csv", "reorder_csv", "merge_polluant_station", "update_iqa", "aggregate_weekly"],
+    "daily": ["process_max_daily"],
+    "backfill": ["stage_backfill", "backfill"],
+}
+
+
+def io_counters():
+    """
+    Octets lus et écrits par le processus (appels read/write, cache disque compris), None hors Linux
+    """
+    try:
+        with open(PROC_IO) as file:
+            counters = dict(line.split(": ") for line in file.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def run_worker(benchmark, result_path):
+    """
+    Exécute un traitement dans le dossier courant (processus dédié) et écrit ses mesures en json
+    """
+    baseline = instrumentation.current_rss()
+    report = instrumentation.start_report(benchmark)
+    start = time.perf_counter()
+    for name in BENCHMARKS[benchmark]:
+        before = io_counters()
+        with instrumentation.stage(name) as st:
+            STEPS[name]()
+        after = io_counters()
+        if before and after:
+            st.bytes_read += after[0] - before[0]
+            st.bytes_written += after[1] - before[1]
+    wall = time.perf_counter() - start
+    report.stopped.set()
+
+    summary = report.summary()
+    peak = instrumentation.max_rss()
+    steps = [stage for stage in summary["stages"] if stage["name"] in STEPS]
+    result = {
+        "benchmark": benchmark,
+        "wall_s": round(wall, 3),
+        "baseline_rss_mb": round(baseline / 2 ** 20, 1) if baseline is not None else None,
+        "peak_rss_mb": round(peak / 2 ** 20, 1) if peak is not None else None,
+        "read_mb": round(sum(stage["bytes_read"] for stage in steps) / 2 ** 20, 1),
+        "written_mb": round(sum(stage["bytes_written"] for stage in steps) / 2 ** 20, 1),
+        "steps": steps,
+        "stages": [stage for stage in summary["stages"] if stage["name"] not in STEPS],
+    }
+    with open(result_path, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2, ensure_ascii=False)
+
+
+def run_benchmark(benchmark, folder, scratch_root=None):
+    """
+    Copie le jeu de données dans un dossier de travail et y exécute le traitement dans un nouveau processus
+
+    Sortie
+        result (dict) mesures du traitement (voir run_worker)
+    """
+    scratch = tempfile.mkdtemp(prefix=f"bench-{benchmark}-", dir=scratch_root)
+    try:
+        work = os.path.join(scratch, "work")
+        shutil.copytree(folder, work)
+        result_path = os.path.join(scratch, "result.json")
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", benchmark, "--result", result_path],
+            cwd=work, capture_output=True, text=True, timeout=WORKER_TIMEOUT,
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"{benchmark} a échoué :\n{completed.stderr[-2000:]}")
+        with open(result_path, encoding="utf-8") as file:
+            return json.load(file)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def print_curves(results, benchmarks):
+    print(f"\n{'traitement':<24}{'années':>7}{'lignes':>11}{'durée (s)':>11}{'pic (Mo)':>10}{'lu (Mo)':>10}{'écrit (Mo)':>12}")
+    for benchmark in benchmarks:
+        for run in results:
+            result = run["benchmarks"][benchmark]
+            print(f"{benchmark:<24}{run['dataset']['years']:>7}{run['dataset']['rows']:>11}{result['wall_s']:>11.2f}"
+                  f"{result['peak_rss_mb']:>10}{result['read_mb']:>10}{result['written_mb']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 3, 10], help="profondeurs d'historique (années)")
+    parser.add_argument("--stations", type=int, default=150, help="nombre de stations")
+    parser.add_argument("--seed", type=int, default=0, help="graine du générateur aléatoire")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS), help="traitements à mesurer")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="dossier des jeux de données générés (réutilisés d'une exécution à l'autre)")
+    parser.add_argument("--scratch", help="dossier des copies de travail (par défaut, dossier temporaire du système)")
+    parser.add_argument("--output", help="fichier json des résultats (par défaut dans benchmarks/results/)")
+    parser.add_argument("--worker", choices=list(BENCHMARKS), help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.result)
+        return
+
+    results = []
+    for years in args.years:
+        folder = os.path.join(os.path.abspath(args.data), f"{years}y-{args.stations}s-{args.seed}")
+        run = {"dataset": prepare_dataset(folder, years, args.stations, args.seed), "benchmarks": {}}
+        for benchmark in args.benchmarks:
+            result = run_benchmark(benchmark, folder, args.scratch)
+            run["benchmarks"][benchmark] = result
+            print(f"{years:>3} an(s) {benchmark:<24} {result['wall_s']:8.2f} s  pic {result['peak_rss_mb']} Mo"
+                  f"  lu {result['read_mb']} Mo  écrit {result['written_mb']} Mo")
+        results.append(run)
+
+    print_curves(results, args.benchmarks)
+    output = args.output or os.path.join(DEFAULT_RESULTS, f"geodair-{datetime.now():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump({
+            "meta": {"date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(), "stations": args.stations},
+            "runs": results,
+        }, file, indent=2, ensure_ascii=False)
+    print(f"Résultats : {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark du parsing des pages ville/pollen de pollens.fr
+
+Compare, sur des pages sauvegardées, le débit de deux méthodes d'extraction de graphData / previousYearGraphData :
+- dom : ancienne méthode (BeautifulSoup html.parser + recherche du <script> + regex)
+- fast : extract_graph_data (recherche directe dans les octets bruts, sans DOM)
+
+Usage
+    python benchmarks/bench_pollen_parse.py                       # pages de benchmarks/fixtures/pollens (générées si absentes)
+    python benchmarks/bench_pollen_parse.py --pages DIR --repeat 20
+    python benchmarks/bench_pollen_parse.py --save 10             # enregistre 10 vraies pages dans --pages
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from pollen import GRAPH_DATA_VARS, extract_graph_data  # noqa: E402
+
+DEFAULT_PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pollens")
+BASE_URL = "https://www.pollens.fr/les-risques/risques-par-ville"
+
+
+def extract_graph_data_dom(content):
+    # Ancienne méthode : DOM complet, puis regex sur le contenu du <script>
+    soup = BeautifulSoup(content.decode("utf-8", errors="replace"), "html.parser")
+    script_data = {}
+    for var_name in GRAPH_DATA_VARS:
+        script = soup.find('script', string=re.compile(fr'var {var_name} ='))
+        if script:
+            match = re.search(fr'var {var_name}\s*=\s*(\[.*?\])', script.string, re.DOTALL)
+            if match:
+                script_data[var_name] = json.loads(match.group(1))
+    return script_data
+
+
+def synthetic_page(n_cities=90, n_pollens=20, n_days=365):
+    # Page de taille et de structure comparables à une page ville/pollen (sélecteurs, menus, deux séries JS)
+    start = datetime(2025, 1, 1)
+    graph = [
+        {"date": int((start + timedelta(days=i)).timestamp() * 1000), "level": i % 4, "realLevelValue": i % 5}
+        for i in range(n_days)
+    ]
+    previous = [
+        {"realDate": int((start - timedelta(days=365 - i)).timestamp() * 1000), "level": i % 4, "realLevelValue": i % 5}
+        for i in range(n_days)
+    ]
+    cities = "".join(f'<option value="{i}">VILLE {i}</option>' for i in range(1, n_cities + 1))
+    pollens = "".join(f'<option value="{i}">Pollen {i}</option>' for i in range(n_pollens))
+    menu = "".join(f'<li class="menu-item"><a href="/page/{i}">Rubrique {i}</a></li>' for i in range(200))
+    return (
+        "<!DOCTYPE html><html><head><title>Risques par ville</title>"
+        '<script src="/js/app.js"></script></head><body>'
+        f'<nav><ul>{menu}</ul></nav>'
+        f'<select id="citySelector">{cities}</select><select id="pollenSelector">{pollens}</select>'
+        '<div class="chart"><canvas id="chart"></canvas></div>'
+        f"<script>var graphData = {json.dumps(graph)};\n"
+        f"var previousYearGraphData = {json.dumps(previous)};\n"
+        "drawChart(graphData, previousYearGraphData);</script>"
+        f'<footer>{menu}</footer></body></html>'
+    ).encode("utf-8")
+
+
+def save_pages(directory, count):
+    # Enregistre quelques vraies pages (requêtes séquentielles et espacées)
+    import requests
+
+    os.makedirs(directory, exist_ok=True)
+    session = requests.Session()
+    for i, (city, pollen) in enumerate([(c, p) for c in range(1, 100) for p in (54, 24, 13)][:count]):
+        response = session.get(f"{BASE_URL}/{city}/{pollen}", timeout=30)
+        response.raise_for_status()
+        with open(os.path.join(directory, f"page_{city}_{pollen}.html"), "wb") as file:
+            file.write(response.content)
+        print(f"Page enregistrée : {city}/{pollen} ({len(response.content)} octets)")
+        time.sleep(1)
+
+
+def load_pages(directory):
+    if not os.path.isdir(directory) or not any(f.endswith(".html") for f in os.listdir(directory)):
+        print(f"Aucune page sauvegardée dans {directory} : génération d'une page synthétique.")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "synthetic.html"), "wb") as file:
+            file.write(synthetic_page())
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".html"):
+            with open(os.path.join(directory, name), "rb") as file:
+                pages.append(file.read())
+    return pages
+
+
+def bench(method, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in pages:
+            method(content)
+    elapsed = time.perf_counter() - start
+    n_pages = len(pages) * repeat
+    n_bytes = sum(len(content) for content in pages) * repeat
+    return {
+        "pages": n_pages,
+        "seconds": round(elapsed, 4),
+        "ms_per_page": round(1000 * elapsed / n_pages, 3),
+        "pages_per_s": round(n_pages / elapsed, 1),
+        "mb_per_s": round(n_bytes / elapsed / 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default=DEFAULT_PAGES, help="dossier des pages html sauvegardées")
+    parser.add_argument("--repeat", type=int, default=10, help="nombre de passes sur l'ensemble des pages")
+    parser.add_argument("--save", type=int, default=0, help="enregistre N vraies pages avant le benchmark")
+    parser.add_argument("--json", help="écrit les résultats dans ce fichier json")
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.pages, args.save)
+    pages = load_pages(args.pages)
+
+    # Les deux méthodes doivent extraire exactement les mêmes séries
+    for content in pages:
+        if extract_graph_data(content) != extract_graph_data_dom(content):
+            raise SystemExit("Les deux méthodes d'extraction donnent des résultats différents.")
+
+    results = {name: bench(method, pages, args.repeat)
+               for name, method in [("dom", extract_graph_data_dom), ("fast", extract_graph_data)]}
+    results["speedup"] = round(results["dom"]["seconds"] / results["fast"]["seconds"], 1)
+
+    print(f"{len(pages)} page(s), {args.repeat} passe(s)")
+    for name in ("dom", "fast"):
+        r = results[name]
+        print(f"{name:>5} : {r['ms_per_page']:8.3f} ms/page  {r['pages_per_s']:9.1f} pages/s  {r['mb_per_s']:7.2f} Mo/s")
+    print(f"Accélération : x{results['speedup']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Profil de démarrage du dashboard : temps d'import et entrées/sorties au niveau des modules
+
+Chaque mesure importe app.app dans un processus neuf (démarrage à froid d'un worker gunicorn) :
+- temps d'import de chaque module, propre (hors sous-imports) et cumulé (python -X importtime)
+- entrées/sorties pendant l'exécution du module (hors chargement du code) : fichiers ouverts et leur taille,
+  connexions réseau (S3, API, geojson), attribuées au module en cours d'exécution (hooks d'audit, sys.addaudithook)
+- jeux de données chargés (durée et nombre de lignes, voir app/metrics.py), durée totale et RSS en fin d'import
+
+Le rapport est trié par temps propre : modules de l'application, puis paquets tiers regroupés par paquet racine.
+Avec --repeat, chaque temps est la médiane des exécutions.
+
+Usage
+    python benchmarks/bench_startup.py --data /tmp/asthme-current
+    python benchmarks/bench_startup.py --data /tmp/asthme-max --repeat 5 --top 30 --output /tmp/startup.json
+    ASTHME_STORAGE=s3 python benchmarks/bench_startup.py                      # données réelles
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Fichiers de code : leur lecture fait partie de l'import, pas des entrées/sorties du module
+CODE_SUFFIXES = (".py", ".pyc", ".so", ".pyd", ".pth")
+
+
+class IOTracker:
+    """
+    Entrées/sorties par module en cours d'exécution : fichiers ouverts (nombre, octets) et connexions réseau
+    """
+    def __init__(self):
+        self.modules = defaultdict(lambda: {"files": 0, "bytes": 0, "connections": 0, "targets": []})
+        self.local = threading.local()
+
+    @staticmethod
+    def current_module():
+        # Module dont le code de niveau module est en cours d'exécution le plus proche dans la pile
+        frame = sys._getframe(2)
+        while frame is not None:
+            if frame.f_code.co_name == "<module>":
+                return frame.f_globals.get("__name__", "?")
+            frame = frame.f_back
+        return "?"
+
+    def __call__(self, event, args):
+        if event not in ("open", "socket.connect") or getattr(self.local, "busy", False):
+            return
+        self.local.busy = True
+        try:
+            if event == "open":
+                path = args[0]
+                if not isinstance(path, (str, bytes)) or os.fsdecode(path).endswith(CODE_SUFFIXES):
+                    return
+                io = self.modules[self.current_module()]
+                io["files"] += 1
+                try:
+                    io["bytes"] += os.path.getsize(path)
+                except OSError:
+                    pass
+                target = os.fsdecode(path)
+            else:
+                io = self.modules[self.current_module()]
+                io["connections"] += 1
+                target = str(args[1])
+            if len(io["targets"]) < 5 and target not in io["targets"]:
+                io["targets"].append(target)
+        finally:
+            self.local.busy = False
+
+
+def rss():
+    with open("/proc/self/status", encoding="utf-8") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def worker(result_path):
+    """
+    Import de app.app dans ce processus (lancé avec -X importtime) ; entrées/sorties et jeux de données écrits en json
+    """
+    tracker = IOTracker()
+    sys.addaudithook(tracker)
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    import app.app  # noqa: F401
+    total = time.perf_counter() - start
+
+    from app.metrics import dataset_load_seconds, dataset_rows
+    datasets = {
+        dict(key)["dataset"]: {"seconds": seconds, "rows": dataset_rows.values.get(key)}
+        for key, seconds in dataset_load_seconds.values.items()
+    }
+    with open(result_path, "w", encoding="utf-8") as file:
+        json.dump({"total_s": total, "rss": rss(), "io": dict(tracker.modules), "datasets": datasets}, file)
+
+
+def parse_importtime(stderr):
+    """
+    Temps d'import par module (microsecondes) : {module: (propre, cumulé)}, à partir de la sortie de -X importtime
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def run_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = os.path.join(tmp, "startup.json")
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--worker", "--result", result_path],
+            capture_output=True, text=True, cwd=ROOT,
+        )
+        if process.returncode:
+            sys.stderr.write(process.stderr[-4000:])
+            raise SystemExit(f"Échec de l'import de app.app (code {process.returncode})")
+        with open(result_path, encoding="utf-8") as file:
+            result = json.load(file)
+    result["imports"] = parse_importtime(process.stderr)
+    return result
+
+
+def median_runs(runs):
+    """Médiane, sur les exécutions, des temps par module et des durées de chargement ; entrées/sorties de la première"""
+    modules = set().union(*(run["imports"] for run in runs))
+    imports = {
+        name: tuple(statistics.median(run["imports"].get(name, (0, 0))[i] for run in runs) for i in (0, 1))
+        for name in modules
+    }
+    datasets = {
+        name: {"seconds": statistics.median(run["datasets"].get(name, {}).get("seconds", 0) for run in runs),
+               "rows": runs[0]["datasets"][name]["rows"]}
+        for name in runs[0]["datasets"]
+    }
+    return {
+        "runs": len(runs),
+        "total_s": statistics.median(run["total_s"] for run in runs),
+        "rss": statistics.median(run["rss"] for run in runs),
+        "imports": imports,
+        "io": runs[0]["io"],
+        "datasets": datasets,
+    }
+
+
+def report(profile, top):
+    imports, io = profile["imports"], profile["io"]
+    app_modules = sorted((name for name in imports if name == "app" or name.startswith("app.")), key=lambda name: -imports[name][0])
+    packages = defaultdict(lambda: [0, 0])
+    for name, (self_us, _) in imports.items():
+        if not (name == "app" or name.startswith("app.")):
+            package = name.split(".")[0]
+            packages[package][0] += self_us
+            packages[package][1] += 1
+
+    print(f"Import de app.app : {profile['total_s']:.2f} s (médiane sur {profile['runs']} exécution(s)), "
+          f"RSS {profile['rss'] / 1024 / 1024:.0f} Mio\n")
+    print(f"{'Module':<32} {'propre ms':>10} {'cumulé ms':>10} {'fichiers':>9} {'Mio lus':>8} {'connexions':>11}")
+    for name in app_modules:
+        module_io = io.get(name, {})
+        print(f"{name:<32} {imports[name][0] / 1000:10.1f} {imports[name][1] / 1000:10.1f} {module_io.get('files', 0):>9}"
+              f" {module_io.get('bytes', 0) / 1024 / 1024:8.1f} {module_io.get('connections', 0):>11}")
+        for target in module_io.get("targets", []):
+            print(f"    {target}")
+
+    print(f"\n{'Paquet tiers':<32} {'propre ms':>10} {'modules':>10}")
+    for package, (self_us, count) in sorted(packages.items(), key=lambda item: -item[1][0])[:top]:
+        print(f"{package:<32} {self_us / 1000:10.1f} {count:>10}")
+
+    if profile["datasets"]:
+        print(f"\n{'Jeu de données chargé':<32} {'durée ms':>10} {'lignes':>10}")
+        for name, dataset in sorted(profile["datasets"].items(), key=lambda item: -item[1]["seconds"]):
+            print(f"{name:<32} {dataset['seconds'] * 1000:10.1f} {dataset['rows'] if dataset['rows'] is not None else '':>10}")
+
+    other_io = {name: module_io for name, module_io in io.items() if name not in app_modules}
+    if other_io:
+        print("\nEntrées/sorties hors modules de l'application :")
+        for name, module_io in sorted(other_io.items(), key=lambda item: -item[1]["bytes"])[:top]:
+            print(f"  {name:<30} {module_io['files']} fichier(s), {module_io['bytes'] / 1024 / 1024:.1f} Mio, "
+                  f"{module_io['connections']} connexion(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="stockage local généré par benchmarks/synthetic.py (sinon ASTHME_STORAGE)")
+    parser.add_argument("--repeat", type=int, default=3, help="nombre de démarrages mesurés")
+    parser.add_argument("--top", type=int, default=20, help="nombre de paquets tiers affichés")
+    parser.add_argument("--output", help="écrit le profil dans ce fichier json")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.result)
+        return
+    if args.data:
+        # Import dans le processus parent seulement : le processus mesuré n'importe que app.app
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from loadtest import use_local_storage
+
+        use_local_storage(args.data)
+
+    profile = median_runs([run_once() for _ in range(args.repeat)])
+    report(profile, args.top)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(profile, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+"""
+Test de charge du dashboard : parcours d'utilisateurs rejoués en parallèle contre app.server
+
+Les parcours sont des suites de requêtes de callbacks (/_dash-update-component), une ligne json par requête
+(session, t, payload), obtenues de deux façons :
+- enregistrées sur le dashboard réel : DASH_RECORD=sessions.jsonl python run.py (voir app/recording.py)
+- capturées par la commande capture, qui parcourt les pages comme le navigateur : chargement de la page, navigation
+  entre les pages, changements de semaine, choix de départements, changements de date et de type de pollen.
+  Chaque requête est envoyée au dashboard (client de test Flask) et sa réponse alimente les requêtes suivantes
+  (options des menus, contenu des pages, callbacks enchaînés).
+
+Commandes
+    capture : génère des parcours depuis les pages du dashboard
+    run : rejoue les parcours contre un serveur déjà démarré (--url)
+    sweep : démarre gunicorn pour chaque combinaison de workers et de threads, rejoue les parcours et recommande
+            une configuration (débit maximal sous l'objectif de latence p95, sans erreur)
+
+Chaque exécution donne, par callback : latences p50/p95/p99, débit et taux d'erreur.
+Les utilisateurs enchaînent leurs requêtes sans attente (capacité maximale) ; --think rejoue les temps de réflexion
+enregistrés (1 = temps réels, 0.1 = dix fois plus rapides).
+
+Usage
+    python benchmarks/loadtest.py capture --data /tmp/asthme-current --sessions 30 --output /tmp/sessions.jsonl
+    python benchmarks/loadtest.py run --url http://127.0.0.1:8050 --sessions-file /tmp/sessions.jsonl --users 8
+    python benchmarks/loadtest.py sweep --data /tmp/asthme-current --sessions-file /tmp/sessions.jsonl --workers 1 2 4 --threads 2 4 8
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_callbacks import configure  # noqa: E402
+
+DISPATCH_ROUTE = "/_dash-update-component"
+GUNICORN_CONFIG = os.path.join(ROOT, "deployment", "gunicorn_config.py")
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Deux requêtes d'un même client espacées de plus de SESSION_GAP secondes appartiennent à deux parcours distincts
+SESSION_GAP = 30 * 60
+# Temps de réflexion maximal rejoué entre deux requêtes (secondes)
+MAX_THINK = 30
+# Pages du dashboard : lien de navigation et propriétés que l'utilisateur modifie sur la page
+PAGES = {
+    "overview": ("overview-link", ["semaine-dropdown.value", "semaine-dropdown1.value", "semaine-dropdown2.value",
+                                   "classement-radio.value", "annee-dropdown.value", "mois-dropdown.value"]),
+    "polluants": ("polluants-link", ["dropdown-departement-nom.value", "dropdown-debut.value", "dropdown-fin.value",
+                                     "date-picker.date"]),
+    "pollen": ("pollen-link", ["date-dropdown.value", "pollen-dropdown.value", "ville-dropdown.value", "date-picker.date"]),
+}
+# Profondeur maximale des callbacks enchaînés (sortie d'un callback en entrée d'un autre)
+MAX_CHAIN = 5
+
+
+def use_local_storage(data_dir):
+    """
+    Fait lire au dashboard (et aux serveurs démarrés par sweep) le stockage local généré par benchmarks/synthetic.py
+    """
+    with open(os.path.join(data_dir, "synthetic.json"), encoding="utf-8") as file:
+        configure(os.path.abspath(data_dir), json.load(file), full_history=False)
+
+
+def label(payload):
+    # "..map-graph.figure...info-div.children.." -> "map-graph.figure+info-div.children"
+    return "+".join(payload.get("output", "?").strip(".").split("..."))
+
+
+class HeadlessBrowser:
+    """
+    Parcourt les pages du dashboard comme le navigateur : chaque modification d'une propriété déclenche les callbacks
+    qui en dépendent, leurs réponses mettent à jour les propriétés et les pages affichées, et déclenchent à leur tour
+    les callbacks enchaînés. Les requêtes envoyées constituent le parcours.
+    """
+    def __init__(self, app, session, rng):
+        from dash._utils import split_callback_id
+
+        self.client = app.server.test_client()
+        self.callbacks = app.callback_map
+        self.outputs = {key: split_callback_id(key) for key in self.callbacks}
+        self.session = session
+        self.rng = rng
+        self.props = {}
+        self.present = set()
+        self.subtrees = {}
+        self.t = 0.0
+        self.requests = []
+
+    def collect(self, node, found):
+        if isinstance(node, list):
+            for child in node:
+                self.collect(child, found)
+        elif isinstance(node, dict) and "props" in node:
+            props = node["props"]
+            if isinstance(props.get("id"), str):
+                found.add(props["id"])
+                for prop, value in props.items():
+                    if prop != "children":
+                        self.props[f"{props['id']}.{prop}"] = value
+            self.collect(props.get("children"), found)
+
+    def insert(self, container, tree):
+        """Affiche un nouveau contenu dans container (None : page entière) et lance ses callbacks initiaux"""
+        self.present -= self.subtrees.pop(container, set())
+        found = set()
+        self.collect(tree, found)
+        self.subtrees[container] = found
+        self.present |= found
+        for key, spec in self.callbacks.items():
+            ids = {item["id"] for item in spec["inputs"]}
+            if ids & found and ids <= self.present:
+                self.dispatch(key, [])
+
+    def triggered_by(self, spec, name):
+        # Seuls les callbacks dont toutes les entrées sont affichées sont déclenchés
+        inputs = [f"{item['id']}.{item['property']}" for item in spec["inputs"]]
+        return name in inputs and all(item["id"] in self.present for item in spec["inputs"])
+
+    def dispatch(self, key, changed, depth=0):
+        spec = self.callbacks[key]
+
+        def values(items):
+            return [{"id": item["id"], "property": item["property"], "value": self.props.get(f"{item['id']}.{item['property']}")}
+                    for item in items]
+
+        payload = {"output": key, "outputs": self.outputs[key], "inputs": values(spec["inputs"]),
+                   "changedPropIds": changed, "state": values(spec["state"])}
+        self.requests.append({"session": self.session, "t": round(self.t, 3), "payload": payload})
+        response = self.client.post(DISPATCH_ROUTE, json=payload)
+        if response.status_code != 200:  # 204 : mise à jour annulée (PreventUpdate)
+            return
+
+        for component, props in response.get_json()["response"].items():
+            for prop, value in props.items():
+                name = f"{component}.{prop}"
+                if prop == "children":
+                    self.insert(component, value)
+                    continue
+                modified = self.props.get(name) != value
+                self.props[name] = value
+                if modified and depth < MAX_CHAIN:
+                    for other, other_spec in self.callbacks.items():
+                        if other != key and self.triggered_by(other_spec, name):
+                            self.dispatch(other, [name], depth + 1)
+
+    def act(self, name, value, think):
+        """Modifie une propriété (action de l'utilisateur) après un temps de réflexion"""
+        self.t += think
+        self.props[name] = value
+        for key, spec in self.callbacks.items():
+            if self.triggered_by(spec, name):
+                self.dispatch(key, [name])
+
+    def choose(self, name):
+        """Valeur choisie par l'utilisateur pour une propriété : une option du menu ou une date du calendrier"""
+        component, prop = name.rsplit(".", 1)
+        if component not in self.present:
+            return None
+        if prop == "date":
+            last = self.props.get(f"{component}.max_date_allowed") or (datetime.today() - timedelta(days=1)).isoformat()
+            first = self.props.get(f"{component}.min_date_allowed") or last
+            first, last = datetime.fromisoformat(str(first)[:10]), datetime.fromisoformat(str(last)[:10])
+            span = max((last - first).days, 0)
+            return (last - timedelta(days=int(self.rng.integers(0, min(span, 60) + 1)))).strftime("%Y-%m-%d")
+        options = self.props.get(f"{component}.options") or []
+        choices = [option["value"] if isinstance(option, dict) else option for option in options]
+        choices = [choice for choice in choices if choice != self.props.get(name)]
+        return choices[int(self.rng.integers(len(choices)))] if choices else None
+
+    def browse(self, layout, actions, think):
+        """
+        Parcours complet : chargement de la page, puis chaque page visitée dans un ordre aléatoire avec quelques actions
+        """
+        self.insert(None, layout)
+        pages = ["overview"] + [page for page in self.rng.permutation(list(PAGES)) if page != "overview"]
+        for i, page in enumerate(pages):
+            link, properties = PAGES[page]
+            if i > 0:
+                self.act(f"{link}.n_clicks", (self.props.get(f"{link}.n_clicks") or 0) + 1, self.rng.uniform(*think))
+            for _ in range(int(self.rng.integers(actions[0], actions[1] + 1))):
+                name = properties[int(self.rng.integers(len(properties)))]
+                value = self.choose(name)
+                if value is not None:
+                    self.act(name, value, self.rng.uniform(*think))
+        return self.requests
+
+
+def capture(args):
+    import numpy as np
+    import plotly
+
+    if args.data:
+        use_local_storage(args.data)
+    else:
+        sys.path.insert(0, ROOT)
+    from app.app import app
+
+    layout = json.loads(json.dumps(app.layout, cls=plotly.utils.PlotlyJSONEncoder))
+    rng = np.random.default_rng(args.seed)
+    count = 0
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as file:
+        for i in range(args.sessions):
+            browser = HeadlessBrowser(app, f"capture-{i:03d}", rng)
+            for line in browser.browse(layout, (args.min_actions, args.max_actions), (2, 10)):
+                file.write(json.dumps(line, ensure_ascii=False) + "\n")
+                count += 1
+    print(f"{args.sessions} parcours ({count} requêtes) : {args.output}")
+
+
+def load_sessions(path):
+    """
+    Charge des parcours enregistrés ou capturés
+
+    Sortie
+        sessions (list) un parcours par session : liste de (attente en secondes depuis la requête précédente, payload)
+    """
+    by_client = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("payload"):
+                    by_client.setdefault(record["session"], []).append(record)
+    sessions = []
+    for records in by_client.values():
+        records.sort(key=lambda record: record["t"])
+        previous = None
+        for record in records:
+            if previous is None or record["t"] - previous > SESSION_GAP:
+                sessions.append([])
+                previous = record["t"]
+            sessions[-1].append((record["t"] - previous, record["payload"]))
+            previous = record["t"]
+    return sessions
+
+
+def replay(url, sessions, users, duration, think=0.0, ramp=0.0, timeout=60, seed=0):
+    """
+    Rejoue les parcours avec `users` utilisateurs simultanés pendant `duration` secondes
+
+    Sortie
+        samples (list) une mesure par requête : (callback, latence en secondes, code HTTP ou None si la requête a échoué)
+        elapsed (float) durée effective du test
+    """
+    samples = []
+    start = time.monotonic()
+    stop = start + duration
+
+    def user(index):
+        time.sleep(ramp * index / max(users, 1))
+        rng = random.Random(seed + index)
+        http = requests.Session()
+        while time.monotonic() < stop:
+            for wait, payload in rng.choice(sessions):
+                if think:
+                    time.sleep(min(wait * think, MAX_THINK))
+                if time.monotonic() >= stop:
+                    break
+                sent = time.perf_counter()
+                try:
+                    status = http.post(url + DISPATCH_ROUTE, json=payload, timeout=timeout).status_code
+                except requests.RequestException:
+                    status = None
+                samples.append((label(payload), time.perf_counter() - sent, status))
+
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        for future in [executor.submit(user, index) for index in range(users)]:
+            future.result()
+    return samples, time.monotonic() - start
+
+
+def percentile(values, q):
+    # Rang le plus proche sur des valeurs triées
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+def summarize(samples, elapsed):
+    """
+    Latences p50/p95/p99 (ms), débit (requêtes/s) et taux d'erreur par callback, et pour l'ensemble (total)
+    """
+    groups = {"total": samples}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+    summary = {}
+    for name, group in groups.items():
+        latencies = sorted(latency for _, latency, _ in group)
+        errors = sum(1 for _, _, status in group if status is None or status >= 400)
+        summary[name] = {
+            "requests": len(group),
+            "throughput_rps": round(len(group) / elapsed, 2) if elapsed else None,
+            "error_rate": round(errors / len(group), 4),
+            "p50_ms": round(1000 * percentile(latencies, 50), 1),
+            "p95_ms": round(1000 * percentile(latencies, 95), 1),
+            "p99_ms": round(1000 * percentile(latencies, 99), 1),
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"  {'callback':<52}{'requêtes':>9}{'req/s':>9}{'erreurs':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, stats in sorted(summary.items(), key=lambda item: (item[0] == "total", -item[1]["p95_ms"])):
+        print(f"  {name[:52]:<52}{stats['requests']:>9}{stats['throughput_rps']:>9}{stats['error_rate']:>9.1%}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+
+
+def process_tree_rss(pid):
+    """
+    Mémoire résidente cumulée d'un processus et de ses enfants (Mo), None hors Linux
+    """
+    try:
+        parents = {}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as file:
+                        # Le nom du processus (entre parenthèses) peut contenir des espaces
+                        parents[int(entry)] = int(file.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+        pids, total = [pid], 0
+        while pids:
+            current = pids.pop()
+            with open(f"/proc/{current}/statm") as file:
+                total += int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            pids += [child for child, parent in parents.items() if parent == current]
+        return round(total / 2 ** 20, 1)
+    except OSError:
+        return None
+
+
+def wait_ready(url, process, workers, timeout):
+    """
+    Attend que tous les workers aient chargé le dashboard : chaque worker se signale sur /metrics (asthme_worker_info)
+    """
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            # Nouvelle connexion à chaque essai pour être servi par des workers différents
+            response = requests.get(url + "/metrics", timeout=5, headers={"Connection": "close"})
+            seen.update(re.findall(r'asthme_worker_info\{worker="(\d+)"\}', response.text))
+            if len(seen) >= workers:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def run_server(workers, threads, port, log):
+    command = [
+        sys.executable, "-m", "gunicorn", "-c", GUNICORN_CONFIG, "--workers", str(workers), "--threads", str(threads),
+        "--bind", f"127.0.0.1:{port}", "app.app:server",
+    ]
+    return subprocess.Popen(command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def stop_server(process):
+    if process.poll() is None:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+def recommend(runs, p95_target_ms, max_error_rate):
+    """
+    Configuration recommandée : débit maximal parmi celles qui tiennent l'objectif p95 sans dépasser le taux d'erreur ;
+    à débit comparable (5 %), la moins gourmande (chaque worker charge sa propre copie des données)
+    """
+    valid = [run for run in runs if run["summary"].get("total")]
+    within = [run for run in valid
+              if run["summary"]["total"]["error_rate"] <= max_error_rate and run["summary"]["total"]["p95_ms"] <= p95_target_ms]
+    if not within:
+        best = min(valid, key=lambda run: run["summary"]["total"]["p95_ms"], default=None)
+        return best, f"aucune configuration ne tient p95 <= {p95_target_ms} ms : latence la plus basse"
+    best_throughput = max(run["summary"]["total"]["throughput_rps"] for run in within)
+    candidates = [run for run in within if run["summary"]["total"]["throughput_rps"] >= 0.95 * best_throughput]
+    best = min(candidates, key=lambda run: (run["workers"], run["rss_mb"] or 0, run["threads"]))
+    return best, f"débit maximal sous p95 <= {p95_target_ms} ms, au moindre coût mémoire"
+
+
+def write_results(results, output, name):
+    output = output or os.path.join(DEFAULT_RESULTS, f"{name}-{datetime.now():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+    print(f"Résultats : {output}")
+
+
+def run(args):
+    sessions = load_sessions(args.sessions_file)
+    print(f"{len(sessions)} parcours, {args.users} utilisateurs, {args.duration} s contre {args.url}")
+    samples, elapsed = replay(args.url, sessions, args.users, args.duration, args.think, args.ramp, args.timeout, args.seed)
+    summary = summarize(samples, elapsed)
+    print_summary(summary)
+    write_results({
+        "meta": {"date": datetime.now().isoformat(timespec="seconds"), "url": args.url, "users": args.users,
+                 "duration_s": args.duration, "think": args.think, "sessions": len(sessions)},
+        "summary": summary,
+    }, args.output, "loadtest")
+
+
+def sweep(args):
+    if args.data:
+        use_local_storage(args.data)
+    sessions = load_sessions(args.sessions_file)
+    url = f"http://127.0.0.1:{args.port}"
+    runs = []
+    for workers in args.workers:
+        for threads in args.threads:
+            print(f"\ngunicorn --workers {workers} --threads {threads} : {args.users} utilisateurs, {args.duration} s")
+            with tempfile.TemporaryFile("w+") as log:
+                process = run_server(workers, threads, args.port, log)
+                try:
+                    if not wait_ready(url, process, workers, args.startup_timeout):
+                        log.seek(0)
+                        raise RuntimeError(f"Le serveur n'a pas démarré :\n{log.read()[-3000:]}")
+                    samples, elapsed = replay(url, sessions, args.users, args.duration, args.think, args.ramp, args.timeout, args.seed)
+                    rss = process_tree_rss(process.pid)
+                finally:
+                    stop_server(process)
+            summary = summarize(samples, elapsed)
+            print_summary(summary)
+            runs.append({"workers": workers, "threads": threads, "rss_mb": rss, "summary": summary})
+
+    best, reason = recommend(runs, args.p95_target, args.max_error_rate)
+    print(f"\n{'workers':>8}{'threads':>8}{'req/s':>9}{'erreurs':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS Mo':>9}")
+    for item in runs:
+        total = item["summary"].get("total", {})
+        print(f"{item['workers']:>8}{item['threads']:>8}{total.get('throughput_rps', 0):>9}{total.get('error_rate', 1):>9.1%}"
+              f"{total.get('p95_ms', 0):>9}{total.get('p99_ms', 0):>9}{str(item['rss_mb']):>9}")
+    if best:
+        print(f"\nRecommandation : workers = {best['workers']}, threads = {best['threads']} ({reason})")
+    write_results({
+        "meta": {"date": datetime.now().isoformat(timespec="seconds"), "users": args.users, "duration_s": args.duration,
+                 "think": args.think, "sessions": len(sessions), "p95_target_ms": args.p95_target},
+        "runs": runs,
+        "recommendation": {"workers": best["workers"], "threads": best["threads"], "reason": reason} if best else None,
+    }, args.output, "sweep")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_capture = commands.add_parser("capture", help="génère des parcours depuis les pages du dashboard")
+    parser_capture.add_argument("--data", help="stockage local généré par benchmarks/synthetic.py (S3 par défaut)")
+    parser_capture.add_argument("--sessions", type=int, default=20, help="nombre de parcours")
+    parser_capture.add_argument("--min-actions", type=int, default=2, help="actions minimales par page visitée")
+    parser_capture.add_argument("--max-actions", type=int, default=6, help="actions maximales par page visitée")
+    parser_capture.add_argument("--seed", type=int, default=0, help="graine du générateur aléatoire")
+    parser_capture.add_argument("--output", required=True, help="fichier jsonl des parcours")
+
+    for name, help_text in (("run", "rejoue les parcours contre un serveur démarré"),
+                            ("sweep", "compare des configurations gunicorn et en recommande une")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--sessions-file", required=True, help="parcours enregistrés (DASH_RECORD) ou capturés")
+        command.add_argument("--users", type=int, default=8, help="utilisateurs simultanés")
+        command.add_argument("--duration", type=float, default=30, help="durée du test (secondes)")
+        command.add_argument("--think", type=float, default=0.0, help="facteur appliqué aux temps de réflexion enregistrés")
+        command.add_argument("--ramp", type=float, default=0.0, help="durée de montée en charge (secondes)")
+        command.add_argument("--timeout", type=float, default=60, help="délai maximal d'une requête (secondes)")
+        command.add_argument("--seed", type=int, default=0, help="graine du choix des parcours")
+        command.add_argument("--output", help="fichier json des résultats (par défaut dans benchmarks/results/)")
+        if name == "run":
+            command.add_argument("--url", default="http://127.0.0.1:8050", help="adresse du dashboard")
+        else:
+            command.add_argument("--data", help="stockage local généré par benchmarks/synthetic.py (S3 par défaut)")
+            command.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="nombres de workers à comparer")
+            command.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8], help="nombres de threads à comparer")
+            command.add_argument("--port", type=int, default=8060, help="port des serveurs démarrés")
+            command.add_argument("--startup-timeout", type=float, default=300, help="délai de chargement des workers (secondes)")
+            command.add_argument("--p95-target", type=float, default=1000, help="objectif de latence p95 (ms)")
+            command.add_argument("--max-error-rate", type=float, default=0.0, help="taux d'erreur toléré")
+
+    args = parser.parse_args()
+    {"capture": capture, "run": run, "sweep": sweep}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+Serveurs de rejeu locaux pour pollens.fr et l'API Geodair, et enregistrement des réponses réelles servant de fixtures
+
+Les scrapers visent ces serveurs par leur URL de base : POLLENS_URL (ou PollenDataScraper(base_url=...)) et
+GEODAIR_API_URL (ou geodair.api_url). Les débits, le parallélisme et les attentes entre nouvelles tentatives se
+mesurent alors hors ligne, de façon reproductible et sans solliciter les sites réels.
+
+Fixtures (--fixtures, benchmarks/fixtures par défaut)
+- pollens/index.html, pollens/page_<ville>_<pollen>.html : pages ville/pollen (aussi lues par bench_pollen_parse.py)
+- geodair/station.csv : export des stations
+- geodair/<MaxJH|MoyH>_<code polluant>.csv : exports des polluants, geodair/exports.json : nombre de réponses 202
+  reçues et délai avant que chaque export soit prêt
+En l'absence de fixture, les serveurs répondent avec des pages et des exports synthétiques de même format.
+
+Comportement des serveurs
+- --latency, --jitter : délai ajouté à chaque réponse (ms)
+- --error-rate : part des requêtes en erreur 503 (nouvelles tentatives et attente exponentielle des scrapers)
+- --ready-delay, --ready-polls : un export n'est prêt (200) qu'après ce délai depuis sa demande et ce nombre de
+  réponses 202 sur /download (par défaut, le nombre médian de 202 enregistré, sinon 1)
+
+Usage
+    python benchmarks/stand_in.py record-pollens --pages 10
+    python benchmarks/stand_in.py record-geodair --date 2025-03-01
+    python benchmarks/stand_in.py serve-pollens --port 8101 --latency 150
+    python benchmarks/stand_in.py serve-geodair --port 8102 --ready-delay 5
+    python benchmarks/stand_in.py bench-pollen --workers 1 4 8 --rps 0 --latency 200 --cities 10
+    python benchmarks/stand_in.py bench-geodair --poll-delay 1 0.25 --ready-delay 3
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import geodair  # noqa: E402
+from bench_geodair import export_frame  # noqa: E402
+from bench_pollen_parse import BASE_URL, save_pages, synthetic_page  # noqa: E402
+from synthetic import daily_measures, station_dim  # noqa: E402
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+INDEX_PATH = "/les-risques/risques-par-ville/1/54/2025"
+PAGE_PATTERN = re.compile(r"^/les-risques/risques-par-ville/(\d+)/(\d+)(?:/\d+)?/?$")
+EXPORT_KINDS = ("MaxJH", "MoyH")
+# Taille des réponses synthétiques de l'API Geodair
+SYNTHETIC_STATIONS = 650
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Requêtes GET d'un serveur de rejeu : délai et erreurs simulés, puis réponse de route() (code, corps, type)
+    """
+    protocol_version = "HTTP/1.1"  # connexions persistantes, comme les sessions requests des scrapers
+
+    def do_GET(self):
+        server = self.server
+        time.sleep((server.latency + random.uniform(0, server.jitter)) / 1000)
+        if server.error_rate and random.random() < server.error_rate:
+            status, body, content_type = 503, "Service indisponible".encode(), "text/plain"
+        else:
+            url = urlparse(self.path)
+            status, body, content_type = self.route(url.path, {key: values[0] for key, values in parse_qs(url.query).items()})
+        with server.lock:
+            server.stats[status] += 1
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, path, params):
+        return 404, b"Not Found", "text/plain"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class PollensHandler(StandInHandler):
+    def route(self, path, params):
+        match = PAGE_PATTERN.match(path)
+        if not match:
+            return super().route(path, params)
+        return 200, self.server.fixtures.page(path, *match.groups()), "text/html"
+
+
+class GeodairHandler(StandInHandler):
+    def route(self, path, params):
+        fixtures = self.server.fixtures
+        path = path[len(self.server.prefix):] if path.startswith(self.server.prefix) else path
+        if path == "/station/export":
+            return 200, fixtures.station(), "text/csv"
+        kind = path.strip("/").split("/")[0]
+        if path.endswith("/export") and kind in EXPORT_KINDS:
+            return 200, fixtures.request_export(kind, params.get("polluant"), params.get("date")).encode(), "text/plain"
+        if path == "/download":
+            status, body = fixtures.download(params.get("id"))
+            return status, body, "text/csv" if status == 200 else "text/plain"
+        return super().route(path, params)
+
+
+class PollensFixtures:
+    """
+    Pages ville/pollen : page enregistrée si elle existe, sinon une autre page enregistrée (choix stable), sinon
+    une page synthétique
+    """
+    def __init__(self, directory, cities=90, pollens=20):
+        self.directory = directory
+        self.pages = sorted(name for name in os.listdir(directory) if name.startswith("page_")) if os.path.isdir(directory) else []
+        self.cities = cities
+        self.pollens = pollens
+        self.cache = {}
+
+    def read(self, name):
+        if name not in self.cache:
+            with open(os.path.join(self.directory, name), "rb") as file:
+                self.cache[name] = file.read()
+        return self.cache[name]
+
+    def page(self, path, city, pollen):
+        if path.rstrip("/") == INDEX_PATH and os.path.exists(os.path.join(self.directory, "index.html")):
+            return self.read("index.html")
+        name = f"page_{city}_{pollen}.html"
+        if name in self.pages:
+            return self.read(name)
+        if self.pages:
+            return self.read(self.pages[(int(city) * 31 + int(pollen)) % len(self.pages)])
+        if "synthetic" not in self.cache:
+            self.cache["synthetic"] = synthetic_page(self.cities, self.pollens)
+        return self.cache["synthetic"]
+
+
+class GeodairFixtures:
+    """
+    Exports de l'API Geodair : demande (identifiant), puis 202 sur /download jusqu'à ce que l'export soit prêt, puis 200
+    """
+    def __init__(self, directory, ready_delay=None, ready_polls=None, stations=SYNTHETIC_STATIONS, seed=0):
+        self.directory = directory
+        recorded = self.read_json("exports.json").get("exports", {})
+        polls = [export["polls_202"] for export in recorded.values()]
+        delays = [export["ready_after_s"] for export in recorded.values()]
+        self.ready_polls = ready_polls if ready_polls is not None else (int(statistics.median(polls)) if polls else 1)
+        self.ready_delay = ready_delay if ready_delay is not None else 0.0
+        self.recorded_delay = statistics.median(delays) if delays else None
+        self.exports = {}
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng(seed)
+        self.df_dim = station_dim(stations, self.rng)
+        self.cache = {}
+
+    def read_json(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def read(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            return file.read()
+
+    def station(self):
+        body = self.read("station.csv")
+        if body is None:
+            df = self.df_dim.drop(columns=["code_departement", "departement"])
+            body = df.to_csv(sep=";", index=False, lineterminator="\n").encode()
+        return body
+
+    def request_export(self, kind, code, date_str):
+        export_id = uuid.uuid4().hex
+        with self.lock:
+            self.exports[export_id] = {"kind": kind, "code": code, "date": date_str, "requested": time.monotonic(), "polls": 0}
+        return export_id
+
+    def download(self, export_id):
+        with self.lock:
+            export = self.exports.get(export_id)
+            if export is None:
+                return 404, "Export inconnu".encode()
+            ready = export["polls"] >= self.ready_polls and time.monotonic() - export["requested"] >= self.ready_delay
+            export["polls"] += 1
+        if not ready:
+            return 202, "Le fichier n'est pas encore prêt".encode()
+        return 200, self.export_body(export["kind"], export["code"], export["date"])
+
+    def export_body(self, kind, code, date_str):
+        body = self.read(f"{kind}_{code}.csv")
+        if body is not None:
+            return body
+        key = (kind, code, date_str)
+        with self.lock:
+            if key not in self.cache:
+                # Pics journaliers synthétiques des stations mesurant ce polluant, à la date demandée
+                name = dict(zip(geodair.polluants["code"], geodair.polluants["name"])).get(code, code)
+                day = pd.DatetimeIndex([pd.Timestamp(date_str or datetime.today() - timedelta(days=1))])
+                df_fact = daily_measures(self.df_dim, day, self.rng)
+                df = export_frame(df_fact[df_fact["polluant"] == name], self.df_dim)
+                self.cache[key] = df.to_csv(sep=";", index=False, lineterminator="\n").encode()
+            return self.cache[key]
+
+
+def start_server(handler, fixtures, port=0, latency=0, jitter=0, error_rate=0, prefix="", verbose=False):
+    """
+    Démarre un serveur de rejeu dans un thread
+
+    Sortie
+        server (ThreadingHTTPServer) serveur démarré (server.url : URL de base, server.stats : réponses par code)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.fixtures = fixtures
+    server.latency, server.jitter, server.error_rate = latency, jitter, error_rate
+    server.prefix = prefix
+    server.verbose = verbose
+    server.lock = threading.Lock()
+    server.stats = Counter()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}{prefix}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def record_pollens(directory, pages):
+    """
+    Enregistre la page des sélecteurs (villes, pollens) puis quelques pages ville/pollen réelles
+    """
+    import requests
+
+    os.makedirs(directory, exist_ok=True)
+    response = requests.get(BASE_URL.replace("/les-risques/risques-par-ville", "") + INDEX_PATH, timeout=30)
+    response.raise_for_status()
+    with open(os.path.join(directory, "index.html"), "wb") as file:
+        file.write(response.content)
+    print(f"Page des sélecteurs enregistrée ({len(response.content)} octets)")
+    save_pages(directory, pages)
+
+
+def record_geodair(directory, date_str, kinds=("MaxJH",), source=None, timeout=15 * 60):
+    """
+    Enregistre l'export des stations et les exports de chaque polluant, en consignant le déroulé 202 puis 200
+    """
+    source = (source or geodair.api_url).rstrip("/")
+    os.makedirs(directory, exist_ok=True)
+    session = geodair.create_session()
+    response = session.get(f"{source}/station/export", params={"date": date_str}, headers={"accept": "text/csv"}, timeout=60)
+    response.raise_for_status()
+    with open(os.path.join(directory, "station.csv"), "wb") as file:
+        file.write(response.content)
+    print(f"Export des stations enregistré ({len(response.content)} octets)")
+
+    recorded = {"date": date_str, "exports": {}}
+    for kind in kinds:
+        for code, name in zip(geodair.polluants["code"], geodair.polluants["name"]):
+            response = session.get(f"{source}/{kind}/export", params={"date": date_str, "polluant": code}, timeout=60)
+            response.raise_for_status()
+            requested, polls = time.monotonic(), 0
+            while True:
+                download = session.get(f"{source}/download", params={"id": response.text.strip()}, timeout=60)
+                if download.status_code != 202 or time.monotonic() - requested > timeout:
+                    break
+                polls += 1
+                time.sleep(1)
+            download.raise_for_status()
+            with open(os.path.join(directory, f"{kind}_{code}.csv"), "wb") as file:
+                file.write(download.content)
+            recorded["exports"][f"{kind}_{code}"] = {
+                "polls_202": polls, "ready_after_s": round(time.monotonic() - requested, 1), "bytes": len(download.content),
+            }
+            print(f"Export {kind} {name} enregistré : {polls} réponse(s) 202, {len(download.content)} octets")
+    with open(os.path.join(directory, "exports.json"), "w", encoding="utf-8") as file:
+        json.dump(recorded, file, indent=2)
+
+
+def bench_pollen(args, fixtures_dir):
+    from pollen import PollenDataScraper
+
+    server = start_server(PollensHandler, PollensFixtures(fixtures_dir, args.cities, args.pollens),
+                          latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    results = []
+    for workers in args.workers:
+        for rps in args.rps:
+            server.stats.clear()
+            scraper = PollenDataScraper("bench", "pollen.csv", max_workers=workers, requests_per_second=rps,
+                                        backoff_factor=args.backoff, base_url=server.url)
+            start = time.perf_counter()
+            df = scraper.fetch_pollen_data()
+            elapsed = time.perf_counter() - start
+            requests_count = sum(server.stats.values())
+            results.append({"workers": workers, "rps": rps, "seconds": round(elapsed, 2), "requests": requests_count,
+                            "pages_per_s": round(requests_count / elapsed, 1), "rows": len(df), "errors": server.stats[503]})
+            print(f"workers {workers:>3}  rps {rps:>5}  {elapsed:8.2f} s  {requests_count:>6} requêtes"
+                  f"  {requests_count / elapsed:7.1f} pages/s  {server.stats[503]} erreur(s)")
+    server.shutdown()
+    return results
+
+
+def bench_geodair(args, fixtures_dir):
+    server = start_server(GeodairHandler, GeodairFixtures(fixtures_dir, args.ready_delay, args.ready_polls),
+                          latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, prefix="/api-ext")
+    geodair.api_url = server.url
+    date_str = (datetime.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+    results = []
+    for poll_delay in args.poll_delay:
+        server.stats.clear()
+        geodair.export_poll_delay = poll_delay
+        start = time.perf_counter()
+        frames = geodair.fetch_exports(f"{server.url}/MaxJH/export", date_str)
+        elapsed = time.perf_counter() - start
+        results.append({"poll_delay": poll_delay, "seconds": round(elapsed, 2), "exports": len(frames),
+                        "rows": sum(len(frame) for frame in frames), "responses": dict(server.stats)})
+        print(f"attente initiale {poll_delay:>5} s  {elapsed:8.2f} s  {len(frames)} export(s)  réponses {dict(server.stats)}")
+    server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="dossier des fixtures")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record-pollens", help="enregistre des pages réelles de pollens.fr")
+    record.add_argument("--pages", type=int, default=10, help="nombre de pages ville/pollen")
+    record = commands.add_parser("record-geodair", help="enregistre des exports réels de l'API Geodair")
+    record.add_argument("--date", default=(datetime.today() - timedelta(days=1)).strftime("%Y-%m-%d"), help="date des exports")
+    record.add_argument("--kinds", nargs="+", choices=EXPORT_KINDS, default=["MaxJH"], help="exports à enregistrer")
+
+    for name in ("serve-pollens", "serve-geodair", "bench-pollen", "bench-geodair"):
+        command = commands.add_parser(name)
+        command.add_argument("--latency", type=float, default=0, help="délai de chaque réponse (ms)")
+        command.add_argument("--jitter", type=float, default=0, help="délai aléatoire supplémentaire (ms)")
+        command.add_argument("--error-rate", type=float, default=0, help="part des réponses en erreur 503")
+        if name.startswith("serve"):
+            command.add_argument("--port", type=int, default=8101 if name == "serve-pollens" else 8102, help="port d'écoute")
+            command.add_argument("--verbose", action="store_true", help="journalise chaque requête")
+        if name.endswith("pollens") or name == "bench-pollen":
+            command.add_argument("--cities", type=int, default=90, help="villes de la page synthétique (sans fixture)")
+            command.add_argument("--pollens", type=int, default=20, help="pollens de la page synthétique (sans fixture)")
+        else:
+            command.add_argument("--ready-delay", type=float, help="délai avant qu'un export soit prêt (secondes)")
+            command.add_argument("--ready-polls", type=int, help="réponses 202 avant qu'un export soit prêt")
+        if name == "bench-pollen":
+            command.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="valeurs de max_workers")
+            command.add_argument("--rps", type=float, nargs="+", default=[0], help="valeurs de requests_per_second (0 : sans limite)")
+            command.add_argument("--backoff", type=float, default=1.0, help="backoff_factor des nouvelles tentatives")
+        if name == "bench-geodair":
+            command.add_argument("--poll-delay", type=float, nargs="+", default=[1.0], help="valeurs de export_poll_delay (secondes)")
+        if name.startswith("bench"):
+            command.add_argument("--json", help="écrit les résultats dans ce fichier json")
+
+    args = parser.parse_args()
+    pollens_dir, geodair_dir = os.path.join(args.fixtures, "pollens"), os.path.join(args.fixtures, "geodair")
+
+    if args.command == "record-pollens":
+        record_pollens(pollens_dir, args.pages)
+    elif args.command == "record-geodair":
+        record_geodair(geodair_dir, args.date, args.kinds)
+    elif args.command.startswith("serve"):
+        if args.command == "serve-pollens":
+            server = start_server(PollensHandler, PollensFixtures(pollens_dir, args.cities, args.pollens), args.port,
+                                  args.latency, args.jitter, args.error_rate, verbose=args.verbose)
+            print(f"pollens.fr rejoué sur {server.url} (POLLENS_URL={server.url})")
+        else:
+            server = start_server(GeodairHandler, GeodairFixtures(geodair_dir, args.ready_delay, args.ready_polls), args.port,
+                                  args.latency, args.jitter, args.error_rate, prefix="/api-ext", verbose=args.verbose)
+            print(f"API Geodair rejouée sur {server.url} (GEODAIR_API_URL={server.url})")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        bench = bench_pollen if args.command == "bench-pollen" else bench_geodair
+        results = bench(args, pollens_dir if args.command == "bench-pollen" else geodair_dir)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
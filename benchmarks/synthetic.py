@@ -0,0 +1,269 @@
+"""
+Générateur de jeux de données synthétiques pour les benchmarks du dashboard
+
+Produit, dans un stockage local au format publié par les collectes (même arborescence que ASTHME_STORAGE=fs:<dossier>) :
+- geodes/ : instantanés parquet annuels et manifeste (passages aux urgences par semaine et département)
+- geodair/ : historiques journaliers et IQA partitionnés par mois, historique hebdomadaire et dimension station,
+  publiés par versions derrière geodair/current.json
+- pollen/ : partitions mensuelles et manifeste (niveaux de pollen par ville, pollen et jour)
+- communes.geojson : contours synthétiques des villes (carte des pollens sans accès réseau)
+
+Les fichiers sont écrits par les fonctions des scripts de collecte (partitions, IQA, agrégation hebdomadaire,
+publication) : leur format est celui de la production.
+
+Usage
+    python benchmarks/synthetic.py --scale current --output /tmp/asthme-current
+    python benchmarks/synthetic.py --years 10 --stations 650 --cities 90 --output /tmp/asthme-max
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import geodair  # noqa: E402
+import geodes_store  # noqa: E402
+from partitions import MANIFEST, partition_keys, partition_path, register_partition, save_manifest  # noqa: E402
+from publish import publish_version  # noqa: E402
+from storage import LocalStorageClient  # noqa: E402
+
+BUCKET_NAME = "bucket-asthme-scraping"
+
+# Échelles prédéfinies : taille actuelle de la production, puis jusqu'à 10 ans × toutes les stations × toutes les villes
+SCALES = {
+    "current": {"years": 1, "stations": 150, "cities": 30},
+    "medium": {"years": 3, "stations": 400, "cities": 60},
+    "max": {"years": 10, "stations": 650, "cities": 90},
+}
+
+POLLENS = [
+    "Aulne", "Armoise", "Bouleau", "Charme", "Châtaignier", "Chêne", "Cupressacées", "Frêne", "Graminées",
+    "Noisetier", "Olivier", "Oseille", "Peuplier", "Plantain", "Platane", "Saule", "Tilleul", "Urticacées", "Ambroisie",
+]
+# Ordre de grandeur des pics journaliers par polluant (µg/m3)
+POLLUTANT_SCALE = {"SO2": 5, "NO2": 30, "O3": 80, "PM10": 25, "PM2.5": 15}
+
+
+@contextmanager
+def workdir(path):
+    # Les scripts de collecte travaillent dans le dossier courant (historiques partitionnés, dimension station)
+    previous = os.getcwd()
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def city_names(n):
+    return [f"Ville-{i:03d}" for i in range(1, n + 1)]
+
+
+def station_dim(n_stations, rng):
+    """
+    Dimension station : une station par code_site, répartie sur tous les départements et sur quelques communes chacun
+    """
+    codes = list(geodair.departements)
+    dept = [codes[i % len(codes)] for i in range(n_stations)]
+    commune = [f"Commune-{code}-{i % 3}" for i, code in enumerate(dept)]
+    return pd.DataFrame({
+        "code_site": [f"FR{10001 + i}" for i in range(n_stations)],
+        "organisme": "AASQA",
+        "code_zas": [f"ZAS{code}" for code in dept],
+        "zas": [f"Zone {code}" for code in dept],
+        "nom_site": [f"Site {i:04d}" for i in range(n_stations)],
+        "type_d'implantation": rng.choice(["Urbaine", "Périurbaine", "Rurale"], n_stations),
+        "type_d'influence": rng.choice(["Fond", "Trafic", "Industrielle"], n_stations),
+        "code_commune": [f"{code}{i % 1000:03d}" for i, code in enumerate(dept)],
+        "commune": commune,
+        "longitude": rng.uniform(-4.5, 8.0, n_stations).round(5),
+        "latitude": rng.uniform(42.5, 51.0, n_stations).round(5),
+        "code_departement": dept,
+        "departement": [geodair.departements[code] for code in dept],
+    })
+
+
+def daily_measures(df_dim, days, rng):
+    """
+    Pics journaliers (table de faits) : chaque station mesure de 2 à 4 polluants
+    """
+    polluants = geodair.polluants["name"]
+    pairs = [
+        (site, polluant)
+        for site in df_dim["code_site"]
+        for polluant in rng.choice(polluants, rng.integers(2, 5), replace=False)
+    ]
+    sites, measured = map(np.array, zip(*pairs))
+    n = len(days) * len(pairs)
+    debut = np.repeat(days.values, len(pairs))
+    scale = np.tile([POLLUTANT_SCALE[p] for p in measured], len(days))
+    season = np.repeat(1 + 0.4 * np.sin(2 * np.pi * days.dayofyear.values / 365.25), len(pairs))
+    return pd.DataFrame({
+        "date_de_debut": debut,
+        "date_de_fin": debut + np.timedelta64(23, "h"),
+        "code_site": np.tile(sites, len(days)),
+        "polluant": np.tile(measured, len(days)),
+        "type_de_valeur": "Max journalier",
+        "valeur": (rng.gamma(2.0, 0.5, n) * scale * season).round(1),
+        "unite_de_mesure": "µg-m3",
+        "code_qualite": "A",
+        "validite": 1,
+    })
+
+
+def generate_geodair(output, df_dim, days, rng):
+    """
+    Historiques Geodair écrits et publiés par les fonctions du script de collecte, une année à la fois
+    """
+    with workdir(os.path.join(output, "work", "geodair")):
+        df_dim.to_csv(geodair.csv_station_dim, sep=";", index=False, encoding="utf-8", lineterminator="\n")
+        written = [geodair.csv_station_dim]
+        rows = 0
+        for _, year_days in pd.Series(days).groupby(days.year):
+            df_fact = daily_measures(df_dim, pd.DatetimeIndex(year_days), rng)
+            rows += len(df_fact)
+            written += geodair.update_daily_partitions(df_fact, df_dim)
+            written += geodair.aggregate_weekly(df_daily=df_fact)
+        publish_version(LocalStorageClient(output), BUCKET_NAME, written, geodair.publish_prefix)
+    return rows
+
+
+def generate_geodes(output, days, rng):
+    """
+    Passages aux urgences pour asthme : une ligne par semaine et par département, stockage long format (parquet par année)
+    """
+    mondays = days[days.dayofweek == 0]
+    names = list(geodair.departements.values())
+    level = rng.uniform(30, 150, len(names))
+    frames = []
+    for monday in mondays:
+        iso = monday.isocalendar()
+        season = 1 + 0.5 * np.cos(2 * np.pi * (iso[1] - 40) / 52)
+        frames.append(pd.DataFrame({
+            "Semaine": f"{iso[0]}-S{iso[1]:02d}",
+            "Annee": iso[0],
+            "Mois": monday.strftime("%b"),
+            "Département": names,
+            "Passages": (level * season * rng.uniform(0.8, 1.2, len(names))).round(1),
+        }))
+    df_long = pd.concat(frames, ignore_index=True)
+
+    s3 = LocalStorageClient(output)
+    local_root = os.path.join(output, "work", "geodes")
+    os.makedirs(local_root, exist_ok=True)
+    manifest = {"partitions": {}, "departements": names}
+    for annee, df_year in df_long.groupby("Annee", sort=True):
+        geodes_store.upload_snapshot(s3, BUCKET_NAME, manifest, str(annee), df_year.reset_index(drop=True), local_root=local_root)
+    manifest["last_week"] = df_long["Semaine"].iloc[-1]
+    manifest["last_partition"] = str(df_long["Annee"].iloc[-1])
+    geodes_store.upload_manifest(s3, BUCKET_NAME, manifest, local_root=local_root)
+    return len(df_long)
+
+
+def generate_pollen(output, cities, days, rng):
+    """
+    Niveaux de pollen par ville, pollen et jour (saison propre à chaque pollen), partitions mensuelles et manifeste
+    """
+    s3 = LocalStorageClient(output)
+    local_root = os.path.join(output, "work", "pollen")
+    os.makedirs(local_root, exist_ok=True)
+    peaks = {pollen: rng.integers(30, 300) for pollen in POLLENS}
+    manifest = {"partitions": {}, "high_water": {}, "previous_year": {}}
+    rows = 0
+    for key, month_days in pd.Series(days).groupby(partition_keys(pd.Series(days)).values):
+        month_days = pd.DatetimeIndex(month_days)
+        grid = pd.MultiIndex.from_product([cities, POLLENS, month_days], names=["Ville", "Pollen", "date"]).to_frame(index=False)
+        distance = np.abs(grid["date"].dt.dayofyear.values - grid["Pollen"].map(peaks).values)
+        level = np.clip(np.round(3 * np.exp(-(distance / 30) ** 2) + rng.normal(0, 0.3, len(grid))), 0, 3)
+        df = grid.assign(level=level.astype(int), RealLevelValue=(level * 10 + rng.integers(0, 10, len(grid))).astype(int))
+        df = df.sort_values(["Ville", "Pollen", "date"], ascending=[True, True, False])
+        register_partition(manifest, key, df, "date")
+        path = partition_path(local_root, key)
+        df.assign(date=df["date"].dt.strftime("%Y-%m-%d")).to_csv(path, index=False)
+        s3.upload_file(path, BUCKET_NAME, f"pollen/{key}.csv")
+        rows += len(df)
+    last = days[-1].strftime("%Y-%m-%d")
+    manifest["high_water"] = {f"{city}|{pollen}": last for city in cities for pollen in POLLENS}
+    s3.upload_file(save_manifest(local_root, manifest), BUCKET_NAME, f"pollen/{MANIFEST}")
+    return rows
+
+
+def generate_geojson(output, cities, rng):
+    # Un carré autour d'un point tiré au hasard en France pour chaque ville (les noms sont comparés sans casse)
+    features = []
+    for city in cities:
+        lon, lat = rng.uniform(-4.5, 8.0), rng.uniform(42.5, 51.0)
+        ring = [[lon - 0.05, lat - 0.05], [lon + 0.05, lat - 0.05], [lon + 0.05, lat + 0.05], [lon - 0.05, lat + 0.05], [lon - 0.05, lat - 0.05]]
+        features.append({"type": "Feature", "properties": {"nom": city.title()}, "geometry": {"type": "Polygon", "coordinates": [ring]}})
+    path = os.path.join(output, "communes.geojson")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"type": "FeatureCollection", "features": features}, file)
+    return path
+
+
+def generate(output, years=1, stations=150, cities=30, end=None, seed=0):
+    """
+    Génère l'ensemble des jeux de données du dashboard
+
+    Entrée
+        output (str) dossier du stockage local (à utiliser avec ASTHME_STORAGE=fs:<output>)
+        years (int, optionnel) profondeur de l'historique en années
+        stations (int, optionnel) nombre de stations Geodair
+        cities (int, optionnel) nombre de villes pollens.fr
+        end (datetime, optionnel) dernier jour de l'historique (par défaut, la veille)
+        seed (int, optionnel) graine du générateur aléatoire
+
+    Sortie
+        summary (dict) paramètres, nombre de lignes par jeu de données et durée de génération
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or datetime.today() - timedelta(days=1)).normalize()
+    days = pd.date_range(end - pd.DateOffset(years=years) + timedelta(days=1), end, freq="D")
+    output = os.path.abspath(output)
+    os.makedirs(output, exist_ok=True)
+    names = city_names(cities)
+
+    start = time.perf_counter()
+    df_dim = station_dim(stations, rng)
+    summary = {
+        "output": output,
+        "years": years, "stations": stations, "cities": cities, "seed": seed,
+        "start": days[0].strftime("%Y-%m-%d"), "end": days[-1].strftime("%Y-%m-%d"),
+        "rows": {
+            "geodes": generate_geodes(output, days, rng),
+            "geodair_daily": generate_geodair(output, df_dim, days, rng),
+            "pollen": generate_pollen(output, names, days, rng),
+        },
+        "geojson": generate_geojson(output, names, rng),
+    }
+    summary["seconds"] = round(time.perf_counter() - start, 1)
+    with open(os.path.join(output, "synthetic.json"), "w", encoding="utf-8") as file:
+        json.dump(summary, file, indent=2, ensure_ascii=False)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="dossier du stockage local généré")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="current", help="échelle prédéfinie")
+    parser.add_argument("--years", type=int, help="profondeur de l'historique (remplace celle de l'échelle)")
+    parser.add_argument("--stations", type=int, help="nombre de stations Geodair (remplace celui de l'échelle)")
+    parser.add_argument("--cities", type=int, help="nombre de villes pollens.fr (remplace celui de l'échelle)")
+    parser.add_argument("--seed", type=int, default=0, help="graine du générateur aléatoire")
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    params.update({key: getattr(args, key) for key in ("years", "stations", "cities") if getattr(args, key)})
+    summary = generate(args.output, seed=args.seed, **params)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 bind = "0.0.0.0:8050"
+# workers et threads : à comparer sous charge avec benchmarks/loadtest.py sweep
 workers = 2  # Réduire si besoin pour économiser la RAM (1 si mémoire limitée)
 threads = 4  # Ajouter des threads pour mieux gérer les requêtes concurrentes
 timeout = 120  # Augmenter le timeout pour éviter les erreurs de "Worker Timeout"
@@ -4,10 +4,14 @@
 import os
 import time
 import csv
+import argparse
 import pandas as pd
 from datetime import datetime, date
-import boto3
+from storage import storage_client
 import logging
+import re
+import unicodedata
+from contextlib import contextmanager
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -17,6 +21,32 @@ from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 
+from geodes_store import week_records, append_week
+from instrumentation import stage, count, start_report, finish_report
+
+# Export xlsx de l'historique (optionnel) : le dashboard lit le stockage long format (voir geodes_store)
+EXPORT_XLSX = os.environ.get("GEODES_EXPORT_XLSX", "0") == "1"
+
+# Indicateur et classe d'âge extraits par défaut
+DEFAULT_JOB = {"indicator": "Taux de passages aux urgences", "age": "tous âges", "period": None}
+JOB_FIELDS = ("indicator", "age", "period")
+
+# Panneau des indicateurs et tableau des résultats
+PANEL_XPATH = "//div[@class='ui-collapsible-set vertical-scrollable indic-container']"
+TABLE_ROWS_XPATH = "//table[@id='tm_datatable']//tbody/tr"
+
+
+def scroll_until_visible(panel, xpath, step=100):
+    # Condition d'attente : renvoie l'élément dès qu'il est affiché, sinon fait défiler le panneau d'un cran
+    def condition(driver):
+        elements = driver.find_elements(By.XPATH, xpath)
+        if elements and elements[0].is_displayed():
+            return elements[0]
+        driver.execute_script("arguments[0].scrollBy(0, arguments[1]);", panel, step)
+        return False
+    return condition
+
+
 class AsthmeDataScraper:
     def __init__(self, headless=True, output_dir='../../data/raw/'):
         chrome_options = Options()
@@ -30,8 +60,28 @@ class AsthmeDataScraper:
         chrome_options.add_argument('--window-size=1920,1080')
     
         service = Service('/usr/lib/chromium-browser/chromedriver')
+        start = time.perf_counter()
         self.driver = webdriver.Chrome(service=service, options=chrome_options)
         self.output_dir = output_dir
+        self.timings = [("browser_start", time.perf_counter() - start)]
+
+    @contextmanager
+    def step(self, name):
+        # Mesure la durée d'une étape du scraping (également consignée dans le rapport d'exécution)
+        start = time.perf_counter()
+        try:
+            with stage(name):
+                yield
+        finally:
+            self.timings.append((name, time.perf_counter() - start))
+
+    def report_timings(self):
+        total = sum(seconds for _, seconds in self.timings)
+        print("Durées des étapes :")
+        for name, seconds in self.timings:
+            print(f"  {name:<40} {seconds:7.2f} s")
+        print(f"  {'total':<40} {total:7.2f} s")
+        return self.timings
 
     def setup_driver(self):
         self.driver.get("https://geodes.santepubliquefrance.fr/#c=indicator&view=map2")
@@ -52,50 +102,54 @@ class AsthmeDataScraper:
         
         ok_button = self.driver.find_element(By.XPATH, "//button[contains(text(), 'OK')]")
         ok_button.click()
-        time.sleep(5)
+        # Attendre l'affichage des résultats de la recherche
+        WebDriverWait(self.driver, 30).until(
+            EC.visibility_of_element_located((By.XPATH, PANEL_XPATH))
+        )
 
-    def find_urgences_section(self):
-        # Faire défiler le panneau jusqu'à trouver la section "Taux de passages aux urgences"
+    def find_urgences_section(self, indicator=DEFAULT_JOB["indicator"]):
+        # Faire défiler le panneau jusqu'à ce que la section de l'indicateur (par défaut "Taux de passages aux urgences") soit affichée
         scrollable_panel = WebDriverWait(self.driver, 30).until(
-            EC.presence_of_element_located(
-                (By.XPATH, "//div[@class='ui-collapsible-set vertical-scrollable indic-container']")
-            )
+            EC.presence_of_element_located((By.XPATH, PANEL_XPATH))
         )
         
-        taux_passages_xpath = (
+        indicator_xpath = (
             "//h3[contains(@class, 'ui-collapsible-heading')]"
-            "//a[starts-with(normalize-space(), 'Taux de passages aux urgences')]"
+            f"//a[starts-with(normalize-space(), '{indicator}')]"
         )
         
-        for _ in range(20):  # Limiter à 20 tentatives
-            try:
-                taux_passages_element = self.driver.find_element(By.XPATH, taux_passages_xpath)
-                if taux_passages_element.is_displayed():
-                    actions = ActionChains(self.driver)
-                    actions.move_to_element(taux_passages_element).click().perform()
-                    break
-            except Exception:
-                self.driver.execute_script("arguments[0].scrollBy(0, 100);", scrollable_panel)
-                time.sleep(0.5)
-
-    def select_filters(self):
+        indicator_element = WebDriverWait(self.driver, 20, poll_frequency=0.1).until(
+            scroll_until_visible(scrollable_panel, indicator_xpath)
+        )
+        ActionChains(self.driver).move_to_element(indicator_element).click().perform()
+
+    def select_filters(self, age=DEFAULT_JOB["age"], period=None):
         # Attendre que le modal disparaisse
         WebDriverWait(self.driver, 20).until(
             EC.invisibility_of_element_located((By.CLASS_NAME, "modalFreezeWindow2"))
         )
     
-        # Sélectionner "tous âges"
-        tous_ages_button = WebDriverWait(self.driver, 20).until(
-            EC.element_to_be_clickable((By.XPATH, "//span[contains(text(), 'tous âges')]"))
-        )
-        tous_ages_button.click()
+        # Sélectionner la classe d'âge (par défaut "tous âges") puis, éventuellement, la période (ex. une semaine)
+        for label in [age, period]:
+            if label is None:
+                continue
+            button = WebDriverWait(self.driver, 20).until(
+                EC.element_to_be_clickable((By.XPATH, f"//span[contains(text(), '{label}')]"))
+            )
+            button.click()
+            WebDriverWait(self.driver, 20).until(
+                EC.invisibility_of_element_located((By.CLASS_NAME, "modalFreezeWindow2"))
+            )
     
         # Cliquer sur tableau via JavaScript
         tableau_button = WebDriverWait(self.driver, 20).until(
             EC.presence_of_element_located((By.ID, "tm_table"))
         )
         self.driver.execute_script("arguments[0].click();", tableau_button)
-        time.sleep(5)
+        # Attendre que le tableau soit rempli
+        WebDriverWait(self.driver, 30).until(
+            EC.presence_of_element_located((By.XPATH, TABLE_ROWS_XPATH))
+        )
 
 
     def extract_data(self):
@@ -116,17 +170,18 @@ class AsthmeDataScraper:
                 })
         return data
 
-    def save_data(self, data):
+    def save_data(self, data, label=None):
         # Création du dossier de sortie s'il n'existe pas
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
             
-        # Nommer le fichier CSV avec la date du jour
-        filename = f'asthme_data_{datetime.now().strftime("%Y%m%d")}.csv'
+        # Nommer le fichier CSV avec la date du jour (et l'extraction, en mode session)
+        suffix = f'_{label}' if label else ''
+        filename = f'asthme_data{suffix}_{datetime.now().strftime("%Y%m%d")}.csv'
         filepath = os.path.join(self.output_dir, filename)
         
         # Enregistrer les données dans le CSV avec les colonnes dans l'ordre souhaité
-        with open(filepath, mode='w', newline='', encoding='utf-8') as file:
+        with stage("write", rows_in=len(data)) as st, open(filepath, mode='w', newline='', encoding='utf-8') as file:
             fieldnames = ["Département", "Code", "Chiffre"]
             writer = csv.DictWriter(file, fieldnames=fieldnames)
             writer.writeheader()
@@ -136,23 +191,78 @@ class AsthmeDataScraper:
                     "Code": row.get("Code", ""),
                     "Chiffre": row.get("Chiffre", "")
                 })
+            file.flush()
+            st.wrote(filepath)
         return filepath
 
-    def run_scraping(self):
+    @staticmethod
+    def job_label(job):
+        # Nom court d'une extraction, utilisé dans le nom du fichier CSV
+        text = "_".join(str(job.get(key)) for key in JOB_FIELDS if job.get(key))
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+        return re.sub(r"[^0-9a-zA-Z]+", "_", text).strip("_").lower()
+
+    def scrape_job(self, job, first=True):
+        # Une extraction (indicateur, classe d'âge, période) dans le navigateur déjà ouvert
+        name = self.job_label(job)
+        if not first:
+            # Nouvelle recherche dans la même page pour revenir à la liste des indicateurs
+            with self.step(f"{name}:search"):
+                self.search_asthme()
+        with self.step(f"{name}:indicator"):
+            self.find_urgences_section(job.get("indicator", DEFAULT_JOB["indicator"]))
+        with self.step(f"{name}:filters"):
+            self.select_filters(job.get("age", DEFAULT_JOB["age"]), job.get("period"))
+        with self.step(f"{name}:extract"):
+            return self.extract_data()
+
+    def run_session(self, jobs):
+        # Mode session : un seul navigateur pour plusieurs extractions (indicateurs, classes d'âge ou semaines)
+        # Renvoie les chemins des CSV produits, dans l'ordre des extractions
+        csv_filepaths = []
         try:
-            self.setup_driver()
-            self.search_asthme()
-            self.find_urgences_section()
-            self.select_filters()
-            data = self.extract_data()
-            csv_filepath = self.save_data(data)
-            print(f"Scraping terminé. Données sauvegardées dans : {csv_filepath}")
-            return csv_filepath
+            with self.step("setup"):
+                self.setup_driver()
+            with self.step("search"):
+                self.search_asthme()
+            for i, job in enumerate(jobs):
+                data = self.scrape_job(job, first=(i == 0))
+                count(f"{self.job_label(job)}:extract", rows_out=len(data))
+                label = None if job == DEFAULT_JOB else self.job_label(job)
+                csv_filepaths.append(self.save_data(data, label))
+                print(f"Extraction terminée ({self.job_label(job)}) : {len(data)} lignes dans {csv_filepaths[-1]}")
+            return csv_filepaths
         except Exception as e:
             print(f"Erreur lors du scraping : {e}")
             raise
         finally:
             self.driver.quit()
+            self.report_timings()
+
+    def run_scraping(self, extra_jobs=()):
+        # Extraction par défaut (publiée dans le stockage long format), suivie des extractions supplémentaires
+        # dans la même session de navigateur ; leurs CSV sont conservés dans output_dir (self.csv_filepaths)
+        jobs = [DEFAULT_JOB] + [job for job in extra_jobs if job != DEFAULT_JOB]
+        self.csv_filepaths = self.run_session(jobs)
+        csv_filepath = self.csv_filepaths[0]
+        print(f"Scraping terminé. Données sauvegardées dans : {', '.join(self.csv_filepaths)}")
+        return csv_filepath
+
+
+def parse_job(text):
+    """
+    Décrit une extraction à partir du texte "indicateur;classe d'âge;période" (option --job)
+    - Les champs omis ou vides prennent les valeurs de DEFAULT_JOB (ex. ";moins de 15 ans" ou ";;2025-S06")
+
+    Sortie
+        job (dict) extraction ({"indicator", "age", "period"})
+    """
+    fields = [field.strip() or None for field in text.split(";")]
+    if len(fields) > len(JOB_FIELDS):
+        raise ValueError(f"Extraction invalide : {text} (attendu : indicateur;classe d'âge;période)")
+    job = dict(DEFAULT_JOB)
+    job.update({key: value for key, value in zip(JOB_FIELDS, fields) if value is not None})
+    return job
 
 
 def update_excel(csv_path, excel_path=None):
@@ -262,7 +372,7 @@ def upload_to_s3(local_file, bucket_name, s3_file_name):
         print(f"❌ Erreur : Le fichier {local_file} n'existe pas. Upload annulé.")
         return
     
-    s3 = boto3.client('s3')
+    s3 = storage_client()
 
     try:
         print(f"📤 Upload en cours : {local_file} vers s3://{bucket_name}/{s3_file_name}...")
@@ -271,11 +381,38 @@ def upload_to_s3(local_file, bucket_name, s3_file_name):
     except Exception as e:
         print(f"❌ Erreur lors de l'upload vers S3 : {e}")
 
+def read_scraped_csv(csv_path):
+    """
+    Lit le CSV produit par le scraper : chiffre de chaque département (0 si non disponible)
+    """
+    df_csv = pd.read_csv(csv_path, encoding="utf-8")
+    return {
+        str(row["Département"]).strip(): float(
+            str(row["Chiffre"])
+            .replace(",", ".")
+            .replace("\u202f", "")
+            .strip()
+        ) if "N/A" not in str(row["Chiffre"]) else 0
+        for _, row in df_csv.iterrows()
+    }
+
+
+def update_geodes_store(csv_path, bucket_name, excel_key):
+    """
+    Publie les chiffres de la semaine dans le stockage long format sur S3 (sans relire ni réécrire tout l'historique)
+    """
+    with stage("parse") as st:
+        st.read(csv_path)
+        df_week = week_records(read_scraped_csv(csv_path), date.today())
+        st.rows_out += len(df_week)
+    return append_week(storage_client(), bucket_name, df_week, excel_key=excel_key)
+
+
 def update_excel_s3(csv_path, bucket_name, excel_key):
     """
     Met à jour le fichier Excel stocké dans S3 en ajoutant une nouvelle ligne.
     """
-    s3 = boto3.client('s3')
+    s3 = storage_client()
     
     # Télécharger le fichier Excel existant depuis S3
     temp_excel_path = '/tmp/temp_geodes.xlsx'
@@ -296,16 +433,7 @@ def update_excel_s3(csv_path, bucket_name, excel_key):
     mois = aujourdhui.strftime('%b')
     semaine = f"{annee}-S{numero_semaine:02d}"
 
-    df_csv = pd.read_csv(csv_path, encoding="utf-8")
-    donnees_scrap = {
-        str(row["Département"]).strip(): float(
-            str(row["Chiffre"])
-            .replace(",", ".")
-            .replace("\u202f", "")
-            .strip()
-        ) if "N/A" not in str(row["Chiffre"]) else 0
-        for _, row in df_csv.iterrows()
-    }
+    donnees_scrap = read_scraped_csv(csv_path)
 
     # Configuration des colonnes
     colonnes_temporaires = ["Semaine", "Annee", "Mois"]
@@ -347,31 +475,27 @@ def update_excel_s3(csv_path, bucket_name, excel_key):
 
 
 
-def verify_s3_changes(bucket_name, excel_key):
-    """Affiche les 3 dernières lignes du fichier Excel avant et après modification"""
-    s3 = boto3.client('s3')
+def verify_s3_changes(bucket_name, excel_key, df_before=None):
+    """
+    Affiche les 3 dernières lignes du fichier Excel avant et après modification
+    - Sans df_before : lecture avant modification, la dataFrame lue est renvoyée
+    - Avec df_before : lecture après modification et comparaison (S3 garantit la lecture immédiate après écriture)
+    """
+    s3 = storage_client()
     temp_path = '/tmp/verify_geodes.xlsx'
     
     try:
-        # Lecture avant modification
-        s3.download_file(bucket_name, excel_key, temp_path)
-        df_before = pd.read_excel(temp_path)
-        print("\n=== AVANT MODIFICATION ===")
-        print(df_before.tail(3))
-        
-        # Attendre la fin des modifications
-        time.sleep(5)
-        
-        # Lecture après modification
         s3.download_file(bucket_name, excel_key, temp_path)
-        df_after = pd.read_excel(temp_path)
-        print("\n=== APRÈS MODIFICATION ===")
-        print(df_after.tail(3))
+        df = pd.read_excel(temp_path)
+        print("\n=== AVANT MODIFICATION ===" if df_before is None else "\n=== APRÈS MODIFICATION ===")
+        print(df.tail(3))
         
-        if len(df_after) > len(df_before):
-            print("\n✅ Nouvelle ligne ajoutée")
-        else:
-            print("\n❌ Pas de nouvelle ligne")
+        if df_before is not None:
+            if len(df) > len(df_before):
+                print("\n✅ Nouvelle ligne ajoutée")
+            else:
+                print("\n❌ Pas de nouvelle ligne")
+        return df
             
     finally:
         if os.path.exists(temp_path):
@@ -382,13 +506,26 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def run_scraping_pipeline():
+def check_scraped_csv(csv_filepath):
+    """
+    Vérifie que le scraping a produit un CSV non vide ; lève une erreur sinon (exécution consignée en échec)
+
+    Sortie
+        rows (int) nombre de lignes du CSV
+    """
+    if not csv_filepath or not os.path.exists(csv_filepath):
+        raise RuntimeError(f"Échec du scraping : aucun CSV produit ({csv_filepath})")
+    df_check = pd.read_csv(csv_filepath)
+    if df_check.empty:
+        raise RuntimeError(f"Le CSV est vide : {csv_filepath}")
+    return len(df_check)
+
+
+def run_scraping_pipeline(extra_jobs=()):
     try:
         bucket_name = "bucket-asthme-scraping"
         excel_key = "geodes_complet.xlsx"
         
-        verify_s3_changes(bucket_name, excel_key)
-        
         logger.info("🚀 Début du scraping...")
         # Ajout de plus d'options pour Chrome
         options = webdriver.ChromeOptions()
@@ -399,30 +536,40 @@ def run_scraping_pipeline():
         options.add_argument('--window-size=1920,1080')
         
         scraper = AsthmeDataScraper(headless=True, output_dir='./data/raw')
-        csv_filepath = scraper.run_scraping()
+        csv_filepath = scraper.run_scraping(extra_jobs)
         
-        if not csv_filepath:
-            logger.error("❌ Échec du scraping")
-            return
-            
         # Vérifier si le CSV a été créé et contient des données
-        if os.path.exists(csv_filepath):
-            df_check = pd.read_csv(csv_filepath)
-            if df_check.empty:
-                logger.error("❌ Le CSV est vide")
-                return
-            logger.info(f"✅ CSV créé avec {len(df_check)} lignes")
+        rows = check_scraped_csv(csv_filepath)
+        logger.info(f"✅ CSV créé avec {rows} lignes")
             
-        logger.info("🛠 Mise à jour du fichier Excel dans S3...")
-        update_excel_s3(csv_filepath, bucket_name, excel_key)
-        
-        time.sleep(5)
-        verify_s3_changes(bucket_name, excel_key)
+        logger.info("🛠 Publication de la semaine dans le stockage long format...")
+        update_geodes_store(csv_filepath, bucket_name, excel_key)
+
+        if EXPORT_XLSX:
+            logger.info("🛠 Mise à jour du fichier Excel dans S3...")
+            df_before = verify_s3_changes(bucket_name, excel_key)
+            update_excel_s3(csv_filepath, bucket_name, excel_key)
+            verify_s3_changes(bucket_name, excel_key, df_before)
 
     except Exception as e:
         logger.error(f"❌ Erreur détaillée: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
+        # Remontée jusqu'au rapport d'exécution, consigné en échec
+        raise
 
 if __name__ == "__main__":
-    run_scraping_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scraping hebdomadaire des passages aux urgences pour asthme (Géodes)")
+    parser.add_argument("--job", action="append", default=[], type=parse_job, metavar="INDICATEUR;AGE;PERIODE",
+                        help="extraction supplémentaire dans la même session de navigateur (répétable, champs vides : "
+                             "valeurs par défaut, ex. --job \";moins de 15 ans\")")
+    args = parser.parse_args()
+
+    # Durée, volumes et mémoire de chaque étape consignés dans un rapport d'exécution (voir instrumentation.py)
+    start_report("geodes")
+    status = "failed"
+    try:
+        run_scraping_pipeline(args.job)
+        status = "success"
+    finally:
+        finish_report(status)
\ No newline at end of file
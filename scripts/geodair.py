@@ -4,9 +4,23 @@ import time
 import os
 from datetime import datetime, timedelta
 import pandas as pd
+import numpy as np
 import io
+import json
+import argparse
+import hashlib
+import multiprocessing
+from functools import lru_cache
 import unidecode
-import boto3
+from storage import storage_client
+from publish import publish_version
+from instrumentation import stage, count, start_report, finish_report
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from partitions import (
+    MANIFEST, partition_keys, partition_path, load_manifest, save_manifest, register_partition, select_partitions
+)
 
 def upload_to_s3(local_file, bucket_name, s3_file_name):
     """
@@ -16,7 +30,7 @@ def upload_to_s3(local_file, bucket_name, s3_file_name):
         print(f"❌ Erreur : Le fichier {local_file} n'existe pas. Upload annulé.")
         return
     
-    s3 = boto3.client('s3')
+    s3 = storage_client()
 
     try:
         print(f"📤 Upload en cours : {local_file} vers s3://{bucket_name}/{s3_file_name}...")
@@ -36,6 +50,59 @@ polluants = {
     'name': ['SO2', 'NO2', 'O3', 'PM10', 'PM2.5']
 }
 
+# Orchestration des exports de l'API : nouvelles tentatives HTTP, attente entre deux sondages
+# (exponentielle, plafonnée) et délai global au-delà duquel les exports non prêts sont abandonnés (secondes)
+export_max_retries = 3
+export_poll_delay = 1
+export_poll_max_delay = 30
+export_timeout = 15 * 60
+
+# Racine de l'API (GEODAIR_API_URL pour viser un serveur de rejeu local, voir benchmarks/stand_in.py)
+api_url = os.environ.get("GEODAIR_API_URL", "https://www.geodair.fr/api-ext").rstrip("/")
+
+# URL de l'API pour le pic horaire journalier des polluants
+max_daily_url = f"{api_url}/MaxJH/export"
+
+# Export des stations et son cache : date d'export et empreinte du contenu du dernier téléchargement
+csv_station = "geodair_station.csv"
+station_cache_file = "geodair_station.json"
+
+# Colonnes et format des dates dans les fichiers csv de polluants
+date_columns = ['date_de_debut', 'date_de_fin']
+date_format = '%Y/%m/%d %H:%M:%S'
+
+# Colonnes propres à chaque station, portées par la dimension station plutôt que par les tables de faits
+station_columns = ["organisme", "code_zas", "zas", "nom_site", "type_d'implantation", "type_d'influence"]
+geo_columns = ["code_commune", "commune", "longitude", "latitude", "code_departement", "departement"]
+csv_station_dim = "geodair_station_dim.csv"  # dimension station, indexée par code_site
+
+# Historiques journaliers partitionnés par mois (un csv par mois et un manifeste par dossier)
+daily_root = "geodair_max_daily"
+iqa_root = "geodair_iqa_daily"
+
+# Publication versionnée des fichiers sur S3 : <publish_prefix>/runs/<version>/ puis pointeur <publish_prefix>/current.json
+bucket_name = "bucket-asthme-scraping"
+publish_prefix = "geodair"
+
+# Backfill : exports bruts de chaque jour et point de reprise (jours entièrement téléchargés)
+backfill_root = "geodair_backfill"
+checkpoint_file = "checkpoint.json"
+
+# Colonnes de l'historique hebdomadaire (clé semaine, code_site, polluant)
+weekly_columns = ["semaine", "code_site", "polluant", "unite_de_mesure", "max_week"]
+# Historique hebdomadaire partitionné par année de la semaine (un csv par année et un manifeste)
+weekly_root = "geodair_max_weekly"
+
+# Seuils IQA pour chaque polluant
+IQA_THRESHOLDS = {
+    "PM10": [0, 20, 40, 50, 100, 150, 200],
+    "PM2.5": [0, 10, 20, 25, 50, 75, 100],
+    "NO2": [0, 40, 90, 120, 230, 340, 400],
+    "O3": [0, 50, 100, 130, 240, 380, 500],
+    "SO2": [0, 50, 100, 150, 200, 300, 400],
+}
+IQA_DEFAULT_THRESHOLDS = [0, 50, 100, 150, 200, 300, 400]
+
 # Dictionnaire des départements français
 departements = {
     "01": "Ain",
@@ -162,33 +229,65 @@ def clean_header(df):
     
     return df
 
-def deduplicate_csv(csv):
+def parse_dates(df):
     """
-    Supprime les doublons dans un fichier csv en conservant :
-    - En priorité, la ligne avec validite = 1
-    - Sinon, la ligne avec la date_de_fin la plus récente
-    - Si deux lignes sont strictement identiques, une seule est conservée.
+    Convertit les colonnes de date d'un dataFrame de polluants en datetime
 
-    Entrée 
-        csv (str) : chemin du fichier CSV à traiter
+    Entrée
+        df (dataFrame pandas) données de polluants
+    
     Sortie
-        Le fichier csv est mis à jour sans doublons.
+        df (dataFrame pandas) données avec date_de_debut et date_de_fin au format datetime
+    """
+    for col in date_columns:
+        if col in df.columns:
+            # Gestion des formats de date multiples
+            df[col] = pd.to_datetime(df[col], errors='coerce', format=date_format)
+    return df
+
+def read_polluant_csv(csv):
+    """
+    Charge un fichier csv de polluants et convertit ses colonnes de date
+
+    Entrée
+        csv (str) chemin du fichier CSV à charger
+    
+    Sortie
+        df (dataFrame pandas) données de polluants avec les dates au format datetime
     """
     if not os.path.exists(csv):
         raise FileNotFoundError(f"Le fichier {csv} n'existe pas.")
 
-    # Charger le fichier CSV
-    df = pd.read_csv(csv, sep=";", low_memory=False, encoding="utf-8")
+    # Les codes sont lus comme du texte pour conserver les zéros initiaux (ex. '01')
+    df = pd.read_csv(csv, sep=";", low_memory=False, encoding="utf-8", dtype={"code_commune": str, "code_departement": str})
+    return parse_dates(df)
 
-    # Colonnes de date à convertir
-    date_columns = ['date_de_debut', 'date_de_fin']
+def write_polluant_csv(df, csv):
+    """
+    Sauvegarde un dataFrame de polluants au format csv en remettant les dates au format YYYY/MM/DD HH:MM:SS
 
-    # Convertir les colonnes de date en datetime
+    Entrée
+        df (dataFrame pandas) données de polluants à sauvegarder
+        csv (str) chemin du fichier CSV à écrire
+    """
+    df = df.copy()
     for col in date_columns:
-        if col in df.columns:
-            # Gestion des formats de date multiples
-            df[col] = pd.to_datetime(df[col], errors='coerce', format='%Y/%m/%d %H:%M:%S')
+        if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime(date_format)  # Format uniforme YYYY/MM/DD HH:MM:SS
+    df.to_csv(csv, sep=";", header=True, index=False, encoding="utf-8", lineterminator="\n")
+
+def deduplicate_polluant(df):
+    """
+    Supprime les doublons d'un dataFrame de polluants en conservant :
+    - En priorité, la ligne avec validite = 1
+    - Sinon, la ligne avec la date_de_fin la plus récente
+    - Si deux lignes sont strictement identiques, une seule est conservée.
 
+    Entrée 
+        df (dataFrame pandas) données de polluants avec les dates au format datetime
+    Sortie
+        df (dataFrame pandas) données sans doublons
+    """
     # Vérifier si les colonnes nécessaires existent
     if 'validite' not in df.columns or 'date_de_fin' not in df.columns:
         raise ValueError("Les colonnes 'validite' ou 'date_de_fin' sont manquantes dans le fichier CSV.")
@@ -200,80 +299,98 @@ def deduplicate_csv(csv):
     df = df.drop_duplicates(subset=['date_de_debut', 'code_site', 'polluant'], keep='first')
 
     # Suppression stricte des doublons restants (toutes colonnes identiques)
-    df = df.drop_duplicates(keep='first')
+    return df.drop_duplicates(keep='first')
 
-    # Reconvertir les dates au format souhaité avant sauvegarde
-    for col in date_columns:
-        if col in df.columns:
-            df[col] = df[col].dt.strftime('%Y/%m/%d %H:%M:%S')  # Format uniforme YYYY/MM/DD HH:MM:SS
-
-    # Sauvegarde du fichier mis à jour
-    df.to_csv(csv, sep=";", index=False, encoding="utf-8")
-    print(f"Fichier {csv} dédupliqué.")
-
-def reorder_csv(csv):
+def reorder_polluant(df):
     """
-    Trie un fichier csv :
+    Trie un dataFrame de polluants selon sa clé :
     - Par date_de_debut (ordre chronologique)
-    - Puis par organisme, code_zas, zas, code_site, nom_site et polluant (ordre alphabétique)
+    - Puis par code_site et polluant (ordre alphabétique)
 
     Entrée 
-        csv (str) chemin du fichier CSV à traiter
+        df (dataFrame pandas) données de polluants avec les dates au format datetime
         
     Sortie 
-        Le fichier csv est mis à jour et trié
+        df (dataFrame pandas) données triées
     """
-    if not os.path.exists(csv):
-        raise FileNotFoundError(f"Le fichier {csv} n'existe pas.")
-
-    # Charger le fichier CSV
-    df = pd.read_csv(csv, sep=";", low_memory=False, encoding="utf-8")
-
-    # Colonnes de date à convertir
-    date_columns = ['date_de_debut', 'date_de_fin']
-
-    # Convertir les colonnes de date en datetime
-    for col in date_columns:
-        if col in df.columns:
-            # Gestion des formats de date multiples
-            df[col] = pd.to_datetime(df[col], errors='coerce', format='%Y/%m/%d %H:%M:%S')
-
-    # Vérification de la présence des colonnes nécessaires
     # Vérification de la présence des colonnes nécessaires
-    required_columns = ["date_de_debut", "organisme", "code_zas", "zas", "code_site", "nom_site", "polluant"]
+    required_columns = ["date_de_debut", "code_site", "polluant"]
     missing_columns = [col for col in required_columns if col not in df.columns]
 
     if missing_columns:
         raise ValueError(f"Colonnes manquantes : {', '.join(missing_columns)}")
 
     # Tri du dataframe
-    df = df.sort_values(by=required_columns, ascending=True)
+    return df.sort_values(by=required_columns, ascending=True)
 
-    # Reconvertir les dates au format souhaité avant sauvegarde
-    for col in date_columns:
-        if col in df.columns:
-            df[col] = df[col].dt.strftime('%Y/%m/%d %H:%M:%S')  # Format uniforme YYYY/MM/DD HH:MM:SS
+def deduplicate_csv(csv):
+    """
+    Supprime les doublons dans un fichier csv (voir deduplicate_polluant)
+
+    Entrée 
+        csv (str) : chemin du fichier CSV à traiter
+    Sortie
+        Le fichier csv est mis à jour sans doublons.
+    """
+    df = deduplicate_polluant(read_polluant_csv(csv))
+
+    # Sauvegarde du fichier mis à jour
+    write_polluant_csv(df, csv)
+    print(f"Fichier {csv} dédupliqué.")
+
+def reorder_csv(csv):
+    """
+    Trie un fichier csv (voir reorder_polluant)
+
+    Entrée 
+        csv (str) chemin du fichier CSV à traiter
+        
+    Sortie 
+        Le fichier csv est mis à jour et trié
+    """
+    df = reorder_polluant(read_polluant_csv(csv))
 
     # Sauvegarde du fichier mis à jour
-    df.to_csv(csv, sep=";", index=False, encoding="utf-8")
+    write_polluant_csv(df, csv)
     print(f"Fichier {csv} trié.")
 
-def fetch_station(date = datetime.today()):
+def load_station_cache():
+    """
+    Charge la description du dernier export des stations téléchargé
+
+    Sortie
+        cache (dict) date d'export ("date") et empreinte sha256 du contenu ("sha256"), vide en l'absence de cache
+    """
+    if not os.path.exists(station_cache_file):
+        return {}
+    with open(station_cache_file, encoding="utf-8") as file:
+        return json.load(file)
+
+def fetch_station(date=None, force=False):
     """
     Récupère les informations à date des stations de mesure de pollution 
     - Crée un csv précisant la date de mise à jour de la base de donnée
     - Fournit les coordonnées GPS, commune et code de commune pour localiser les stations
     - Fournit diverses informations sur les conditions de recueil des concentrations de polluants
+    - L'export n'est téléchargé qu'une fois par date, et le csv n'est réécrit que si son contenu a changé
 
     Entrée
-        date (datetype, optionnel): date de mise à jour sur l'API de la liste des stations de recueil de données. Defaults to datetime.today()
+        date (datetype, optionnel): date de mise à jour sur l'API de la liste des stations de recueil de données. Par défaut, la date du jour à l'appel
+        force (bool, optionnel): télécharge l'export même s'il est déjà en cache pour cette date
     
     Sortie
         Le fichier csv est mis à jour à la date 
     """
-    gen_url = "https://www.geodair.fr/api-ext/station/export"  # URL de l'API pour les stations
+    # Date résolue à chaque appel : un processus de longue durée (pipeline, backfill) ne réutilise pas le jour de son import
+    date = date or datetime.today()
+    gen_url = f"{api_url}/station/export"  # URL de l'API pour les stations
     date_str = date.strftime("%Y-%m-%d")  # date du jour au format YYYY-MM-DD
-    csv = "geodair_station.csv"  # nom du fichier csv à mettre à jour par remplacement
+    csv = csv_station  # nom du fichier csv à mettre à jour par remplacement
+    cache = load_station_cache()
+
+    if not force and cache.get("date") == date_str and os.path.exists(csv):
+        print(f"Export des stations du {date_str} déjà téléchargé : {csv} réutilisé.")
+        return
 
     # En-têtes de la requête
     headers = {
@@ -282,36 +399,53 @@ def fetch_station(date = datetime.today()):
     }
 
     # Envoyer la requête
-    response = requests.get(f"{gen_url}?date={date_str}", headers=headers)
+    with stage("download") as st:
+        response = requests.get(f"{gen_url}?date={date_str}", headers=headers)
+        st.bytes_read += len(response.content)
 
     # Vérifier l'état de la requête
     if response.status_code == 200:
         print(f"Fichier téléchargé avec succès : {csv}")
-        df = pd.read_csv(io.StringIO(response.text), sep=";", encoding="utf-8", low_memory=False)
-        df = clean_header(df)
-        df.to_csv(csv, sep=";", header=True, index=False, encoding="utf-8", lineterminator="\n")
+        digest = hashlib.sha256(response.content).hexdigest()
+        if digest == cache.get("sha256") and os.path.exists(csv):
+            # Contenu identique au précédent export : le csv (et sa version en mémoire) reste valide
+            print(f"Export des stations inchangé : {csv} conservé.")
+        else:
+            with stage("parse") as st:
+                df = pd.read_csv(io.StringIO(response.text), sep=";", encoding="utf-8", low_memory=False)
+                df = clean_header(df)
+                st.rows_out += len(df)
+            with stage("write") as st:
+                df.to_csv(csv, sep=";", header=True, index=False, encoding="utf-8", lineterminator="\n")
+                st.rows_in += len(df)
+                st.wrote(csv)
+        with open(station_cache_file, "w", encoding="utf-8") as file:
+            json.dump({"date": date_str, "sha256": digest}, file, indent=2)
     else:
         print(f"Erreur lors de la génération du fichier : {response.status_code} - {response.reason} - {response.text}")
 
     return
 
-def merge_polluant_station(csv_polluant):
+def load_station(csv_station=csv_station):
     """
-    Ajoute les informations géographiques aux fichiers de polluant horaire
-    
+    Charge le fichier des stations et y ajoute le code et le nom du département
+    - Le fichier n'est relu que s'il a été modifié depuis la dernière lecture (cache en mémoire)
+
     Entrée
-        csv_polluant (str) chemin du fichier de polluant à compléter avec les données géographiques de la station
+        csv_station (str, optionnel) chemin du fichier des stations produit par fetch_station
     
     Sortie
-        Le fichier csv des polluants est mis à jour avec les informations géographiques des stations de prélévement
+        df_station (dataFrame pandas) informations géographiques des stations
     """
-    # Charger les fichiers csv
-    df_polluant = pd.read_csv(csv_polluant, sep=";", low_memory=False, encoding="utf-8")
-    csv_station = "geodair_station.csv"
-    df_station = pd.read_csv(csv_station, sep=";", low_memory=False, encoding="utf-8")
+    stat = os.stat(csv_station)
+    return read_station(csv_station, stat.st_mtime_ns, stat.st_size).copy()
 
-    # Définir les colonnes à ajouter
-    cols_to_add = ["code_commune", "commune", "longitude", "latitude", "code_departement", "departement"]
+@lru_cache(maxsize=4)
+def read_station(csv_station, mtime_ns, size):
+    """
+    Lit le fichier des stations (mis en cache par load_station, la date de modification et la taille servant de clé)
+    """
+    df_station = pd.read_csv(csv_station, sep=";", low_memory=False, encoding="utf-8", dtype={"code_commune": str})
 
     # Ajouter une colonne 'code_departement' depuis les 2 premiers chiffres de 'code_commune'
     df_station['code_departement'] = df_station['code_commune'].dropna().astype(str).str[:2]
@@ -319,21 +453,47 @@ def merge_polluant_station(csv_polluant):
     # Ajouter une colonne 'departement' à partir du dictionnaire des départements
     df_station['departement'] = df_station['code_departement'].map(departements).fillna("Inconnu")
 
+    return df_station
+
+def merge_station(df_polluant, df_station):
+    """
+    Ajoute les informations géographiques des stations à un dataFrame de polluants
+
+    Entrée
+        df_polluant (dataFrame pandas) données de polluants à compléter
+        df_station (dataFrame pandas) informations des stations (voir load_station)
+    
+    Sortie
+        df_merged (dataFrame pandas) données de polluants complétées
+    """
+    # Définir les colonnes à ajouter
+    cols_to_add = geo_columns
+
     # Supprimer les colonnes existantes dans df_polluant pour éviter les doublons
-    df_polluant.drop(columns=[col for col in cols_to_add if col in df_polluant.columns], inplace=True)
+    df_polluant = df_polluant.drop(columns=[col for col in cols_to_add if col in df_polluant.columns])
 
     # Faire la jointure
-    df_merged = df_polluant.merge(
+    return df_polluant.merge(
         df_station[['code'] + cols_to_add], 
         left_on='code_site', 
         right_on='code', 
         how='left'
     ).drop(columns=['code'])  # Supprime la colonne 'code' dupliquée
 
-    # Remplacer les valeurs manquantes par celles du dataframe joint
-    for col in cols_to_add:
-        if col in df_polluant.columns:
-            df_merged[col] = df_polluant[col].fillna(df_merged[col])
+def merge_polluant_station(csv_polluant):
+    """
+    Ajoute les informations géographiques aux fichiers de polluant horaire
+    
+    Entrée
+        csv_polluant (str) chemin du fichier de polluant à compléter avec les données géographiques de la station
+    
+    Sortie
+        Le fichier csv des polluants est mis à jour avec les informations géographiques des stations de prélévement
+    """
+    # Charger les fichiers csv
+    df_polluant = pd.read_csv(csv_polluant, sep=";", low_memory=False, encoding="utf-8")
+
+    df_merged = merge_station(df_polluant, load_station(csv_station))
 
     # Sauvegarder le fichier
     df_merged.to_csv(csv_polluant, sep=";", header=True, index=False, encoding='utf-8', lineterminator="\n")
@@ -342,6 +502,264 @@ def merge_polluant_station(csv_polluant):
 
     return
 
+def to_fact(df):
+    """
+    Réduit un dataFrame de polluants à sa table de faits, indexée par (code_site, polluant, date_de_debut)
+    - Les colonnes propres aux stations sont retirées (voir update_station_dim)
+
+    Entrée
+        df (dataFrame pandas) données de polluants, éventuellement complétées des informations des stations
+    
+    Sortie
+        df (dataFrame pandas) table de faits
+    """
+    return df.drop(columns=[col for col in station_columns + geo_columns if col in df.columns])
+
+def read_station_dim(csv_dim=csv_station_dim):
+    """
+    Charge la dimension station
+
+    Entrée
+        csv_dim (str, optionnel) chemin du fichier de la dimension station
+    
+    Sortie
+        df_dim (dataFrame pandas) une ligne par code_site
+    """
+    return pd.read_csv(csv_dim, sep=";", low_memory=False, encoding="utf-8",
+                       dtype={"code_commune": str, "code_departement": str})
+
+def update_station_dim(df_polluant=None, csv_dim=csv_station_dim, csv_station=csv_station):
+    """
+    Met à jour la dimension station, indexée par code_site
+    - Commune, coordonnées et département proviennent de l'export des stations (voir fetch_station)
+    - Organisme, zas, nom et types de site proviennent des mesures (les plus récentes sont conservées)
+
+    Entrée
+        df_polluant (dataFrame pandas, optionnel) nouvelles mesures portant les colonnes propres aux stations
+        csv_dim (str, optionnel) chemin du fichier de la dimension station
+        csv_station (str, optionnel) chemin du fichier des stations produit par fetch_station
+    
+    Sortie
+        df_dim (dataFrame pandas) dimension station, également sauvegardée au format csv
+    """
+    df_previous = read_station_dim(csv_dim) if os.path.exists(csv_dim) else pd.DataFrame(columns=["code_site"])
+
+    # Informations des sites issues des mesures
+    frames = [df_previous.reindex(columns=["code_site"] + station_columns)]
+    if df_polluant is not None:
+        frames.append(df_polluant.reindex(columns=["code_site"] + station_columns))
+    df_sites = pd.concat(frames, ignore_index=True).drop_duplicates(subset=["code_site"], keep="last")
+
+    # Informations géographiques issues de l'export des stations (celles de la dimension précédente à défaut)
+    if os.path.exists(csv_station):
+        df_geo = load_station(csv_station)[['code'] + geo_columns].rename(columns={'code': 'code_site'})
+    else:
+        df_geo = df_previous.reindex(columns=["code_site"] + geo_columns)
+
+    df_dim = df_geo.merge(df_sites, on="code_site", how="outer")[["code_site"] + station_columns + geo_columns]
+    df_dim = df_dim.dropna(subset=["code_site"]).drop_duplicates(subset=["code_site"], keep="last")
+
+    df_dim.to_csv(csv_dim, sep=";", header=True, index=False, encoding="utf-8", lineterminator="\n")
+    print(f"Fichier {csv_dim} mis à jour ({len(df_dim)} stations).")
+
+    return df_dim
+
+def iqa_path(csv_polluant):
+    """
+    Détermine le nom du fichier IQA associé à un fichier de polluants
+
+    Entrée
+        csv_polluant (str) chemin du fichier de polluants (`geodair_hour.csv` ou `geodair_max_daily.csv`)
+    
+    Sortie
+        csv_iqa (str) chemin du fichier IQA
+    """
+    if "daily" in csv_polluant:
+        return csv_polluant.replace("max", "iqa")
+    elif "weekly" in csv_polluant:
+        return csv_polluant.replace("max", "iqa")
+    return csv_polluant.replace(".csv", "_iqa.csv")
+
+def process_polluant(frames, csv, append=True):
+    """
+    Traite en une seule passe et en mémoire les données fraîchement téléchargées
+    - Mise à jour de la dimension station, dédoublonnage avec l'historique, tri et calcul de l'IQA
+    - Les tables de faits ne conservent que les colonnes propres aux mesures (voir to_fact)
+    - L'historique n'est lu qu'une fois et les fichiers csv (polluants et IQA) ne sont écrits qu'une fois, à la fin
+
+    Entrée
+        frames (list de dataFrame pandas) données téléchargées (une par polluant), en-têtes nettoyés
+        csv (str) chemin du fichier de polluants à mettre à jour
+        append (bool, optionnel) ajoute les données à l'historique existant plutôt que de le remplacer. Defaults to True
+    
+    Sortie
+        df (dataFrame pandas) table de faits traitée, dates au format datetime (None si aucune donnée)
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    history = append and os.path.exists(csv)
+
+    if not frames and not history:
+        print(f"Aucune donnée à traiter pour {csv}.")
+        return None
+
+    # Les informations des stations alimentent la dimension station, les mesures la table de faits
+    if frames:
+        with stage("parse") as st:
+            df_new = parse_dates(pd.concat(frames, ignore_index=True))
+            st.rows_out += len(df_new)
+        with stage("merge") as st:
+            df_dim = update_station_dim(df_new)
+            df = to_fact(df_new)
+            st.rows_in += len(df)
+            if history:
+                st.read(csv)
+                df = pd.concat([to_fact(read_polluant_csv(csv)), df], ignore_index=True)
+            st.rows_out += len(df)
+    else:
+        with stage("merge") as st:
+            df_dim = update_station_dim()
+            st.read(csv)
+            df = to_fact(read_polluant_csv(csv))
+            st.rows_out += len(df)
+
+    # Vérification des doublons
+    with stage("dedupe", rows_in=len(df)) as st:
+        df = deduplicate_polluant(df)
+        st.rows_out += len(df)
+    # Ordonnement des données
+    with stage("sort", rows_in=len(df), rows_out=len(df)):
+        df = reorder_polluant(df)
+    # Calcul de l'IQA par département
+    with stage("iqa", rows_in=len(df)) as st:
+        df_iqa = compute_iqa(df, df_dim)
+        st.rows_out += len(df_iqa)
+
+    # Écriture unique des fichiers de sortie
+    csv_iqa = iqa_path(csv)
+    with stage("write", rows_in=len(df) + len(df_iqa)) as st:
+        write_polluant_csv(df, csv)
+        write_polluant_csv(df_iqa, csv_iqa)
+        st.wrote(csv)
+        st.wrote(csv_iqa)
+    print(f"Fichier {csv} mis à jour.")
+    print(f"Fichier {csv_iqa} complété à partir de {csv}.")
+
+    return df
+
+def create_session(max_retries=export_max_retries, pool_size=len(polluants['code'])):
+    """
+    Crée une session HTTP partagée par les requêtes vers l'API Geodair
+    - Pool de connexions dimensionné sur le nombre d'exports simultanés
+    - Nouvelles tentatives avec attente exponentielle sur les erreurs transitoires (429, 5xx)
+
+    Entrée
+        max_retries (int, optionnel) nombre maximal de nouvelles tentatives par requête
+        pool_size (int, optionnel) nombre maximal de connexions simultanées
+
+    Sortie
+        session (requests.Session) session configurée
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update({"apikey": api_key})
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def fetch_export(session, gen_url, date_str, code, name, deadline):
+    """
+    Demande la génération de l'export d'un polluant puis sonde le lien de téléchargement jusqu'à ce qu'il soit prêt
+    - L'attente entre deux sondages double à chaque réponse 202, dans la limite de export_poll_max_delay
+    - Le sondage est abandonné à l'échéance globale
+
+    Entrée
+        session (requests.Session) session partagée
+        gen_url (str) URL de l'API de génération de l'export
+        date_str (str) date des données au format YYYY-MM-DD
+        code (str) code du polluant
+        name (str) nom du polluant
+        deadline (float) échéance globale (horloge time.monotonic)
+
+    Sortie
+        df (dataFrame pandas) données de l'export, en-têtes nettoyés (None en cas d'échec)
+    """
+    dwl_url = f"{api_url}/download"  # URL de l'API pour le téléchargement des données
+
+    print(f"Demande de génération du fichier : {name}")
+    response = session.get(gen_url, params={"date": date_str, "polluant": code}, timeout=60)
+    if response.status_code != 200:
+        print(f"Erreur lors de la génération du lien : {name} : {response.status_code} - {response.reason} - {response.text}")
+        return None
+
+    file_id = response.text.strip()
+    print(f"Génération du lien d'accès aux données : {name}")
+
+    delay = export_poll_delay
+    while True:
+        download_response = session.get(dwl_url, params={"id": file_id}, timeout=60)
+        if download_response.status_code == 200:
+            count("download", bytes_read=len(download_response.content))
+            df = pd.read_csv(io.StringIO(download_response.text), sep=";", encoding="utf-8", low_memory=False)
+            print(f"Récupération des données : {name}")
+            return clean_header(df)
+        if download_response.status_code != 202:
+            print(f"Erreur lors de la récupération du fichier {name} : {download_response.status_code} - {download_response.reason} - {download_response.text}")
+            return None
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"Délai dépassé, export abandonné : {name}")
+            return None
+        print(f"Le fichier {name} n'est pas encore prêt. Nouvelle tentative dans {min(delay, remaining):.1f} secondes...")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, export_poll_max_delay)
+
+def fetch_exports(gen_url, date_str, timeout=export_timeout):
+    """
+    Demande simultanément les exports de tous les polluants d'intérêt et les sonde en parallèle
+    - Chaque export est lu dès qu'il est prêt, indépendamment des autres
+    - La durée totale est bornée par timeout (les exports non prêts à l'échéance sont ignorés)
+
+    Entrée
+        gen_url (str) URL de l'API de génération des exports
+        date_str (str) date des données au format YYYY-MM-DD
+        timeout (float, optionnel) délai global en secondes
+
+    Sortie
+        frames (list) données récupérées, une dataFrame par polluant, dans l'ordre d'arrivée
+    """
+    deadline = time.monotonic() + timeout
+    frames = []
+
+    with stage("download") as st, create_session() as session, ThreadPoolExecutor(max_workers=len(polluants['code'])) as executor:
+        futures = {
+            executor.submit(fetch_export, session, gen_url, date_str, code, name, deadline): name
+            for code, name in zip(polluants['code'], polluants['name'])
+        }
+        try:
+            # Marge au-delà de l'échéance pour la dernière requête en cours (timeout HTTP)
+            for future in as_completed(futures, timeout=timeout + 60):
+                try:
+                    df = future.result()
+                except Exception as e:
+                    print(f"Erreur lors de la récupération du fichier {futures[future]} : {e}")
+                    continue
+                if df is not None:
+                    frames.append(df)
+        except FuturesTimeoutError:
+            print("Délai global dépassé : les exports restants sont ignorés.")
+        st.rows_out += sum(len(frame) for frame in frames)
+
+    print(f"{len(frames)}/{len(futures)} exports récupérés")
+    return frames
+
 def fetch_hour_today(date=datetime.today()):
     """
     Récupère les valeurs horaires des polluants via l'API Geodair
@@ -353,64 +771,18 @@ def fetch_hour_today(date=datetime.today()):
     Sortie
         Le fichier csv horaire des polluants est mise à jour par réécriture 
     """
-    gen_url = "https://www.geodair.fr/api-ext/MoyH/export"  # URL de l'API pour les moyennes horaires par date et par polluant
-    dwl_url = "https://www.geodair.fr/api-ext/download"  # URL de l'API pour le téléchargement des données
+    gen_url = f"{api_url}/MoyH/export"  # URL de l'API pour les moyennes horaires par date et par polluant
     date_str = date.strftime("%Y-%m-%d")  # mise au format nécessaire pour adresser la requête d'id
     csv = "geodair_hour.csv"  # nom du fichier csv à mettre à jour
-    file_exists = False  # variable de différenciation de la boucle pour initialiser les en-têtes
-    
-    # Supprime le fichier précédent s'il existe
-    if os.path.exists(csv):
-        os.remove(csv)
-        print(f"Fichier {csv} supprimé.")
 
     # Mise à jour des données liées aux stations
     fetch_station()
     
     print(f"Traitement des données horaires : {date_str}")
-    for i in range(len(polluants['code'])):
-        code = polluants['code'][i]
-        name = polluants['name'][i]
-
-        headers = {"apikey": api_key}
-        params = {"date": date_str, "polluant": code}
-
-        print(f"Demande de génération du fichier : {name}")
-        response = requests.get(gen_url, headers=headers, params=params)  # paramétrage de l'accès à l'API
-
-        if response.status_code == 200:
-            file_id = response.text.strip()
-            print(f"Génération du lien d'accès aux données : {name}")
-
-            while True:
-                download_response = requests.get(dwl_url, headers=headers, params={"id": file_id})
-                if download_response.status_code == 200:
-                    df = pd.read_csv(io.StringIO(download_response.text), sep=";", encoding="utf-8", low_memory=False)
-                    df = clean_header(df)
-                    print(f"Récupération des données : {name}")
-                    # Ecrire dans le csv avec l'en-tête seulement pour la première itération
-                    df.to_csv(csv, sep=';', mode='a', header=not file_exists, index=False, encoding='utf-8', lineterminator="\n")
-                    # Mise à jour du flag après la première écriture
-                    file_exists = True
-                    print(f"Fichier {csv} complété pour {name}.")                        
-                    break
-                elif download_response.status_code == 202:
-                    print("Le fichier n'est pas encore prêt. Nouvelle tentative dans 5 secondes...")
-                    time.sleep(5)
-                else:
-                    print(f"Erreur lors de la récupération du fichier {name} : {download_response.status_code} - {download_response.reason} - {download_response.text}")
-                    break
-        else:
-            print(f"Erreur lors de la génération du lien : {name} : {response.status_code} - {response.reason} - {download_response.text}")
+    frames = fetch_exports(gen_url, date_str)
     
-    # Fusion avec données de localisation
-    merge_polluant_station(csv)
-    # Vérification des doublons
-    deduplicate_csv(csv)
-    # Ordonnement des données
-    reorder_csv(csv)  
-    # Calcul de l'IQA par site de prélévement
-    update_iqa(csv) 
+    # Fusion avec données de localisation, dédoublonnage, tri et IQA en une seule passe (le fichier est réécrit)
+    process_polluant(frames, csv, append=False)
     
     return
 
@@ -422,202 +794,571 @@ def fetch_max_yesterday(date = datetime.today()-timedelta(days=1)):
         date (datetime, optionnel) date de recueil des données à collecter (par défaut la veille) = datetime(year, month, day)
         
     Sortie
-        Le fichier csv journalier des polluants est mis à jour par ajout de ligne de donnée
+        written (list) fichiers mis à jour : partitions du mois concerné, manifestes, historique hebdomadaire et dimension station
     """   
-    gen_url = "https://www.geodair.fr/api-ext/MaxJH/export"  # URL de l'API pour valeurs moyennes horaire des polluants
-    dwl_url = "https://www.geodair.fr/api-ext/download"  # URL de l'API pour le téléchargement des données
     date_str = date.strftime("%Y-%m-%d")  # date du jour au format YYYY-MM-DD
-    csv = "geodair_max_daily.csv"  # nom du fichier de travail (pics d'enregistrement de polluant journalier à mettre à jour)
 
     # Mise à jour des données liées aux stations
     fetch_station()
 
     print(f"Traitement des données journalière : {date_str}")
-    for i in range(len(polluants['code'])):
-        code = polluants['code'][i]
-        name = polluants['name'][i]
-
-        headers = {"apikey": api_key}
-        params = {"date": date_str, "polluant": code}
-
-        print(f"Demande de génération du fichier : {name}")
-        response = requests.get(gen_url, headers=headers, params=params)  # paramétrage de l'accès à l'API
-
-        if response.status_code == 200:
-            file_id = response.text.strip()
-            print(f"Génération du lien d'accès aux données : {name}")
-
-            while True:
-                download_response = requests.get(dwl_url, headers=headers, params={"id": file_id})
-
-                if download_response.status_code == 200:
-                    df = pd.read_csv(io.StringIO(download_response.text), sep=";", encoding="utf-8", low_memory=False)
-                    df = clean_header(df)                    
-                    print(f"Récupération des données : {name}")   
-                    df.to_csv(csv, sep=";", mode='a', header=not os.path.exists(csv), index=False, encoding='utf-8')
-                    print(f"Fichier {csv} renseigné pour {name}.")
-                    break
-                elif download_response.status_code == 202:
-                    print("Le fichier n'est pas encore prêt. Nouvelle tentative dans 5 secondes...")
-                    time.sleep(5)
-                else:
-                    print(f"Erreur lors de la récupération du fichier {name} : {download_response.status_code} - {download_response.reason} - {download_response.text}")
-                    break
-        else:
-            print(f"Erreur lors de la récupération du fichier {name} : {response.status_code} - {response.reason} - {response.text}")
+    frames = fetch_exports(max_daily_url, date_str)
 
-    # Fusion avec données de localisation
-    merge_polluant_station(csv)
-    # Vérification des doublons
-    deduplicate_csv(csv)
-    # Ordonnement des données
-    reorder_csv(csv)  
-    # Calcul de l'IQA par site de prélévement
-    update_iqa(csv)
-    # Met à jour les données hebdomadaires
-    aggregate_weekly()
-    
-    return
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        print(f"Aucune donnée récupérée pour le {date_str}.")
+        return []
+
+    return process_max_daily(frames)
 
-def aggregate_weekly():
+def process_max_daily(frames):
+    """
+    Intègre les pics journaliers téléchargés à l'historique (traitement de fetch_max_yesterday, sans accès réseau)
+
+    Entrée
+        frames (list de dataFrame pandas) données téléchargées (une par polluant), en-têtes nettoyés
+
+    Sortie
+        written (list) fichiers mis à jour : partitions des mois et des semaines concernés, manifestes et dimension station
     """
-    Aggrège les valeurs journalières de la semaine passée en maximum hebdomadaire pour chaque site et chaque polluant
-    - Ajoute les données à l'historique hebdomadaire au format csv
+    # Découpage de l'ancien historique en partitions lors de la première exécution
+    migrate_daily_history()
+
+    # Dimension station, puis dédoublonnage, tri et IQA des seules partitions concernées
+    with stage("parse") as st:
+        df_new = parse_dates(pd.concat(frames, ignore_index=True))
+        st.rows_out += len(df_new)
+    with stage("merge", rows_in=len(df_new)) as st:
+        df_dim = update_station_dim(df_new)
+        df_fact = to_fact(df_new)
+        st.rows_out += len(df_fact)
+    written = update_daily_partitions(df_fact, df_dim)
+    # Met à jour les données hebdomadaires des seules semaines concernées par les nouvelles données
+    written += aggregate_weekly(semaines=week_label(df_new['date_de_debut']).dropna().unique())
+    written.append(csv_station_dim)
     
+    return written
+
+def update_daily_partitions(df_new, df_dim, root=daily_root, root_iqa=iqa_root):
+    """
+    Ajoute des mesures à l'historique journalier partitionné par mois
+    - Seules les partitions des mois concernés sont relues, dédoublonnées, triées et réécrites
+    - L'IQA de ces mois est recalculé dans l'historique IQA, partitionné de la même façon
+    - Les manifestes (partitions, nombre de lignes, dates extrêmes) sont mis à jour
+
+    Entrée
+        df_new (dataFrame pandas) table de faits des nouvelles mesures, dates au format datetime
+        df_dim (dataFrame pandas) dimension station (voir update_station_dim)
+        root (str, optionnel) dossier de l'historique journalier
+        root_iqa (str, optionnel) dossier de l'historique IQA
+
+    Sortie
+        written (list) fichiers écrits (partitions et manifestes)
+    """
+    manifest = load_manifest(root)
+    manifest_iqa = load_manifest(root_iqa)
+    written = []
+
+    for key, df_part in df_new.groupby(partition_keys(df_new['date_de_debut'])):
+        entry, entry_iqa = update_daily_partition(key, df_part, df_dim, root, root_iqa)
+        manifest["partitions"][key] = entry
+        manifest_iqa["partitions"][key] = entry_iqa
+        written += [partition_path(root, key), partition_path(root_iqa, key)]
+
+    written += [save_manifest(root, manifest), save_manifest(root_iqa, manifest_iqa)]
+
+    return written
+
+def update_daily_partition(key, df_part, df_dim, root=daily_root, root_iqa=iqa_root):
+    """
+    Fusionne de nouvelles mesures dans une partition mensuelle de l'historique journalier
+    - La partition existante est relue, dédoublonnée, triée et réécrite, et son IQA recalculé
+    - Les manifestes ne sont pas modifiés : les entrées à y enregistrer sont renvoyées
+
+    Entrée
+        key (str) clé de la partition (AAAA-MM)
+        df_part (dataFrame pandas) table de faits des nouvelles mesures du mois, dates au format datetime
+        df_dim (dataFrame pandas) dimension station (voir update_station_dim)
+        root (str, optionnel) dossier de l'historique journalier
+        root_iqa (str, optionnel) dossier de l'historique IQA
+
+    Sortie
+        (tuple de dict) entrées de la partition dans le manifeste journalier et dans le manifeste IQA
+    """
+    os.makedirs(root, exist_ok=True)
+    os.makedirs(root_iqa, exist_ok=True)
+    path = partition_path(root, key)
+    if os.path.exists(path):
+        with stage("merge", rows_in=len(df_part)) as st:
+            st.read(path)
+            df_part = pd.concat([read_polluant_csv(path), df_part], ignore_index=True)
+            st.rows_out += len(df_part)
+
+    # Dédoublonnage, tri et IQA de la partition
+    with stage("dedupe", rows_in=len(df_part)) as st:
+        df_part = deduplicate_polluant(df_part)
+        st.rows_out += len(df_part)
+    with stage("sort", rows_in=len(df_part), rows_out=len(df_part)):
+        df_part = reorder_polluant(df_part)
+    with stage("iqa", rows_in=len(df_part)) as st:
+        df_iqa = compute_iqa(df_part, df_dim)
+        st.rows_out += len(df_iqa)
+
+    with stage("write", rows_in=len(df_part) + len(df_iqa)) as st:
+        write_polluant_csv(df_part, path)
+        write_polluant_csv(df_iqa, partition_path(root_iqa, key))
+        st.wrote(path)
+        st.wrote(partition_path(root_iqa, key))
+    entries = {"partitions": {}}, {"partitions": {}}
+    register_partition(entries[0], key, df_part, 'date_de_debut')
+    register_partition(entries[1], key, df_iqa, 'date_de_debut')
+    print(f"Partition {key} mise à jour ({len(df_part)} lignes, {len(df_iqa)} IQA).")
+
+    return entries[0]["partitions"][key], entries[1]["partitions"][key]
+
+def migrate_daily_history(csv="geodair_max_daily.csv", root=daily_root, root_iqa=iqa_root):
+    """
+    Découpe l'ancien historique journalier (fichier unique) en partitions mensuelles
+    - Sans effet si l'historique est déjà partitionné ou si l'ancien fichier n'existe pas
+    - L'ancien fichier est conservé tel quel
+
+    Entrée
+        csv (str, optionnel) chemin de l'ancien historique journalier
+        root (str, optionnel) dossier de l'historique journalier partitionné
+        root_iqa (str, optionnel) dossier de l'historique IQA partitionné
+
+    Sortie
+        written (list) fichiers écrits (partitions et manifestes)
+    """
+    if os.path.exists(os.path.join(root, MANIFEST)) or not os.path.exists(csv):
+        return []
+
+    print(f"Migration de {csv} vers l'historique partitionné {root}...")
+    df = read_polluant_csv(csv)
+    df_dim = update_station_dim(df)
+    return update_daily_partitions(to_fact(df), df_dim, root, root_iqa)
+
+def load_checkpoint(root=backfill_root):
+    """
+    Charge le point de reprise d'un backfill
+
+    Entrée
+        root (str, optionnel) dossier du backfill
+
+    Sortie
+        checkpoint (dict) jours entièrement téléchargés et leur nombre de lignes ({"days": {AAAA-MM-JJ: lignes}})
+    """
+    path = os.path.join(root, checkpoint_file)
+    if not os.path.exists(path):
+        return {"days": {}}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+def save_checkpoint(root, checkpoint):
+    """
+    Sauvegarde le point de reprise d'un backfill (écriture atomique, comme les manifestes)
+
+    Entrée
+        root (str) dossier du backfill
+        checkpoint (dict) jours entièrement téléchargés
+    """
+    path = os.path.join(root, checkpoint_file)
+    checkpoint["days"] = dict(sorted(checkpoint["days"].items()))
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+def fetch_backfill_day(date_str, root=backfill_root):
+    """
+    Télécharge les exports journaliers de tous les polluants pour une date et les dépose, bruts, dans le dossier du backfill
+
+    Entrée
+        date_str (str) date au format YYYY-MM-DD
+        root (str, optionnel) dossier du backfill
+
+    Sortie
+        (tuple) nombre de lignes téléchargées et booléen indiquant si tous les exports ont été récupérés
+    """
+    frames = fetch_exports(max_daily_url, date_str)
+    complete = len(frames) == len(polluants['code'])
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return 0, complete
+
+    df = pd.concat(frames, ignore_index=True)
+    path = os.path.join(root, f"{date_str}.csv")
+    df.to_csv(path + ".tmp", sep=";", header=True, index=False, encoding="utf-8", lineterminator="\n")
+    os.replace(path + ".tmp", path)
+    return len(df), complete
+
+def process_backfill_month(key, paths, root=daily_root, root_iqa=iqa_root, csv_dim=csv_station_dim):
+    """
+    Fusionne dans une partition mensuelle les jours téléchargés par le backfill (exécutée dans un processus dédié)
+
+    Entrée
+        key (str) clé de la partition (AAAA-MM)
+        paths (list) exports bruts des jours du mois
+        root (str, optionnel) dossier de l'historique journalier
+        root_iqa (str, optionnel) dossier de l'historique IQA
+        csv_dim (str, optionnel) chemin du fichier de la dimension station
+
     Sortie
-        Le fichier csv hedomadaire des polluants est mis à jour à partir du fichier csv journalier
+        (tuple) clé de la partition et ses entrées dans les manifestes journalier et IQA
+    """
+    df = pd.concat([read_polluant_csv(path) for path in paths], ignore_index=True)
+    return (key, *update_daily_partition(key, to_fact(df), read_station_dim(csv_dim), root, root_iqa))
+
+def backfill(start, end, max_days=4, max_processes=None, root=backfill_root):
+    """
+    Reconstruit l'historique journalier sur une période
+    - Les jours sont téléchargés en parallèle, déposés dans root et consignés dans un point de reprise :
+      une exécution interrompue ne retélécharge que les jours manquants ou incomplets
+    - Les partitions mensuelles sont ensuite traitées en parallèle dans un pool de processus
+    - Stations, dimension station, manifestes et agrégation hebdomadaire ne sont traités qu'une fois
+
+    Entrée
+        start (str ou datetime) premier jour de la période
+        end (str ou datetime) dernier jour de la période
+        max_days (int, optionnel) nombre de jours téléchargés simultanément
+        max_processes (int, optionnel) nombre de processus de traitement des partitions (par défaut, un par cœur)
+        root (str, optionnel) dossier du backfill
+
+    Sortie
+        written (list) fichiers mis à jour : partitions, manifestes, historique hebdomadaire et dimension station
+    """
+    os.makedirs(root, exist_ok=True)
+    checkpoint = load_checkpoint(root)
+    days = [day.strftime("%Y-%m-%d") for day in pd.date_range(start, end, freq="D")]
+    pending = [day for day in days if day not in checkpoint["days"]]
+    print(f"Backfill du {start} au {end} : {len(days) - len(pending)} jour(s) déjà téléchargé(s), {len(pending)} à télécharger.")
+
+    # Stations et migration de l'ancien historique, une seule fois pour toute la période
+    fetch_station()
+    migrate_daily_history()
+
+    # Téléchargement des jours manquants, consignés au fil de l'eau
+    with ThreadPoolExecutor(max_workers=max_days) as executor:
+        futures = {executor.submit(fetch_backfill_day, day, root): day for day in pending}
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                rows, complete = future.result()
+            except Exception as e:
+                print(f"Erreur lors du téléchargement du {day} : {e}")
+                continue
+            if complete:
+                checkpoint["days"][day] = rows
+                save_checkpoint(root, checkpoint)
+            else:
+                print(f"Exports incomplets pour le {day} : il sera retéléchargé à la prochaine exécution.")
+
+    staged = {day: os.path.join(root, f"{day}.csv") for day in days if os.path.exists(os.path.join(root, f"{day}.csv"))}
+    if not staged:
+        print("Aucune donnée téléchargée sur la période.")
+        return []
+
+    # Dimension station mise à jour une fois, à partir des informations de sites de tous les jours (ordre chronologique)
+    df_sites = pd.concat([
+        pd.read_csv(path, sep=";", encoding="utf-8", dtype=str, usecols=lambda col: col in ["code_site"] + station_columns)
+        for path in staged.values()
+    ], ignore_index=True)
+    update_station_dim(df_sites)
+
+    # Traitement des partitions mensuelles en parallèle, manifestes enregistrés une fois à la fin
+    months = {}
+    for day, path in staged.items():
+        months.setdefault(day[:7], []).append(path)
+    manifest = load_manifest(daily_root)
+    manifest_iqa = load_manifest(iqa_root)
+    written = []
+    # Les étapes exécutées dans les processus de traitement sont mesurées globalement, depuis le processus principal
+    # Processus démarrés par spawn : un fork copierait le verrou du rapport d'exécution, que le thread de mesure de la
+    # mémoire peut tenir à cet instant, et le processus de traitement se bloquerait à sa première étape
+    with stage("partitions") as st, ProcessPoolExecutor(max_workers=max_processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(process_backfill_month, key, paths) for key, paths in sorted(months.items())]
+        for future in as_completed(futures):
+            key, entry, entry_iqa = future.result()
+            manifest["partitions"][key] = entry
+            manifest_iqa["partitions"][key] = entry_iqa
+            written += [partition_path(daily_root, key), partition_path(iqa_root, key)]
+            st.rows_out += entry["rows"] + entry_iqa["rows"]
+            st.wrote(partition_path(daily_root, key))
+            st.wrote(partition_path(iqa_root, key))
+        st.bytes_read += sum(os.path.getsize(path) for path in staged.values())
+    written += [save_manifest(daily_root, manifest), save_manifest(iqa_root, manifest_iqa)]
+
+    # Agrégation hebdomadaire des seules semaines de la période
+    written += aggregate_weekly(semaines=week_label(pd.to_datetime(pd.Series(list(staged)))).unique())
+    written.append(csv_station_dim)
+
+    missing = [day for day in days if day not in checkpoint["days"]]
+    if missing:
+        print(f"{len(missing)} jour(s) incomplet(s) à reprendre : {', '.join(missing[:10])}{'...' if len(missing) > 10 else ''}")
+
+    return written
+
+def week_label(dates):
     """
-    csv_daily = "geodair_max_daily.csv"  # nom du fichier de travail (pics d'enregistrement de polluant journalier à aggréger)
-    csv_weekly = "geodair_max_weekly.csv"  # nom du fichier de travail (pics d'enregistrement de polluant hebdomadaire à mettre à jour)
-    df = pd.read_csv(csv_daily, sep=";", parse_dates=['date_de_debut'], low_memory=False, encoding="utf-8")  # chargement csv > dataFrame
+    Donne la semaine de chaque date au format année-semaine (ex. 2025-S06), clé de l'historique hebdomadaire
+
+    Entrée
+        dates (Series pandas) dates au format datetime
     
-    # Mettre au format la colonne 'date_de_debut' en datetime
-    df['date_de_debut'] = pd.to_datetime(df['date_de_debut'], format="%Y/%m/%d %H:%M:%S")  
+    Sortie
+        (Series pandas) semaines au format année-semaine
+    """
+    return dates.dt.strftime('%Y-S%U')
 
-    # Ajouter la colonne 'semaine' au format année-semaine
-    df['semaine'] = df['date_de_debut'].dt.strftime('%Y-S%U')
-
-    # Définir les colonnes à conserver lors du regroupement
-    groupby_cols = [
-        "semaine", "organisme", "code_zas", "zas", "code_site", "nom_site",
-        "type_d'implantation", "polluant", "type_d'influence", "discriminant",
-        "reglementaire", "type_d'evaluation", "procedure_de_mesure", "type_de_valeur",
-        "unite_de_mesure", "taux_de_saisie", "couverture_temporelle", "couverture_de_donnees",
-        "code_qualite", "validite", "code_commune", "commune", "longitude", "latitude", "code_departement", "departement"
-    ]
+def week_bounds(semaine):
+    """
+    Donne le premier (dimanche) et le dernier jour (samedi) d'une semaine au format année-semaine
 
-    # Agréger les données par semaine et par site avec la valeur maximale
-    df_weekly = df.groupby(groupby_cols, as_index=False).agg(
-        max_week=('valeur', 'max')
-    )
+    Entrée
+        semaine (str) semaine au format année-semaine (ex. 2025-S06)
+    
+    Sortie
+        (tuple de datetime) début et fin de la semaine
+    """
+    debut = datetime.strptime(f"{semaine}-0", "%Y-S%U-%w")
+    return debut, debut + timedelta(days=6)
 
-    # Vérifier si l'historique hebdomadaire existe déjà
-    if os.path.exists(csv_weekly):
-        df_hist = pd.read_csv(csv_weekly, sep=";", low_memory=False, encoding="utf-8")
-        # Concaténer et éviter les doublons
-        df_final = pd.concat([df_hist, df_weekly], ignore_index=True)
-        df_final = df_final.drop_duplicates(subset=["semaine", "code_site", "nom_site", "polluant"], keep='last')
+def read_daily_weeks(semaines=None, root=daily_root):
+    """
+    Charge depuis l'historique journalier partitionné les seules lignes appartenant aux semaines indiquées
+    - Seules les partitions recouvrant ces semaines sont lues
+
+    Entrée
+        semaines (iterable, optionnel) semaines à conserver au format année-semaine. Par défaut, tout l'historique
+        root (str, optionnel) dossier de l'historique journalier
+    
+    Sortie
+        df (dataFrame pandas) lignes des semaines demandées, dates au format datetime
+    """
+    manifest = load_manifest(root)
+    if semaines is None:
+        keys = select_partitions(manifest)
     else:
-        df_final = df_weekly
+        semaines = set(semaines)
+        keys = sorted({key for semaine in semaines for key in select_partitions(manifest, *week_bounds(semaine))})
 
-    # Réécriture de l'historique
-    df_final.to_csv(csv_weekly, sep=";", mode='w', header=True, index=False, encoding='utf-8', lineterminator="\n")
-    print(f"Fichier {csv_weekly} complété à partir de {csv_daily}.")
+    frames = [read_polluant_csv(partition_path(root, key)) for key in keys]
+    if not frames:
+        return pd.DataFrame(columns=['date_de_debut', 'code_site', 'polluant', 'unite_de_mesure', 'valeur'])
+    df = pd.concat(frames, ignore_index=True)
 
-    return
+    if semaines is not None:
+        df = df[week_label(df['date_de_debut']).isin(semaines)]
+    return df
 
-def update_iqa(csv_polluant="geodair_max_daily.csv"):
+def week_partition_keys(semaines):
     """
-    Calcule l'IQA pour chaque couple date/site et génère un nouveau fichier CSV avec l'IQA ajouté.
+    Donne la clé de partition (année) de chaque semaine de l'historique hebdomadaire
+
+    Entrée
+        semaines (Series pandas) semaines au format année-semaine
+
+    Sortie
+        (Series pandas) clés de partition (AAAA)
+    """
+    return semaines.str[:4]
+
+def update_weekly_partitions(df_weekly, semaines=None, root=weekly_root):
+    """
+    Remplace des semaines dans l'historique hebdomadaire partitionné par année
+    - Seules les partitions des années concernées sont relues et réécrites
+    - Le manifeste (partitions, nombre de lignes, premier jour de la première et de la dernière semaine) est mis à jour
+
+    Entrée
+        df_weekly (dataFrame pandas) maximums hebdomadaires recalculés (colonnes weekly_columns)
+        semaines (iterable, optionnel) semaines remplacées au format année-semaine, y compris celles sans mesure. Par défaut, celles de df_weekly
+        root (str, optionnel) dossier de l'historique hebdomadaire
+
+    Sortie
+        written (list) fichiers écrits (partitions et manifeste)
+    """
+    semaines = pd.Series(sorted(set(df_weekly['semaine']) if semaines is None else set(semaines)), dtype=object)
+    manifest = load_manifest(root)
+    os.makedirs(root, exist_ok=True)
+    written = []
+
+    for key, semaines_part in semaines.groupby(week_partition_keys(semaines)):
+        path = partition_path(root, key)
+        df_part = df_weekly[df_weekly['semaine'].isin(semaines_part)]
+        if os.path.exists(path):
+            with stage("merge", rows_in=len(df_part)) as st:
+                st.read(path)
+                df_hist = pd.read_csv(path, sep=";", low_memory=False, encoding="utf-8").reindex(columns=weekly_columns)
+                # Remplacer les semaines recalculées et éviter les doublons
+                df_hist = df_hist[~df_hist['semaine'].isin(semaines_part)]
+                df_part = pd.concat([df_hist, df_part], ignore_index=True)
+                df_part = df_part.drop_duplicates(subset=["semaine", "code_site", "polluant"], keep='last')
+                st.rows_out += len(df_part)
+
+        with stage("write", rows_in=len(df_part)) as st:
+            df_part.to_csv(path, sep=";", mode='w', header=True, index=False, encoding='utf-8', lineterminator="\n")
+            st.wrote(path)
+        register_partition(manifest, key, df_part.assign(debut=pd.to_datetime(df_part['semaine'] + "-0", format="%Y-S%U-%w")), 'debut')
+        written.append(path)
+
+    written.append(save_manifest(root, manifest))
+
+    return written
+
+def migrate_weekly_history(csv="geodair_max_weekly.csv", root=weekly_root):
+    """
+    Découpe l'ancien historique hebdomadaire (fichier unique) en partitions annuelles
+    - Sans effet si l'historique est déjà partitionné ou si l'ancien fichier n'existe pas
+    - L'ancien fichier est conservé tel quel
+
+    Entrée
+        csv (str, optionnel) chemin de l'ancien historique hebdomadaire
+        root (str, optionnel) dossier de l'historique hebdomadaire partitionné
+
+    Sortie
+        written (list) fichiers écrits (partitions et manifeste)
+    """
+    if os.path.exists(os.path.join(root, MANIFEST)) or not os.path.exists(csv):
+        return []
+
+    print(f"Migration de {csv} vers l'historique partitionné {root}...")
+    df = pd.read_csv(csv, sep=";", low_memory=False, encoding="utf-8").reindex(columns=weekly_columns)
+    return update_weekly_partitions(df.dropna(subset=['semaine']), root=root)
+
+def aggregate_weekly(df_daily=None, semaines=None, root=weekly_root):
+    """
+    Aggrège les valeurs journalières en maximum hebdomadaire pour chaque site et chaque polluant
+    - Seules les semaines indiquées sont recalculées, puis remplacées dans l'historique hebdomadaire partitionné par année
+    - Seules les partitions des années concernées sont réécrites (voir update_weekly_partitions)
+    
+    Entrée
+        df_daily (dataFrame pandas, optionnel) historique journalier déjà chargé, dates au format datetime (lu depuis les partitions sinon)
+        semaines (iterable, optionnel) semaines à recalculer au format année-semaine. Par défaut, toutes les semaines des données journalières
+        root (str, optionnel) dossier de l'historique hebdomadaire
+
+    Sortie
+        written (list) fichiers écrits (partitions et manifeste de l'historique hebdomadaire)
+    """
+    # Découpage de l'ancien historique en partitions lors de la première exécution
+    written = migrate_weekly_history(root=root)
+
+    # Sélection des données journalières des semaines à recalculer
+    with stage("read") as st:
+        df = read_daily_weeks(semaines) if df_daily is None else df_daily
+        st.rows_out += len(df)
+    if df.empty:
+        print("Aucune donnée journalière à agréger.")
+        return written
+    
+    # Ajouter la colonne 'semaine' au format année-semaine
+    df = df.assign(semaine=week_label(df['date_de_debut']))
+    if semaines is not None:
+        semaines = set(semaines)
+        df = df[df['semaine'].isin(semaines)]
+
+    # Agréger les données par semaine, site et polluant avec la valeur maximale
+    # (les informations des stations sont portées par la dimension station)
+    with stage("aggregate", rows_in=len(df)) as st:
+        df_weekly = df.groupby(["semaine", "code_site", "polluant"], as_index=False).agg(
+            unite_de_mesure=('unite_de_mesure', 'first'),
+            max_week=('valeur', 'max')
+        )[weekly_columns]
+        st.rows_out += len(df_weekly)
+
+    # Réécriture des seules partitions concernées
+    written += update_weekly_partitions(df_weekly, semaines, root)
+    print(f"Historique {root} complété à partir de {daily_root}.")
+
+    return written
+
+def get_iqa(valeurs, polluant):
+    """
+    Calcule le sous-indice IQA de chaque valeur pour un polluant donné
+    - Le sous-indice vaut i * 50 pour la première tranche de seuils [s(i), s(i+1)] contenant la valeur, 300 au-delà
+
+    Entrée
+        valeurs (array-like) concentrations mesurées
+        polluant (str) nom du polluant (les seuils par défaut sont utilisés pour un polluant inconnu)
+    
+    Sortie
+        (numpy array) sous-indices IQA
+    """
+    thresholds = IQA_THRESHOLDS.get(str(polluant).upper(), IQA_DEFAULT_THRESHOLDS)
+    return np.searchsorted(thresholds[1:], valeurs, side='left') * 50
+
+def get_gravite(iqa):
+    """
+    Donne la gravité associée à une valeur d'IQA
+    """
+    if iqa <= 50:
+        return "Bon"
+    elif iqa <= 100:
+        return "Modéré"
+    elif iqa <= 150:
+        return "Mauvais"
+    elif iqa <= 200:
+        return "Très mauvais"
+    elif iqa <= 300:
+        return "Dangereux"
+    return "Très dangereux"
+
+def compute_iqa(df, df_dim=None):
+    """
+    Calcule l'IQA pour chaque couple date/département : maximum des sous-indices des polluants mesurés
 
     Entrée:
-        csv_polluant (str): Chemin du fichier CSV à traiter (`geodair_hour.csv` ou `geodair_max_daily.csv` par défaut).
+        df (dataFrame pandas) table de faits des polluants avec les dates au format datetime
+        df_dim (dataFrame pandas, optionnel) dimension station donnant le département de chaque site (lue depuis le csv sinon)
 
     Sortie:
-        Un nouveau fichier CSV est créé avec une ligne par date/station pour l'IQA.
+        df_iqa (dataFrame pandas) une ligne par date/département
     """
-    # Vérifier si le fichier existe
-    if not os.path.exists(csv_polluant):
-        raise FileNotFoundError(f"Le fichier {csv_polluant} n'existe pas.")
+    keys = ['date_de_fin', 'code_departement']
 
-    # Déterminer le nom du fichier de sortie en fonction du fichier d'entrée
-    if "daily" in csv_polluant:
-        csv_iqa = csv_polluant.replace("max", "iqa")
-    elif "weekly" in csv_polluant:
-        csv_iqa = csv_polluant.replace("max", "iqa")
-    else:
-        csv_iqa = csv_polluant.replace(".csv", "_iqa.csv")
+    # Le département n'est joint que pour le calcul de l'IQA
+    if 'code_departement' not in df.columns:
+        if df_dim is None:
+            df_dim = read_station_dim()
+        df = df.merge(df_dim[['code_site', 'code_departement']], on='code_site', how='left')
 
-    # Charger le fichier CSV
-    df = pd.read_csv(csv_polluant, sep=";", low_memory=False, encoding="utf-8")
+    # Convertir 'valeur' en float pour éviter les erreurs de calcul
+    df = df.assign(valeur=pd.to_numeric(df['valeur'], errors='coerce'))
+    df = df.dropna(subset=['valeur'] + keys)  # Supprimer les lignes où 'valeur' ou la clé de regroupement est vide
 
-    # Colonnes de date
-    date_columns = ['date_de_debut', 'date_de_fin']
+    # Sous-indice IQA de chaque mesure, calculé par polluant
+    iqa = pd.Series(0, index=df.index)
+    for polluant, index in df.groupby('polluant').groups.items():
+        iqa.loc[index] = get_iqa(df.loc[index, 'valeur'].to_numpy(), polluant)
 
-    # Convertir les colonnes de date en datetime pour traitement
-    for col in date_columns:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce', format='%Y/%m/%d %H:%M:%S')
+    # Date de début de la première mesure du groupe, IQA et gravité
+    df_iqa = df.drop_duplicates(subset=keys, keep='first').set_index(keys)[['date_de_debut']].sort_index()
+    df_iqa['indice_qualite_air'] = 'IQA'
+    df_iqa['valeur'] = iqa.groupby([df[key] for key in keys]).max()
+    df_iqa['risque'] = df_iqa['valeur'].map(get_gravite)
 
-    # Convertir 'valeur' en float pour éviter les erreurs de calcul
-    df['valeur'] = pd.to_numeric(df['valeur'], errors='coerce')
-    df = df.dropna(subset=['valeur'])  # Supprimer les lignes où 'valeur' est NaN
-
-    # Définition des seuils IQA pour chaque polluant
-    IQA_THRESHOLDS = {
-        "PM10": [0, 20, 40, 50, 100, 150, 200],
-        "PM2.5": [0, 10, 20, 25, 50, 75, 100],
-        "NO2": [0, 40, 90, 120, 230, 340, 400],
-        "O3": [0, 50, 100, 130, 240, 380, 500],
-        "SO2": [0, 50, 100, 150, 200, 300, 400],
-    }
+    return df_iqa.reset_index()[['date_de_debut', 'date_de_fin', 'code_departement', 'indice_qualite_air', 'valeur', 'risque']]
 
-    # Fonction pour calculer l'IQA
-    def get_iqa(value, thresholds):
-        for i in range(len(thresholds) - 1):
-            if value <= thresholds[i + 1]:
-                return i * 50
-        return 300
-
-    # Fonction pour obtenir la gravité de l'IQA
-    def get_gravite(iqa):
-        if iqa <= 50:
-            return "Bon"
-        elif iqa <= 100:
-            return "Modéré"
-        elif iqa <= 150:
-            return "Mauvais"
-        elif iqa <= 200:
-            return "Très mauvais"
-        elif iqa <= 300:
-            return "Dangereux"
-        return "Très dangereux"
-
-    # Calculer l'IQA pour chaque groupe de données
-    df_iqa = df.groupby(
-        ['date_de_fin', 'code_departement']
-    ).apply(lambda group: pd.Series({
-        **{col: group[col].iloc[0] for col in group.columns if col not in ['polluant', 'valeur', 'unite_de_mesure']},  # Conserver toutes les colonnes sauf polluant, valeur, unité
-        'indice_qualite_air': 'IQA',
-        'valeur': max(get_iqa(row['valeur'], IQA_THRESHOLDS.get(row['polluant'].upper(), [0, 50, 100, 150, 200, 300, 400]))
-                      for _, row in group.iterrows()),
-        'risque': get_gravite(max(get_iqa(row['valeur'], IQA_THRESHOLDS.get(row['polluant'].upper(), [0, 50, 100, 150, 200, 300, 400])) for _, row in group.iterrows())) 
-    }), include_groups=False).reset_index(drop=True) 
-
-    # Réintégration du format de date original
-    for col in date_columns:
-        if col in df_iqa.columns:
-            df_iqa[col] = df_iqa[col].dt.strftime('%Y/%m/%d %H:%M:%S')
+def update_iqa(csv_polluant="geodair_max_daily.csv"):
+    """
+    Calcule l'IQA pour chaque couple date/site et génère un nouveau fichier CSV avec l'IQA ajouté.
+
+    Entrée:
+        csv_polluant (str): Chemin du fichier CSV à traiter (`geodair_hour.csv` ou `geodair_max_daily.csv` par défaut).
+
+    Sortie:
+        Un nouveau fichier CSV est créé avec une ligne par date/station pour l'IQA.
+    """
+    df_iqa = compute_iqa(read_polluant_csv(csv_polluant))
 
     # Sauvegarder le fichier mis à jour dans un nouveau fichier CSV
-    df_iqa.to_csv(csv_iqa, sep=";", mode='w', header=True, index=False, encoding='utf-8', lineterminator="\n")
+    csv_iqa = iqa_path(csv_polluant)
+    write_polluant_csv(df_iqa, csv_iqa)
     print(f"Fichier {csv_iqa} complété à partir de {csv_polluant}.")
     
     return
 
 def load_data_from_s3(BUCKET_NAME="bucket-asthme-scraping", FILE_KEY=None, file_type="csv", parse_dates=None):
     """Fonction pour charger les données depuis le serveur S3"""
-    s3 = boto3.client('s3')
+    s3 = storage_client()
     
     if file_type == "csv":
         obj = s3.get_object(Bucket=BUCKET_NAME, Key=FILE_KEY)
@@ -638,17 +1379,29 @@ def get_max_daily_from_s3(csv = "geodair_max_daily.csv"):
     
 ## Application ##
 
-fetch_max_yesterday() #1/j à 12h
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collecte des données de pollution Geodair et envoi vers S3")
+    parser.add_argument("--backfill", nargs=2, metavar=("DEBUT", "FIN"), help="reconstruit l'historique journalier du DEBUT au FIN (AAAA-MM-JJ)")
+    parser.add_argument("--days", type=int, default=4, help="jours téléchargés simultanément pendant le backfill")
+    parser.add_argument("--processes", type=int, default=None, help="processus de traitement des partitions pendant le backfill")
+    args = parser.parse_args()
 
-# Upload des fichiers générés vers AWS S3
-files_to_upload = [
-    "geodair_station.csv",
-    "geodair_max_daily.csv",
-    "geodair_max_weekly.csv",
-    "geodair_iqa_daily.csv"
-]
-
-bucket_name = "bucket-asthme-scraping"
-
-for local_file in files_to_upload:
-    upload_to_s3(local_file, bucket_name, local_file)
\ No newline at end of file
+    # Durée, volumes et mémoire de chaque étape consignés dans un rapport d'exécution (voir instrumentation.py)
+    start_report("geodair_backfill" if args.backfill else "geodair")
+    status = "failed"
+    try:
+        if args.backfill:
+            written = backfill(*args.backfill, max_days=args.days, max_processes=args.processes)
+        else:
+            written = fetch_max_yesterday() #1/j à 12h
+
+        # Publication des fichiers générés dans une nouvelle version (seules les partitions réécrites et leurs manifestes),
+        # le pointeur de version courante étant basculé en dernier
+        files_to_upload = [csv_station] + written
+        with stage("upload") as st:
+            publish_version(storage_client(), bucket_name, files_to_upload, publish_prefix)
+            for local_file in dict.fromkeys(files_to_upload):
+                st.wrote(local_file)
+        status = "success"
+    finally:
+        finish_report(status)
@@ -0,0 +1,203 @@
+## Library ##
+import os
+
+import pandas as pd
+from partitions import MANIFEST, load_manifest, save_manifest
+from instrumentation import stage
+
+## Setting ##
+
+# Stockage long format des taux de passages aux urgences pour asthme (Géodes)
+# - <prefix>/weeks/<Semaine>.csv : relevés d'une semaine, ajoutés sans réécrire l'historique
+# - <prefix>/<Annee>.parquet : instantané colonnaire de l'année, seul fichier réécrit à chaque ajout
+# - <prefix>/manifest.json : partitions (années), ordre des départements et dernière semaine publiée
+PREFIX = "geodes"
+LOCAL_ROOT = "/tmp/geodes"
+
+# Colonnes temporelles du format large (xlsx historique) et colonnes du format long
+TIME_COLUMNS = ["Semaine", "Annee", "Mois"]
+LONG_COLUMNS = TIME_COLUMNS + ["Département", "Passages"]
+
+## Function ##
+
+def to_long(df_wide):
+    """
+    Passe un tableau au format large (une colonne par département) au format long (une ligne par semaine et département)
+
+    Entrée
+        df_wide (dataFrame pandas) colonnes Semaine, Annee, Mois puis une colonne par département
+
+    Sortie
+        (dataFrame pandas) colonnes Semaine, Annee, Mois, Département, Passages, dans l'ordre des semaines
+    """
+    df_long = df_wide.reset_index(names="_ordre").melt(
+        id_vars=["_ordre"] + TIME_COLUMNS, var_name="Département", value_name="Passages"
+    )
+    df_long["Passages"] = pd.to_numeric(df_long["Passages"], errors="coerce").fillna(0)
+    # Une seule série de relevés par semaine (la plus récente), dans l'ordre d'origine des semaines
+    df_long = df_long.drop_duplicates(subset=["Semaine", "Département"], keep="last")
+    return df_long.sort_values("_ordre", kind="stable")[LONG_COLUMNS].reset_index(drop=True)
+
+def week_records(donnees_scrap, aujourdhui):
+    """
+    Relevés de la semaine courante au format long
+
+    Entrée
+        donnees_scrap (dict) chiffre de chaque département
+        aujourdhui (date) date du relevé
+
+    Sortie
+        (dataFrame pandas) une ligne par département
+    """
+    annee = aujourdhui.year
+    semaine = f"{annee}-S{aujourdhui.isocalendar()[1]:02d}"
+    return pd.DataFrame({
+        "Semaine": semaine,
+        "Annee": annee,
+        "Mois": aujourdhui.strftime('%b'),
+        "Département": list(donnees_scrap),
+        "Passages": [float(valeur) for valeur in donnees_scrap.values()],
+    })[LONG_COLUMNS]
+
+def snapshot_file(key):
+    return f"{key}.parquet"
+
+def download_manifest(s3, bucket_name, prefix=PREFIX, local_root=LOCAL_ROOT):
+    """
+    Télécharge le manifeste du stockage long format
+
+    Sortie
+        manifest (dict) partitions, départements et dernière semaine publiée (None si le stockage n'existe pas encore)
+    """
+    os.makedirs(local_root, exist_ok=True)
+    try:
+        s3.download_file(bucket_name, f"{prefix}/{MANIFEST}", os.path.join(local_root, MANIFEST))
+    except Exception as e:
+        print(f"Aucun manifeste {prefix}/{MANIFEST} : {e}")
+        return None
+    return load_manifest(local_root)
+
+def download_snapshot(s3, bucket_name, manifest, key, prefix=PREFIX, local_root=LOCAL_ROOT):
+    """
+    Télécharge l'instantané d'une année (vide si l'année n'est pas encore dans le stockage)
+    """
+    if key not in manifest["partitions"]:
+        return pd.DataFrame(columns=LONG_COLUMNS)
+    path = os.path.join(local_root, snapshot_file(key))
+    with stage("download") as st:
+        s3.download_file(bucket_name, f"{prefix}/{snapshot_file(key)}", path)
+        st.read(path)
+        df = pd.read_parquet(path)
+        st.rows_out += len(df)
+    return df
+
+def upload_snapshot(s3, bucket_name, manifest, key, df, prefix=PREFIX, local_root=LOCAL_ROOT):
+    """
+    Écrit et envoie l'instantané colonnaire d'une année, puis l'enregistre dans le manifeste
+    """
+    path = os.path.join(local_root, snapshot_file(key))
+    with stage("write", rows_in=len(df)) as st:
+        df = df.astype({"Annee": "int32", "Passages": "float64", "Département": "category"})
+        df.to_parquet(path, index=False, compression="zstd")
+        st.wrote(path)
+    with stage("upload") as st:
+        s3.upload_file(path, bucket_name, f"{prefix}/{snapshot_file(key)}")
+        st.wrote(path)
+    manifest["partitions"][key] = {
+        "file": snapshot_file(key),
+        "rows": int(len(df)),
+        "first_week": df["Semaine"].iloc[0] if not df.empty else None,
+        "last_week": df["Semaine"].iloc[-1] if not df.empty else None,
+    }
+
+def upload_manifest(s3, bucket_name, manifest, prefix=PREFIX, local_root=LOCAL_ROOT):
+    # Le manifeste est publié en dernier, une fois les instantanés à jour
+    path = save_manifest(local_root, manifest)
+    s3.upload_file(path, bucket_name, f"{prefix}/{MANIFEST}")
+
+def migrate_excel(s3, bucket_name, excel_key, prefix=PREFIX, local_root=LOCAL_ROOT):
+    """
+    Initialise le stockage long format à partir de l'historique xlsx (première exécution)
+
+    Sortie
+        manifest (dict) manifeste du stockage initialisé (sans partition si le xlsx n'existe pas)
+    """
+    manifest = {"partitions": {}, "departements": [], "last_week": None}
+    path = os.path.join(local_root, "geodes_migration.xlsx")
+    try:
+        s3.download_file(bucket_name, excel_key, path)
+        df_wide = pd.read_excel(path, engine="openpyxl")
+    except Exception as e:
+        print(f"Aucun historique {excel_key} à migrer : {e}")
+        return manifest
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    print(f"Migration de {excel_key} vers {prefix}/")
+    df_long = to_long(df_wide)
+    manifest["departements"] = [col for col in df_wide.columns if col not in TIME_COLUMNS]
+    for annee, df_year in df_long.groupby("Annee", sort=True):
+        upload_snapshot(s3, bucket_name, manifest, str(annee), df_year, prefix, local_root)
+    if not df_long.empty:
+        manifest["last_week"] = df_long["Semaine"].iloc[-1]
+        manifest["last_partition"] = str(df_long["Annee"].iloc[-1])
+    upload_manifest(s3, bucket_name, manifest, prefix, local_root)
+    return manifest
+
+def append_week(s3, bucket_name, df_week, excel_key="geodes_complet.xlsx", prefix=PREFIX, local_root=LOCAL_ROOT):
+    """
+    Ajoute les relevés d'une semaine au stockage long format
+    - Sans effet si les chiffres sont identiques à ceux de la dernière semaine publiée
+    - Les relevés de la semaine sont déposés dans <prefix>/weeks/ (une nouvelle exécution dans la semaine les remplace)
+    - Seul l'instantané de l'année de la semaine est relu et réécrit, quelle que soit la taille de l'historique
+
+    Entrée
+        s3 (client boto3) client S3
+        bucket_name (str) nom du bucket
+        df_week (dataFrame pandas) relevés de la semaine au format long (voir week_records)
+        excel_key (str, optionnel) ancien historique xlsx, migré lors de la première exécution
+
+    Sortie
+        (bool) True si la semaine a été publiée
+    """
+    manifest = download_manifest(s3, bucket_name, prefix, local_root)
+    if manifest is None:
+        manifest = migrate_excel(s3, bucket_name, excel_key, prefix, local_root)
+
+    semaine = df_week["Semaine"].iloc[0]
+    key = str(df_week["Annee"].iloc[0])
+    df_year = download_snapshot(s3, bucket_name, manifest, key, prefix, local_root)
+
+    # Vérification des doublons : chiffres identiques à la dernière semaine publiée
+    if manifest.get("last_week"):
+        with stage("dedupe", rows_in=len(df_week)):
+            last_key = manifest.get("last_partition", key)
+            df_last = df_year if last_key == key else download_snapshot(s3, bucket_name, manifest, last_key, prefix, local_root)
+            previous = df_last[df_last["Semaine"] == manifest["last_week"]].set_index("Département")["Passages"]
+            current = df_week.set_index("Département")["Passages"]
+            departements = previous.index.union(current.index)
+            identical = previous.reindex(departements, fill_value=0).astype(float).equals(current.reindex(departements, fill_value=0).astype(float))
+        if identical:
+            print("Données identiques à la dernière semaine publiée, pas de mise à jour nécessaire")
+            return False
+
+    # Relevés de la semaine, puis instantané de l'année et manifeste
+    path = os.path.join(local_root, f"{semaine}.csv")
+    df_week.to_csv(path, index=False, encoding="utf-8")
+    with stage("upload") as st:
+        s3.upload_file(path, bucket_name, f"{prefix}/weeks/{semaine}.csv")
+        st.wrote(path)
+
+    with stage("merge", rows_in=len(df_week)) as st:
+        df_year = pd.concat([df_year[df_year["Semaine"] != semaine], df_week], ignore_index=True)
+        st.rows_out += len(df_year)
+    upload_snapshot(s3, bucket_name, manifest, key, df_year, prefix, local_root)
+    manifest["departements"] = manifest.get("departements", []) + [
+        dept for dept in df_week["Département"] if dept not in set(manifest.get("departements", []))
+    ]
+    manifest["last_week"] = semaine
+    manifest["last_partition"] = key
+    upload_manifest(s3, bucket_name, manifest, prefix, local_root)
+    print(f"Semaine {semaine} publiée dans {prefix}/ ({len(df_week)} départements)")
+    return True
@@ -0,0 +1,274 @@
+## Library ##
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+## Setting ##
+
+# Rapports d'exécution des collectes : <dossier>/<job>/<horodatage>.json, et une ligne par exécution dans
+# <dossier>/<job>/history.jsonl pour suivre l'évolution des étapes d'une exécution à l'autre
+REPORT_DIR = os.environ.get("ASTHME_REPORT_DIR", "reports")
+# Intervalle de mesure de la mémoire résidente (secondes)
+MEMORY_INTERVAL = 0.01
+STATM = "/proc/self/statm"
+STATUS = "/proc/self/status"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+COUNTERS = ("rows_in", "rows_out", "bytes_read", "bytes_written")
+
+## Function ##
+
+def current_rss():
+    """
+    Mémoire résidente du processus en octets (None si /proc n'est pas disponible)
+    """
+    try:
+        with open(STATM) as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+def max_rss():
+    """
+    Pic de mémoire résidente du processus depuis son démarrage, en octets (None si indisponible)
+    - VmHWM de /proc/self/status : ru_maxrss hérite du pic du processus parent lors d'un fork (subprocess),
+      il n'est utilisé qu'en l'absence de /proc
+    """
+    try:
+        with open(STATUS) as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss est en kilo-octets sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def file_size(path):
+    return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+
+class Stage:
+    """
+    Mesures d'une étape, cumulées sur ses exécutions successives (ex. une fois par partition)
+    - rows_in, rows_out : lignes en entrée et en sortie
+    - bytes_read, bytes_written : octets lus (téléchargements, fichiers) et écrits
+    - peak_rss : pic de mémoire résidente pendant l'étape
+    - cpu_s : temps CPU des étapes mesurées dans des threads (voir thread_stage), sans durée murale propre
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.peak_rss = None
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+
+    def read(self, path):
+        """Compte la taille d'un fichier lu par l'étape"""
+        self.bytes_read += file_size(path)
+
+    def wrote(self, path):
+        """Compte la taille d'un fichier écrit par l'étape"""
+        self.bytes_written += file_size(path)
+
+    def observe_memory(self, rss):
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+
+    def summary(self):
+        summary = {"name": self.name, "calls": self.calls, "wall_s": round(self.wall_s, 4), "cpu_s": round(self.cpu_s, 4)}
+        summary.update({counter: int(getattr(self, counter)) for counter in COUNTERS})
+        summary["peak_rss_mb"] = round(self.peak_rss / 2 ** 20, 1) if self.peak_rss is not None else None
+        summary["rows_per_s"] = round(max(summary["rows_in"], summary["rows_out"]) / self.wall_s, 1) if self.wall_s else None
+        summary["mb_per_s"] = round((summary["bytes_read"] + summary["bytes_written"]) / 2 ** 20 / self.wall_s, 2) if self.wall_s else None
+        return summary
+
+
+class RunReport:
+    """
+    Rapport d'exécution d'une collecte : durée, volumes et mémoire de chaque étape
+    - La mémoire résidente est mesurée en continu par un thread dédié pendant les étapes en cours
+    - Les étapes sont identifiées par leur nom ; une étape exécutée plusieurs fois cumule ses mesures
+    """
+    def __init__(self, job):
+        self.job = job
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.active = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.monitor = None
+        if current_rss() is not None:
+            self.monitor = threading.Thread(target=self.watch_memory, daemon=True)
+            self.monitor.start()
+
+    def watch_memory(self):
+        while not self.stopped.wait(MEMORY_INTERVAL):
+            rss = current_rss()
+            with self.lock:
+                for stage in self.active:
+                    stage.observe_memory(rss)
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = Stage(name)
+            return self.stages[name]
+
+    @contextmanager
+    def stage(self, name, **counters):
+        stage = self.get(name)
+        self.add(name, **counters)
+        rss = current_rss()
+        with self.lock:
+            stage.observe_memory(rss)
+            self.active.append(stage)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            rss = current_rss()
+            with self.lock:
+                stage.calls += 1
+                stage.wall_s += elapsed
+                # Sans /proc, le pic du processus depuis son démarrage est la meilleure borne disponible
+                stage.observe_memory(rss if rss is not None else max_rss())
+                self.active.remove(stage)
+
+    def add(self, name, **counters):
+        stage = self.get(name)
+        with self.lock:
+            for counter, value in counters.items():
+                setattr(stage, counter, getattr(stage, counter) + (value or 0))
+
+    def summary(self, status="success"):
+        with self.lock:
+            stages = [stage.summary() for stage in self.stages.values()]
+        peak = max_rss()
+        return {
+            "job": self.job,
+            "status": status,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_s": round(time.perf_counter() - self.start, 3),
+            "max_rss_mb": round(peak / 2 ** 20, 1) if peak is not None else None,
+            "stages": stages,
+        }
+
+    def write(self, status="success", report_dir=REPORT_DIR):
+        """
+        Écrit le rapport de l'exécution et l'ajoute à l'historique des exécutions du job
+
+        Sortie
+            path (str) chemin du rapport
+        """
+        self.stopped.set()
+        summary = self.summary(status)
+        folder = os.path.join(report_dir, self.job)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{self.started_at:%Y%m%dT%H%M%S}.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2, ensure_ascii=False)
+        with open(os.path.join(folder, "history.jsonl"), "a", encoding="utf-8") as file:
+            file.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        print(format_summary(summary))
+        print(f"Rapport d'exécution : {path}")
+        return path
+
+
+# Rapport de l'exécution en cours : les étapes mesurées hors exécution (import, tests) ne sont pas conservées
+current_report = None
+
+def start_report(job):
+    """
+    Démarre le rapport d'exécution d'une collecte ; les étapes mesurées par stage() y sont enregistrées
+    """
+    global current_report
+    current_report = RunReport(job)
+    return current_report
+
+def finish_report(status="success", report_dir=REPORT_DIR):
+    """
+    Écrit le rapport de l'exécution en cours (voir RunReport.write)
+
+    Sortie
+        path (str) chemin du rapport (None si aucun rapport n'est en cours)
+    """
+    global current_report
+    report, current_report = current_report, None
+    return report.write(status, report_dir) if report is not None else None
+
+@contextmanager
+def stage(name, **counters):
+    """
+    Mesure une étape de la collecte en cours (durée, mémoire) ; l'étape produite permet de compter lignes et octets
+
+    Entrée
+        name (str) nom de l'étape (download, parse, merge, dedupe, sort, iqa, aggregate, write, upload...)
+        counters (int, optionnel) compteurs initiaux : rows_in, rows_out, bytes_read, bytes_written
+
+    Sortie
+        stage (Stage) mesures de l'étape, à compléter dans le bloc (ex. stage.rows_out = len(df))
+    """
+    if current_report is None:
+        yield Stage(name)
+        return
+    with current_report.stage(name, **counters) as measured:
+        yield measured
+
+@contextmanager
+def thread_stage(name, **counters):
+    """
+    Mesure une étape exécutée dans des threads parallèles, à l'intérieur d'une étape déjà mesurée (ex. analyse des
+    pages téléchargées pendant download)
+    - Seul le temps CPU du thread est cumulé (cpu_s) : les durées murales de threads parallèles se chevauchent et sont
+      déjà comptées par l'étape englobante
+
+    Entrée
+        name (str) nom de l'étape
+        counters (int, optionnel) compteurs initiaux : rows_in, rows_out, bytes_read, bytes_written
+    """
+    if current_report is None:
+        yield Stage(name)
+        return
+    measured = current_report.get(name)
+    current_report.add(name, **counters)
+    start = time.thread_time()
+    try:
+        yield measured
+    finally:
+        elapsed = time.thread_time() - start
+        with current_report.lock:
+            measured.calls += 1
+            measured.cpu_s += elapsed
+
+def count(name, **counters):
+    """
+    Ajoute des compteurs à une étape de la collecte en cours (ex. octets téléchargés depuis un thread)
+    """
+    if current_report is not None:
+        current_report.add(name, **counters)
+
+def format_summary(summary):
+    lines = [f"Étapes de {summary['job']} ({summary['duration_s']:.1f} s, pic mémoire {summary['max_rss_mb']} Mo)"]
+    for stage in summary["stages"]:
+        lines.append(
+            f"  {stage['name']:<10} {stage['wall_s']:8.2f} s  x{stage['calls']:<4}"
+            f" lignes {stage['rows_in']:>9} -> {stage['rows_out']:<9}"
+            f" lu {stage['bytes_read'] / 2 ** 20:8.1f} Mo  écrit {stage['bytes_written'] / 2 ** 20:8.1f} Mo"
+            f"  pic {stage['peak_rss_mb']} Mo"
+            + (f"  cpu {stage['cpu_s']:.2f} s" if stage['cpu_s'] else "")
+        )
+    return "\n".join(lines)
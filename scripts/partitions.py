@@ -0,0 +1,112 @@
+## Library ##
+import json
+import os
+from datetime import datetime
+
+## Setting ##
+
+# Nom du manifeste décrivant les partitions d'un historique
+MANIFEST = "manifest.json"
+
+# Format des clés de partition (une partition par mois)
+PARTITION_FORMAT = "%Y-%m"
+
+## Function ##
+
+def partition_keys(dates):
+    """
+    Donne la clé de partition (mois au format AAAA-MM) de chaque date
+
+    Entrée
+        dates (Series pandas) dates au format datetime
+
+    Sortie
+        (Series pandas) clés de partition
+    """
+    return dates.dt.strftime(PARTITION_FORMAT)
+
+def partition_path(root, key):
+    """
+    Chemin du fichier csv d'une partition
+
+    Entrée
+        root (str) dossier de l'historique partitionné
+        key (str) clé de la partition (AAAA-MM)
+
+    Sortie
+        (str) chemin du fichier de la partition
+    """
+    return os.path.join(root, f"{key}.csv")
+
+def load_manifest(root):
+    """
+    Charge le manifeste d'un historique partitionné
+
+    Entrée
+        root (str) dossier de l'historique partitionné
+
+    Sortie
+        manifest (dict) description des partitions ({"partitions": {clé: {"file", "rows", "min_date", "max_date"}}})
+    """
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return {"partitions": {}}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+def save_manifest(root, manifest):
+    """
+    Sauvegarde le manifeste d'un historique partitionné
+    - L'écriture passe par un fichier temporaire pour ne jamais laisser un manifeste incomplet
+
+    Entrée
+        root (str) dossier de l'historique partitionné
+        manifest (dict) description des partitions
+
+    Sortie
+        (str) chemin du manifeste
+    """
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, MANIFEST)
+    manifest["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    manifest["partitions"] = dict(sorted(manifest["partitions"].items()))
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+def register_partition(manifest, key, df, date_column):
+    """
+    Enregistre dans le manifeste le nombre de lignes et les dates extrêmes d'une partition
+
+    Entrée
+        manifest (dict) description des partitions, mise à jour en place
+        key (str) clé de la partition (AAAA-MM)
+        df (dataFrame pandas) contenu de la partition
+        date_column (str) colonne de date (au format datetime) de la partition
+    """
+    manifest["partitions"][key] = {
+        "file": f"{key}.csv",
+        "rows": int(len(df)),
+        "min_date": df[date_column].min().strftime("%Y-%m-%d") if not df.empty else None,
+        "max_date": df[date_column].max().strftime("%Y-%m-%d") if not df.empty else None,
+    }
+
+def select_partitions(manifest, start=None, end=None):
+    """
+    Sélectionne les partitions d'un manifeste recouvrant une période
+
+    Entrée
+        manifest (dict) description des partitions
+        start (datetime, optionnel) début de la période (sans limite par défaut)
+        end (datetime, optionnel) fin de la période (sans limite par défaut)
+
+    Sortie
+        (list) clés des partitions, par ordre chronologique
+    """
+    first = start.strftime(PARTITION_FORMAT) if start is not None else None
+    last = end.strftime(PARTITION_FORMAT) if end is not None else None
+    return [
+        key for key in sorted(manifest["partitions"])
+        if (first is None or key >= first) and (last is None or key <= last)
+    ]
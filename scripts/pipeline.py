@@ -0,0 +1,255 @@
+"""
+Ordonnanceur local des collectes de données
+
+Les collectes sont déclarées comme un graphe de tâches (DAG) :
+- les sources indépendantes (Geodair, pollens, Géodes) s'exécutent en parallèle
+- chaque tâche reçoit les artefacts de ses dépendances ; ils sont conservés dans <cache>/<run_id>/ et une tâche
+  déjà réussie n'est pas rejouée lorsque l'exécution est relancée (reprise après échec)
+- une tâche en échec est retentée seule, les tâches qui en dépendent sont ignorées si elle échoue définitivement
+- statut, nombre de tentatives et durée de chaque tâche sont enregistrés dans <cache>/<run_id>/run.json
+
+Usage
+    python scripts/pipeline.py                                  # toutes les tâches, stockage ASTHME_STORAGE (S3 par défaut)
+    ASTHME_STORAGE=fs:/tmp/asthme python scripts/pipeline.py    # stockage sur le système de fichiers
+    python scripts/pipeline.py --only geodair_upload pollen_publish
+    python scripts/pipeline.py --run-id 2025-02-10 --force      # rejoue toutes les tâches d'une exécution
+    python scripts/pipeline.py --only geodes_publish --geodes-job ";moins de 15 ans"
+"""
+## Library ##
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+## Setting ##
+
+BUCKET_NAME = "bucket-asthme-scraping"
+CACHE_DIR = ".pipeline"
+# Extractions Géodes supplémentaires de la tâche geodes_scrape ("indicateur;classe d'âge;période", option --geodes-job)
+GEODES_EXTRA_JOBS = []
+
+## Function ##
+
+class Task:
+    """
+    Tâche du pipeline : func(context) renvoie un artefact sérialisable en JSON (chemins de fichiers, compteurs...)
+    - context["artifacts"] : artefacts des dépendances, par nom de tâche
+    - context["workdir"] : dossier de l'exécution, pour les artefacts volumineux écrits sur disque
+    """
+    def __init__(self, name, func, deps=(), retries=2, retry_delay=30):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+
+class Pipeline:
+    def __init__(self, tasks, cache_dir=CACHE_DIR, run_id=None, max_workers=4):
+        self.tasks = {task.name: task for task in tasks}
+        self.run_id = run_id or datetime.today().strftime("%Y-%m-%d")
+        self.workdir = os.path.join(cache_dir, self.run_id)
+        self.max_workers = max_workers
+        self.state_path = os.path.join(self.workdir, "run.json")
+
+    def selection(self, only=None):
+        # Tâches demandées et l'ensemble de leurs dépendances
+        selected, stack = set(), list(only or self.tasks)
+        while stack:
+            name = stack.pop()
+            if name not in self.tasks:
+                raise ValueError(f"Tâche inconnue : {name}")
+            if name not in selected:
+                selected.add(name)
+                stack.extend(self.tasks[name].deps)
+        return selected
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return {"run_id": self.run_id, "tasks": {}}
+        with open(self.state_path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def save_state(self, state):
+        state["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(state, file, indent=2, ensure_ascii=False)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def artifact_path(self, name):
+        return os.path.join(self.workdir, f"{name}.json")
+
+    def load_artifact(self, name):
+        with open(self.artifact_path(name), encoding="utf-8") as file:
+            return json.load(file)
+
+    def execute(self, task, artifacts):
+        # Exécute une tâche avec ses nouvelles tentatives (attente doublée à chaque échec)
+        record = {"status": "failed", "attempts": 0, "started_at": datetime.now().isoformat(timespec="seconds")}
+        start = time.perf_counter()
+        for attempt in range(1, task.retries + 2):
+            record["attempts"] = attempt
+            try:
+                value = task.func({"artifacts": artifacts, "workdir": self.workdir})
+                with open(self.artifact_path(task.name), "w", encoding="utf-8") as file:
+                    json.dump(value, file, indent=2, ensure_ascii=False, default=str)
+                record["status"] = "success"
+                record.pop("error", None)
+                break
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+                print(f"❌ {task.name} : échec de la tentative {attempt}/{task.retries + 1} ({record['error']})")
+                traceback.print_exc()
+                if attempt <= task.retries:
+                    time.sleep(task.retry_delay * 2 ** (attempt - 1))
+        record["duration_s"] = round(time.perf_counter() - start, 3)
+        return record
+
+    def run(self, only=None, force=False):
+        """
+        Exécute les tâches sélectionnées dans l'ordre des dépendances, en parallèle dès que possible
+
+        Entrée
+            only (list, optionnel) tâches à exécuter (avec leurs dépendances). Par défaut, toutes
+            force (bool, optionnel) rejoue aussi les tâches déjà réussies pour cette exécution
+
+        Sortie
+            state (dict) statut, tentatives et durée de chaque tâche
+        """
+        os.makedirs(self.workdir, exist_ok=True)
+        selected = self.selection(only)
+        state = self.load_state()
+        start = time.perf_counter()
+
+        # Tâches déjà réussies lors d'une exécution précédente : leurs artefacts sont réutilisés
+        done, failed, artifacts = set(), set(), {}
+        for name in selected:
+            if not force and state["tasks"].get(name, {}).get("status") == "success" and os.path.exists(self.artifact_path(name)):
+                done.add(name)
+                artifacts[name] = self.load_artifact(name)
+                print(f"⏭ {name} : déjà réalisée ({self.run_id}), artefact réutilisé")
+        pending = selected - done
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            while pending or futures:
+                for name in sorted(pending):
+                    task = self.tasks[name]
+                    if any(dep in failed for dep in task.deps):
+                        pending.discard(name)
+                        failed.add(name)
+                        state["tasks"][name] = {"status": "skipped", "attempts": 0, "duration_s": 0}
+                        print(f"⏭ {name} : ignorée (dépendance en échec)")
+                    elif all(dep in done for dep in task.deps):
+                        pending.discard(name)
+                        print(f"🚀 {name}")
+                        futures[executor.submit(self.execute, task, {dep: artifacts[dep] for dep in task.deps})] = name
+                if not futures:
+                    break
+
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = futures.pop(future)
+                    record = future.result()
+                    state["tasks"][name] = record
+                    if record["status"] == "success":
+                        done.add(name)
+                        artifacts[name] = self.load_artifact(name)
+                        print(f"✅ {name} ({record['duration_s']:.1f} s, {record['attempts']} tentative(s))")
+                    else:
+                        failed.add(name)
+                    self.save_state(state)
+
+        state["duration_s"] = round(time.perf_counter() - start, 3)
+        self.save_state(state)
+        return state
+
+## Tasks ##
+
+def task_geodair_station(context):
+    import geodair
+    geodair.fetch_station(datetime.today())
+    return [geodair.csv_station]
+
+def task_geodair_daily(context):
+    import geodair
+    return geodair.fetch_max_yesterday(datetime.today() - timedelta(days=1))
+
+def task_geodair_upload(context):
+    import geodair
+    from publish import publish_version
+    from storage import storage_client
+    files = context["artifacts"]["geodair_station"] + context["artifacts"]["geodair_daily"]
+    current = publish_version(storage_client(), BUCKET_NAME, files, geodair.publish_prefix)
+    return {"version": current["version"], "files": files}
+
+def task_pollen_scrape(context):
+    from pollen import PollenDataScraper
+    scraper = PollenDataScraper(bucket_name=BUCKET_NAME, s3_key="pollen.csv")
+    new_data = scraper.fetch_pollen_data(manifest=scraper.download_manifest())
+    # Les nouvelles lignes sont conservées sur disque : la publication peut être retentée sans nouveau scraping
+    path = os.path.join(context["workdir"], "pollen_new.csv")
+    new_data.to_csv(path, index=False)
+    return {"file": path, "rows": len(new_data)}
+
+def task_pollen_publish(context):
+    from pollen import PollenDataScraper
+    scraped = context["artifacts"]["pollen_scrape"]
+    if not scraped["rows"]:
+        return {"rows": 0}
+    PollenDataScraper(bucket_name=BUCKET_NAME, s3_key="pollen.csv").update_and_upload(pd.read_csv(scraped["file"]))
+    return {"rows": scraped["rows"]}
+
+def task_geodes_scrape(context):
+    from asthme_scraper import AsthmeDataScraper, check_scraped_csv, parse_job
+    scraper = AsthmeDataScraper(headless=True, output_dir=os.path.join(context["workdir"], "geodes"))
+    # Extractions supplémentaires dans la même session de navigateur (CSV conservés dans le dossier de l'exécution)
+    csv_filepath = scraper.run_scraping([parse_job(job) for job in GEODES_EXTRA_JOBS])
+    # CSV absent ou vide : la tâche échoue et peut être retentée
+    check_scraped_csv(csv_filepath)
+    return csv_filepath
+
+def task_geodes_publish(context):
+    from asthme_scraper import update_geodes_store
+    return update_geodes_store(context["artifacts"]["geodes_scrape"], BUCKET_NAME, "geodes_complet.xlsx")
+
+TASKS = [
+    Task("geodair_station", task_geodair_station),
+    Task("geodair_daily", task_geodair_daily, deps=["geodair_station"]),
+    Task("geodair_upload", task_geodair_upload, deps=["geodair_station", "geodair_daily"]),
+    Task("pollen_scrape", task_pollen_scrape),
+    Task("pollen_publish", task_pollen_publish, deps=["pollen_scrape"]),
+    Task("geodes_scrape", task_geodes_scrape, retries=1),
+    Task("geodes_publish", task_geodes_publish, deps=["geodes_scrape"]),
+]
+
+## Application ##
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", help="tâches à exécuter (avec leurs dépendances)")
+    parser.add_argument("--run-id", help="identifiant de l'exécution (par défaut, la date du jour)")
+    parser.add_argument("--cache", default=CACHE_DIR, help="dossier des artefacts et de l'état des exécutions")
+    parser.add_argument("--workers", type=int, default=4, help="nombre de tâches exécutées simultanément")
+    parser.add_argument("--force", action="store_true", help="rejoue les tâches déjà réussies")
+    parser.add_argument("--list", action="store_true", help="affiche les tâches et leurs dépendances")
+    parser.add_argument("--geodes-job", action="append", default=[], metavar="INDICATEUR;AGE;PERIODE",
+                        help="extraction Géodes supplémentaire de geodes_scrape (répétable, voir asthme_scraper.py --job)")
+    args = parser.parse_args()
+    GEODES_EXTRA_JOBS.extend(args.geodes_job)
+
+    if args.list:
+        for task in TASKS:
+            print(f"{task.name:<16} <- {', '.join(task.deps) or '-'}")
+        raise SystemExit(0)
+
+    state = Pipeline(TASKS, cache_dir=args.cache, run_id=args.run_id, max_workers=args.workers).run(args.only, args.force)
+    print(f"\nExécution {state['run_id']} ({state['duration_s']:.1f} s)")
+    for name, record in sorted(state["tasks"].items()):
+        print(f"  {name:<16} {record['status']:<8} {record.get('attempts', 0)} tentative(s) {record.get('duration_s', 0):8.1f} s")
+    raise SystemExit(0 if all(record["status"] == "success" for record in state["tasks"].values()) else 1)
@@ -4,30 +4,109 @@ import re
 import json
 import pandas as pd
 from datetime import datetime
-import boto3
+from storage import storage_client
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from partitions import partition_keys, partition_path, load_manifest, save_manifest, register_partition, MANIFEST
+from instrumentation import stage, thread_stage, count, start_report, finish_report
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Site interrogé (POLLENS_URL pour viser un serveur de rejeu local, voir benchmarks/stand_in.py)
+POLLENS_URL = os.environ.get("POLLENS_URL", "https://www.pollens.fr")
+# Variables JS contenant les séries de pollen dans chaque page ville/pollen
+GRAPH_DATA_VARS = ["graphData", "previousYearGraphData"]
+GRAPH_DATA_PATTERNS = {var_name: re.compile(rb'var\s+' + var_name.encode() + rb'\s*=\s*(?=\[)') for var_name in GRAPH_DATA_VARS}
+json_decoder = json.JSONDecoder()
+
+
+def extract_graph_data(content, var_names=GRAPH_DATA_VARS):
+    # Extraction directe des tableaux JS depuis les octets bruts de la page, sans construire de DOM :
+    # on repère `var <nom> =` puis le littéral tableau est décodé en JSON jusqu'à son crochet fermant
+    script_data = {}
+    for var_name in var_names:
+        match = GRAPH_DATA_PATTERNS[var_name].search(content)
+        if not match:
+            continue
+        try:
+            script_data[var_name], _ = json_decoder.raw_decode(content[match.end():].decode('utf-8', errors='replace'))
+        except json.JSONDecodeError as e:
+            logger.error(f"Erreur JSON {var_name}: {e}")
+    return script_data
+
+
+class HostRateLimiter:
+    # Espace les requêtes vers un même hôte d'au moins 1 / requests_per_second secondes
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
 class PollenDataScraper:
-    def __init__(self, bucket_name, s3_key):
+    def __init__(self, bucket_name, s3_key, s3_prefix="pollen", max_workers=8, requests_per_second=5.0,
+                 max_retries=3, backoff_factor=1.0, base_url=POLLENS_URL):
         self.bucket_name = bucket_name
-        self.s3_key = s3_key
+        self.base_url = base_url.rstrip("/")
+        self.s3_key = s3_key  # ancien historique en fichier unique (migré vers s3_prefix)
+        self.s3_prefix = s3_prefix  # historique partitionné par mois : <prefix>/AAAA-MM.csv + manifest.json
         self.temp_csv_path = '/tmp/pollen.csv'
-        self.s3 = boto3.client('s3')
-        self.session = requests.Session()
+        self.local_root = os.path.join('/tmp', s3_prefix)
+        self.s3 = storage_client()
+        self.max_workers = max_workers  # nombre maximal de pages téléchargées en parallèle
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.session = self.create_session(max_retries, backoff_factor)
 
-    def get_soup(self, url):
+    def create_session(self, max_retries, backoff_factor):
+        # Session partagée entre les threads : pool de connexions dimensionné sur le parallélisme,
+        # nouvelles tentatives avec attente exponentielle sur les erreurs transitoires
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.max_workers, 1), max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_response(self, url):
         try:
+            self.rate_limiter.wait(url)
             response = self.session.get(url, timeout=30)
             response.raise_for_status()
-            return BeautifulSoup(response.text, "html.parser")
+            count("download", bytes_read=len(response.content))
+            return response
         except Exception as e:
             logger.error(f"Erreur requête {url}: {e}")
             return None
 
+    def get_soup(self, url):
+        # DOM complet : uniquement pour lire les sélecteurs de la première page
+        response = self.get_response(url)
+        return BeautifulSoup(response.text, "html.parser") if response is not None else None
+
     def fetch_options(self, soup, selector_id):
         select = soup.find(id=selector_id) if soup else None
         if not select:
@@ -35,110 +114,213 @@ class PollenDataScraper:
         options = [(opt['value'], opt.get_text(strip=True)) for opt in select.find_all('option') if opt.get('value')]
         return pd.DataFrame(options, columns=['Valeur', 'Nom'])
 
-    def fetch_pollen_data(self):
+    def scrape_page(self, city_row, pollen_row, today, high_water=None, with_previous_year=True):
+        # high_water : dernière date déjà ingérée pour cette série (seules les dates postérieures sont émises)
+        # with_previous_year : l'année précédente n'est lue qu'une fois par saison
+        logger.info(f"Scraping {city_row['Nom']} - {pollen_row['Nom']}")
+        url = f"{self.base_url}/les-risques/risques-par-ville/{city_row['Valeur']}/{pollen_row['Valeur']}"
+        response = self.get_response(url)
+        if response is None:
+            return []
+
+        var_names = GRAPH_DATA_VARS if with_previous_year else ["graphData"]
+        # Analyse exécutée dans les threads de téléchargement : temps CPU seul, la durée murale est celle de download
+        with thread_stage("parse"):
+            script_data = extract_graph_data(response.content, var_names)
+        high_water = datetime.strptime(high_water, '%Y-%m-%d').date() if high_water else None
+
+        current_city_data = []
+        for var_name in var_names:
+            previous_year = var_name == "previousYearGraphData"
+            for entry in script_data.get(var_name, []):
+                date_key = 'realDate' if previous_year else 'date'
+                entry_date = datetime.fromtimestamp(entry[date_key]/1000).date()
+                if entry_date > today:
+                    continue
+                if not previous_year and high_water is not None and entry_date <= high_water:
+                    continue
+                current_city_data.append({
+                    'Ville': city_row['Nom'],
+                    'Pollen': pollen_row['Nom'],
+                    'date': entry_date.strftime('%Y-%m-%d'),
+                    'level': entry.get('level'),
+                    'RealLevelValue': entry.get('realLevelValue'),
+                    'previous_year': previous_year,  # Champ temporaire : la série de l'année précédente échappe au filtre high_water
+                    '_date_for_sort': entry_date  # Champ temporaire pour le tri
+                })
+        
+        # Tri des données pour cette ville/pollen par date décroissante
+        current_city_data.sort(key=lambda x: x['_date_for_sort'], reverse=True)
+        # Suppression du champ temporaire avant d'ajouter à all_data
+        for item in current_city_data:
+            del item['_date_for_sort']
+        return current_city_data
+
+    def fetch_pollen_data(self, concurrent=True, manifest=None):
+        # manifest : état de l'historique (dernière date par série, saisons déjà ingérées pour l'année précédente)
         logger.info("🚀 Début du scraping...")
         today = datetime.today().date()
         all_data = []
+        high_water = manifest.get("high_water", {}) if manifest else {}
+        seasons = manifest.get("previous_year", {}) if manifest else {}
 
-        soup = self.get_soup("https://www.pollens.fr/les-risques/risques-par-ville/1/54/2025")
+        soup = self.get_soup(f"{self.base_url}/les-risques/risques-par-ville/1/54/2025")
         if not soup:
             return pd.DataFrame()
 
         city_df = self.fetch_options(soup, "citySelector")
         pollen_df = self.fetch_options(soup, "pollenSelector").iloc[1:]
-
+        pages = []
         for _, city_row in city_df.iterrows():
             for _, pollen_row in pollen_df.iterrows():
-                logger.info(f"Scraping {city_row['Nom']} - {pollen_row['Nom']}")
-                url = f"https://www.pollens.fr/les-risques/risques-par-ville/{city_row['Valeur']}/{pollen_row['Valeur']}"
-                soup = self.get_soup(url)
-                if not soup:
-                    continue
+                series = f"{city_row['Nom']}|{pollen_row['Nom']}"
+                pages.append((city_row, pollen_row, today, high_water.get(series), seasons.get(series) != today.year))
 
-                script_data = {}
-                for var_name in ["graphData", "previousYearGraphData"]:
-                    script = soup.find('script', string=re.compile(fr'var {var_name} ='))
-                    if script:
-                        match = re.search(fr'var {var_name}\s*=\s*(\[.*?\])', script.string, re.DOTALL)
-                        if match:
-                            try:
-                                script_data[var_name] = json.loads(match.group(1))
-                            except json.JSONDecodeError as e:
-                                logger.error(f"Erreur JSON {var_name}: {e}")
-
-                current_city_data = []
-                for var_name in ["graphData", "previousYearGraphData"]:
-                    for entry in script_data.get(var_name, []):
-                        date_key = 'realDate' if var_name == "previousYearGraphData" else 'date'
-                        entry_date = datetime.fromtimestamp(entry[date_key]/1000).date()
-                        if entry_date <= today:
-                            current_city_data.append({
-                                'Ville': city_row['Nom'],
-                                'Pollen': pollen_row['Nom'],
-                                'date': entry_date.strftime('%Y-%m-%d'),
-                                'level': entry.get('level'),
-                                'RealLevelValue': entry.get('realLevelValue'),
-                                '_date_for_sort': entry_date  # Champ temporaire pour le tri
-                            })
-                
-                # Tri des données pour cette ville/pollen par date décroissante
-                current_city_data.sort(key=lambda x: x['_date_for_sort'], reverse=True)
-                # Suppression du champ temporaire avant d'ajouter à all_data
-                for item in current_city_data:
-                    del item['_date_for_sort']
-                all_data.extend(current_city_data)
+        with stage("download") as st:
+            if concurrent and self.max_workers > 1:
+                # Téléchargements parallèles bornés par max_workers, résultats conservés dans l'ordre des pages
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    results = executor.map(lambda page: self.scrape_page(*page), pages)
+                    for page_data in results:
+                        all_data.extend(page_data)
+            else:
+                for page in pages:
+                    all_data.extend(self.scrape_page(*page))
+            st.rows_out += len(all_data)
 
+        logger.info(f"{len(pages)} pages scrapées, {len(all_data)} lignes")
         return pd.DataFrame(all_data)
 
     def download_existing_data(self):
         try:
             self.s3.download_file(self.bucket_name, self.s3_key, self.temp_csv_path)
             existing_df = pd.read_csv(self.temp_csv_path)
-            # Conversion de la colonne Date en datetime pour le tri
-            existing_df['date'] = pd.to_datetime(existing_df['Date'])
+            # Conversion de la colonne date en datetime pour le tri
+            existing_df['date'] = pd.to_datetime(existing_df['date'])
             return existing_df
         except Exception as e:
             logger.warning(f"Aucun fichier existant: {e}")
             return pd.DataFrame()
+        finally:
+            if os.path.exists(self.temp_csv_path):
+                os.remove(self.temp_csv_path)
 
-    def update_and_upload(self, new_df):
-        existing_df = self.download_existing_data()
-        
-        # Conversion de la colonne Date en datetime pour le nouveau DataFrame
+    def download_manifest(self):
+        # Manifeste : partitions, nombre de lignes et dernière date ingérée par (Ville, Pollen)
+        os.makedirs(self.local_root, exist_ok=True)
+        try:
+            self.s3.download_file(self.bucket_name, f"{self.s3_prefix}/{MANIFEST}", os.path.join(self.local_root, MANIFEST))
+        except Exception as e:
+            logger.warning(f"Aucun manifeste existant: {e}")
+            return None
+        manifest = load_manifest(self.local_root)
+        manifest.setdefault("high_water", {})
+        manifest.setdefault("previous_year", {})
+        return manifest
+
+    def download_partition(self, manifest, key):
+        if key not in manifest["partitions"]:
+            return pd.DataFrame()
+        path = partition_path(self.local_root, key)
+        self.s3.download_file(self.bucket_name, f"{self.s3_prefix}/{key}.csv", path)
+        df = pd.read_csv(path)
+        df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    @staticmethod
+    def series_key(df):
+        return df['Ville'] + '|' + df['Pollen']
+
+    def filter_new_rows(self, df, manifest):
+        # Ne conserve que les dates postérieures à la dernière date ingérée de chaque série,
+        # sauf pour la série de l'année précédente, antérieure par nature
+        high_water = pd.to_datetime(self.series_key(df).map(manifest["high_water"]))
+        return df[high_water.isna() | (df['date'] > high_water) | df['previous_year']]
+
+    def upsert_partitions(self, new_df, manifest):
+        # Séries dont l'année précédente est ingérée par cette exécution
+        seasons = self.series_key(new_df[new_df['previous_year']]).unique()
+        new_df = new_df.drop(columns='previous_year')
+
+        # Seules les partitions (mois) contenant de nouvelles dates sont relues et réécrites
+        for key, part_df in new_df.groupby(partition_keys(new_df['date'])):
+            path = partition_path(self.local_root, key)
+            with stage("merge", rows_in=len(part_df)) as st:
+                existing_df = self.download_partition(manifest, key)
+                if not existing_df.empty:
+                    st.read(path)
+                combined_df = pd.concat([existing_df, part_df], ignore_index=True)
+                st.rows_out += len(combined_df)
+
+            # Suppression des doublons en gardant l'entrée la plus récente
+            with stage("dedupe", rows_in=len(combined_df)) as st:
+                combined_df = combined_df.drop_duplicates(subset=['Ville', 'Pollen', 'date'], keep='last')
+                st.rows_out += len(combined_df)
+            # Tri par ville, pollen et date (du plus récent au plus ancien)
+            with stage("sort", rows_in=len(combined_df), rows_out=len(combined_df)):
+                combined_df = combined_df.sort_values(
+                    by=['Ville', 'Pollen', 'date'],
+                    ascending=[True, True, False]
+                )
+            register_partition(manifest, key, combined_df, 'date')
+
+            with stage("write", rows_in=len(combined_df)) as st:
+                combined_df.assign(date=combined_df['date'].dt.strftime('%Y-%m-%d')).to_csv(path, index=False)
+                st.wrote(path)
+            with stage("upload") as st:
+                self.s3.upload_file(path, self.bucket_name, f"{self.s3_prefix}/{key}.csv")
+                st.wrote(path)
+            logger.info(f"✅ Partition {key} mise à jour ({len(part_df)} nouvelles lignes)")
+
+        # Dernière date ingérée par série
+        latest = new_df.groupby(self.series_key(new_df))['date'].max().dt.strftime('%Y-%m-%d')
+        for series, last_date in latest.items():
+            manifest["high_water"][series] = max(manifest["high_water"].get(series, last_date), last_date)
+        # Saison pour laquelle l'année précédente est ingérée (elle n'est plus relue avant la saison suivante)
+        for series in seasons:
+            manifest["previous_year"][series] = datetime.today().year
+
+        # Le manifeste est publié en dernier, une fois toutes les partitions à jour
+        save_manifest(self.local_root, manifest)
+        self.s3.upload_file(os.path.join(self.local_root, MANIFEST), self.bucket_name, f"{self.s3_prefix}/{MANIFEST}")
+
+    def update_and_upload(self, new_df, manifest=None):
+        if manifest is None:
+            manifest = self.download_manifest()
+        if manifest is None:
+            # Première exécution : l'ancien fichier unique sert de point de départ
+            manifest = {"partitions": {}, "high_water": {}, "previous_year": {}}
+            existing_df = self.download_existing_data()
+            if not existing_df.empty:
+                logger.info(f"Migration de {self.s3_key} vers {self.s3_prefix}/")
+                new_df = pd.concat([existing_df, new_df], ignore_index=True)
+
+        # Conversion de la colonne date en datetime pour le nouveau DataFrame
         new_df['date'] = pd.to_datetime(new_df['date'])
-        
-        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        
-        # Suppression des doublons en gardant l'entrée la plus récente
-        combined_df = combined_df.drop_duplicates(
-            subset=['Ville', 'Pollen', 'date'], 
-            keep='last'
-        )
-        
-        # Tri final par ville, pollen et date (du plus récent au plus ancien)
-        combined_df = combined_df.sort_values(
-            by=['Ville', 'Pollen', 'date'],
-            ascending=[True, True, False]
-        )
-        
-        # Reconversion de la date en format string pour la sauvegarde
-        combined_df['date'] = combined_df['date'].dt.strftime('%Y-%m-%d')
-        
-        combined_df.to_csv(self.temp_csv_path, index=False)
-        
+        if 'previous_year' not in new_df.columns:
+            new_df['previous_year'] = False
+        new_df['previous_year'] = new_df['previous_year'].fillna(False).astype(bool)
+        with stage("filter", rows_in=len(new_df)) as st:
+            new_df = self.filter_new_rows(new_df, manifest)
+            st.rows_out += len(new_df)
+        if new_df.empty:
+            logger.info("Aucune nouvelle date à ingérer.")
+            return
+
         try:
-            self.s3.upload_file(self.temp_csv_path, self.bucket_name, self.s3_key)
-            logger.info(f"✅ Fichier {self.s3_key} mis à jour sur S3")
+            self.upsert_partitions(new_df, manifest)
+            logger.info(f"✅ {len(new_df)} lignes ajoutées à {self.s3_prefix}/ sur S3")
         except Exception as e:
             logger.error(f"❌ Erreur upload: {e}")
-        finally:
-            if os.path.exists(self.temp_csv_path):
-                os.remove(self.temp_csv_path)
+            # Remontée jusqu'au rapport d'exécution, consigné en échec
+            raise
 
     def run(self):
-        new_data = self.fetch_pollen_data()
+        # Le manifeste est lu avant le scraping : seules les dates postérieures à l'historique sont émises
+        manifest = self.download_manifest()
+        new_data = self.fetch_pollen_data(manifest=manifest)
         if not new_data.empty:
-            self.update_and_upload(new_data)
+            self.update_and_upload(new_data, manifest)
         else:
             logger.warning("Aucune nouvelle donnée scrapée.")
 
@@ -147,4 +329,11 @@ if __name__ == "__main__":
         bucket_name="bucket-asthme-scraping",
         s3_key="pollen.csv"
     )
-    scraper.run()
\ No newline at end of file
+    # Durée, volumes et mémoire de chaque étape consignés dans un rapport d'exécution (voir instrumentation.py)
+    start_report("pollen")
+    status = "failed"
+    try:
+        scraper.run()
+        status = "success"
+    finally:
+        finish_report(status)
\ No newline at end of file
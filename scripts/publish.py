@@ -0,0 +1,76 @@
+## Library ##
+import json
+import os
+from datetime import datetime, timezone
+
+## Setting ##
+
+# Publication versionnée : chaque exécution envoie ses fichiers sous <prefix>/runs/<version>/,
+# puis le pointeur <prefix>/current.json est remplacé en dernier (une seule écriture, atomique sur S3).
+# Le pointeur associe chaque fichier logique (ex. geodair_max_daily/manifest.json) à sa clé versionnée :
+# les fichiers non modifiés par une exécution restent servis par leur version précédente.
+CURRENT = "current.json"
+
+## Function ##
+
+def new_version():
+    """
+    Identifiant d'une nouvelle version (horodatage UTC, ordonné chronologiquement)
+    """
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+def load_current(s3, bucket_name, prefix):
+    """
+    Charge le pointeur de la version courante
+
+    Entrée
+        s3 (client de stockage) voir storage.storage_client
+        bucket_name (str) nom du bucket
+        prefix (str) préfixe du jeu de données publié
+
+    Sortie
+        current (dict) version courante ("version") et clé versionnée de chaque fichier ("files")
+    """
+    try:
+        obj = s3.get_object(Bucket=bucket_name, Key=f"{prefix}/{CURRENT}")
+    except s3.exceptions.NoSuchKey:
+        return {"version": None, "files": {}}
+    return json.loads(obj["Body"].read())
+
+def publish_version(s3, bucket_name, files, prefix, version=None):
+    """
+    Publie des fichiers locaux dans une nouvelle version puis bascule le pointeur de version courante
+    - Un lecteur voit soit l'ancienne version complète, soit la nouvelle : jamais un mélange des deux
+    - Les clés versionnées ne sont jamais réécrites et peuvent être mises en cache sans limite
+
+    Entrée
+        s3 (client de stockage) voir storage.storage_client
+        bucket_name (str) nom du bucket
+        files (list) chemins locaux des fichiers à publier, qui sont aussi leurs noms logiques
+        prefix (str) préfixe du jeu de données publié
+        version (str, optionnel) identifiant de la version (par défaut, horodatage UTC)
+
+    Sortie
+        current (dict) nouveau pointeur de version courante
+    """
+    version = version or new_version()
+    current = load_current(s3, bucket_name, prefix)
+    uploaded = {}
+    for local_file in dict.fromkeys(files):
+        if not os.path.exists(local_file):
+            print(f"❌ Erreur : Le fichier {local_file} n'existe pas. Il n'est pas publié.")
+            continue
+        key = f"{prefix}/runs/{version}/{local_file}"
+        s3.upload_file(local_file, bucket_name, key)
+        uploaded[local_file] = key
+
+    current = {
+        "version": version,
+        "previous": current.get("version"),
+        "published_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "files": {**current.get("files", {}), **uploaded},
+    }
+    # Bascule : le pointeur est écrit en dernier, une fois tous les fichiers de la version envoyés
+    s3.put_object(Bucket=bucket_name, Key=f"{prefix}/{CURRENT}", Body=json.dumps(current, indent=2, ensure_ascii=False))
+    print(f"✅ Version {version} publiée sous {prefix}/ ({len(uploaded)} fichiers)")
+    return current
@@ -0,0 +1,79 @@
+## Library ##
+import os
+import shutil
+from datetime import datetime, timezone
+from io import BytesIO
+
+## Setting ##
+
+# Stockage des données : "s3" (par défaut) ou "fs:<dossier>" pour travailler en local,
+# chaque bucket étant alors un sous-dossier de <dossier> (ex. ASTHME_STORAGE=fs:/tmp/asthme)
+# Module partagé par les scripts (import storage) et le dashboard (import scripts.storage, lecture seule :
+# get_object, download_file et exceptions.NoSuchKey)
+STORAGE = os.environ.get("ASTHME_STORAGE", "s3")
+
+## Function ##
+
+class NoSuchKey(FileNotFoundError):
+    pass
+
+
+class LocalStorageClient:
+    """
+    Client de stockage sur le système de fichiers exposant le sous-ensemble de l'API boto3 S3 utilisé par les scripts
+    et le dashboard (upload_file, download_file, get_object, put_object et exceptions.NoSuchKey)
+    """
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def upload_file(self, Filename, Bucket, Key):
+        path = self.path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Copie atomique : un lecteur ne voit jamais un fichier partiellement écrit
+        shutil.copyfile(Filename, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def download_file(self, Bucket, Key, Filename):
+        path = self.path(Bucket, Key)
+        if not os.path.exists(path):
+            raise NoSuchKey(f"{Bucket}/{Key}")
+        shutil.copyfile(path, Filename)
+
+    def get_object(self, Bucket, Key):
+        path = self.path(Bucket, Key)
+        if not os.path.exists(path):
+            raise NoSuchKey(f"{Bucket}/{Key}")
+        with open(path, "rb") as file:
+            body = file.read()
+        return {"Body": BytesIO(body), "LastModified": datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)}
+
+    def put_object(self, Bucket, Key, Body):
+        path = self.path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as file:
+            file.write(Body.encode("utf-8") if isinstance(Body, str) else Body)
+        os.replace(path + ".tmp", path)
+
+
+def storage_client(storage=None):
+    """
+    Client du stockage configuré (ASTHME_STORAGE)
+
+    Entrée
+        storage (str, optionnel) "s3" ou "fs:<dossier>" (par défaut, la variable d'environnement ASTHME_STORAGE)
+
+    Sortie
+        client boto3 S3, ou LocalStorageClient pour un stockage sur le système de fichiers
+    """
+    storage = storage or STORAGE
+    if storage.startswith("fs:"):
+        return LocalStorageClient(storage[len("fs:"):])
+    import boto3  # import différé : inutile avec un stockage local (boto3 et botocore alourdissent le démarrage du dashboard)
+
+    return boto3.client('s3')